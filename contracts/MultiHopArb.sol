@@ -0,0 +1,149 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity >=0.8.0;
+
+import "./uniswap/interfaces/IERC20.sol";
+import "./uniswap/interfaces/IUniswapV2Pair.sol";
+import "./uniswap/interfaces/IUniswapV3Pool.sol";
+import "./uniswap/interfaces/IQuoterV2.sol";
+
+contract MultiHopArb {
+  address public owner;
+  address public quoter;
+  address private activePool;
+
+  uint160 internal constant MIN_SQRT_RATIO = 4295128739;
+  uint160 internal constant MAX_SQRT_RATIO = 1461446703485210103287273052203988823809029588342;
+
+  struct Leg {
+    address pool;
+    bool isV3;
+    bool zeroForOne;
+  }
+
+  constructor(address _quoter) {
+    owner = msg.sender;
+    quoter = _quoter;
+  }
+
+  modifier onlyOwner() {
+    require(msg.sender == owner, 'e20');
+    _;
+  }
+
+  function tokenIn(Leg memory _leg) internal view returns (address) {
+    return _leg.zeroForOne ? IUniswapV2Pair(_leg.pool).token0() : IUniswapV2Pair(_leg.pool).token1();
+  }
+
+  function tokenOut(Leg memory _leg) internal view returns (address) {
+    return _leg.zeroForOne ? IUniswapV2Pair(_leg.pool).token1() : IUniswapV2Pair(_leg.pool).token0();
+  }
+
+  function getAmountOut(uint _amountIn, uint _reserveIn, uint _reserveOut) internal pure returns (uint) {
+    uint amountInWithFee = _amountIn * 997;
+    return amountInWithFee * _reserveOut / (_reserveIn * 1000 + amountInWithFee);
+  }
+
+  function getV2AmountOut(Leg memory _leg, uint _amountIn) internal view returns (uint) {
+    (uint112 reserve0, uint112 reserve1, ) = IUniswapV2Pair(_leg.pool).getReserves();
+    return _leg.zeroForOne
+      ? getAmountOut(_amountIn, reserve0, reserve1)
+      : getAmountOut(_amountIn, reserve1, reserve0);
+  }
+
+  function quoteLeg(Leg memory _leg, uint _amountIn) internal returns (uint) {
+    if (!_leg.isV3) {
+      return getV2AmountOut(_leg, _amountIn);
+    }
+    (uint amountOut, , , ) = IQuoterV2(quoter).quoteExactInputSingle(
+      IQuoterV2.QuoteExactInputSingleParams(
+        tokenIn(_leg),
+        tokenOut(_leg),
+        _amountIn,
+        IUniswapV3Pool(_leg.pool).fee(),
+        0
+      )
+    );
+    return amountOut;
+  }
+
+  // check and checkMany are not view functions, as the v3 quoter reverts
+  // internally. They are only meant for eth_call and change no state.
+  function check(Leg[] memory _legs, uint _amountIn) public returns (int profit, uint amountOut) {
+    require(_legs.length >= 2 && _legs.length <= 3, 'e21');
+    amountOut = _amountIn;
+    for (uint i = 0; i < _legs.length; i++) {
+      amountOut = quoteLeg(_legs[i], amountOut);
+    }
+    profit = int(amountOut) - int(_amountIn);
+  }
+
+  function checkMany(Leg[][] memory _routes, uint[] memory _amountIns) external returns (int[] memory profits) {
+    require(_routes.length == _amountIns.length, 'e24');
+    profits = new int[](_routes.length);
+    for (uint i = 0; i < _routes.length; i++) {
+      try this.check(_routes[i], _amountIns[i]) returns (int profit, uint) {
+        profits[i] = profit;
+      } catch {
+        profits[i] = type(int).min;
+      }
+    }
+  }
+
+  // Trades the contract's own balance: it has to hold at least _amountIn of
+  // the start token, the input token of the first leg. The owner funds it
+  // with a transfer and takes the profit back with withdraw.
+  function execute(Leg[] memory _legs, uint _amountIn, uint _minProfit) external onlyOwner {
+    require(_legs.length >= 2 && _legs.length <= 3, 'e21');
+    IERC20 startToken = IERC20(tokenIn(_legs[0]));
+    uint balanceBefore = startToken.balanceOf(address(this));
+
+    uint amount = _amountIn;
+    bool prepaid = false;
+    for (uint i = 0; i < _legs.length; i++) {
+      // v2 pairs are paid up front, so the previous leg can pay them directly.
+      address recipient = (i + 1 < _legs.length && !_legs[i + 1].isV3) ? _legs[i + 1].pool : address(this);
+      amount = _legs[i].isV3
+        ? swapV3(_legs[i], amount, recipient)
+        : swapV2(_legs[i], amount, recipient, prepaid);
+      prepaid = recipient != address(this);
+    }
+
+    require(startToken.balanceOf(address(this)) >= balanceBefore + _minProfit, 'e22');
+  }
+
+  function swapV2(Leg memory _leg, uint _amountIn, address _recipient, bool _prepaid) internal returns (uint amountOut) {
+    if (!_prepaid) {
+      IERC20(tokenIn(_leg)).transfer(_leg.pool, _amountIn);
+    }
+    amountOut = getV2AmountOut(_leg, _amountIn);
+    IUniswapV2Pair(_leg.pool).swap(
+      _leg.zeroForOne ? 0 : amountOut,
+      _leg.zeroForOne ? amountOut : 0,
+      _recipient,
+      new bytes(0)
+    );
+  }
+
+  function swapV3(Leg memory _leg, uint _amountIn, address _recipient) internal returns (uint) {
+    activePool = _leg.pool;
+    (int256 amount0, int256 amount1) = IUniswapV3Pool(_leg.pool).swap(
+      _recipient,
+      _leg.zeroForOne,
+      int256(_amountIn),
+      _leg.zeroForOne ? MIN_SQRT_RATIO + 1 : MAX_SQRT_RATIO - 1,
+      abi.encode(tokenIn(_leg))
+    );
+    activePool = address(0);
+    return uint256(-(_leg.zeroForOne ? amount1 : amount0));
+  }
+
+  function uniswapV3SwapCallback(int256 _amount0Delta, int256 _amount1Delta, bytes calldata _data) external {
+    require(msg.sender == activePool, 'e23');
+    address token = abi.decode(_data, (address));
+    IERC20(token).transfer(msg.sender, uint256(_amount0Delta > 0 ? _amount0Delta : _amount1Delta));
+  }
+
+  function withdraw(address _token, uint _amount) external onlyOwner {
+    IERC20(_token).transfer(owner, _amount);
+  }
+}
@@ -0,0 +1,40 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity >=0.8.0;
+
+// Mintable token for development chain tests.
+contract MockERC20 {
+  string public name;
+  string public symbol;
+  uint8 public constant decimals = 18;
+  uint public totalSupply;
+  mapping(address => uint) public balanceOf;
+  mapping(address => mapping(address => uint)) public allowance;
+
+  constructor(string memory _name, string memory _symbol) {
+    name = _name;
+    symbol = _symbol;
+  }
+
+  function mint(address _to, uint _amount) external {
+    balanceOf[_to] += _amount;
+    totalSupply += _amount;
+  }
+
+  function approve(address _spender, uint _amount) external returns (bool) {
+    allowance[msg.sender][_spender] = _amount;
+    return true;
+  }
+
+  function transfer(address _to, uint _amount) external returns (bool) {
+    balanceOf[msg.sender] -= _amount;
+    balanceOf[_to] += _amount;
+    return true;
+  }
+
+  function transferFrom(address _from, address _to, uint _amount) external returns (bool) {
+    allowance[_from][msg.sender] -= _amount;
+    balanceOf[_from] -= _amount;
+    balanceOf[_to] += _amount;
+    return true;
+  }
+}
@@ -0,0 +1,22 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity >=0.8.0;
+
+import "./MockUniswapV2Pair.sol";
+
+contract MockUniswapV2Factory {
+  mapping(address => mapping(address => address)) public getPair;
+  address[] public allPairs;
+
+  function allPairsLength() external view returns (uint) {
+    return allPairs.length;
+  }
+
+  function createPair(address _tokenA, address _tokenB) external returns (address pair) {
+    require(getPair[_tokenA][_tokenB] == address(0), 'pair exists');
+    (address token0, address token1) = _tokenA < _tokenB ? (_tokenA, _tokenB) : (_tokenB, _tokenA);
+    pair = address(new MockUniswapV2Pair(token0, token1));
+    getPair[token0][token1] = pair;
+    getPair[token1][token0] = pair;
+    allPairs.push(pair);
+  }
+}
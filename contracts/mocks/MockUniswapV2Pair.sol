@@ -0,0 +1,54 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity >=0.8.0;
+
+import "../uniswap/interfaces/IERC20.sol";
+
+interface IUniswapV2Callee {
+  function uniswapV2Call(address _sender, uint _amount0, uint _amount1, bytes calldata _data) external;
+}
+
+// UniswapV2 pair without liquidity tokens: reserves are whatever was sent
+// before sync, swaps keep the 0.3% fee constant product check and flash
+// swap through uniswapV2Call.
+contract MockUniswapV2Pair {
+  address public factory;
+  address public token0;
+  address public token1;
+  uint112 private reserve0;
+  uint112 private reserve1;
+
+  event Sync(uint112 reserve0, uint112 reserve1);
+
+  constructor(address _token0, address _token1) {
+    factory = msg.sender;
+    token0 = _token0;
+    token1 = _token1;
+  }
+
+  function getReserves() public view returns (uint112, uint112, uint32) {
+    return (reserve0, reserve1, uint32(block.timestamp));
+  }
+
+  function sync() public {
+    reserve0 = uint112(IERC20(token0).balanceOf(address(this)));
+    reserve1 = uint112(IERC20(token1).balanceOf(address(this)));
+    emit Sync(reserve0, reserve1);
+  }
+
+  function swap(uint _amount0Out, uint _amount1Out, address _to, bytes calldata _data) external {
+    require(_amount0Out > 0 || _amount1Out > 0, 'insufficient output');
+    require(_amount0Out < reserve0 && _amount1Out < reserve1, 'insufficient liquidity');
+    if (_amount0Out > 0) IERC20(token0).transfer(_to, _amount0Out);
+    if (_amount1Out > 0) IERC20(token1).transfer(_to, _amount1Out);
+    if (_data.length > 0) IUniswapV2Callee(_to).uniswapV2Call(msg.sender, _amount0Out, _amount1Out, _data);
+
+    uint balance0 = IERC20(token0).balanceOf(address(this));
+    uint balance1 = IERC20(token1).balanceOf(address(this));
+    uint amount0In = balance0 > reserve0 - _amount0Out ? balance0 - (reserve0 - _amount0Out) : 0;
+    uint amount1In = balance1 > reserve1 - _amount1Out ? balance1 - (reserve1 - _amount1Out) : 0;
+    require(amount0In > 0 || amount1In > 0, 'insufficient input');
+    require((balance0 * 1000 - amount0In * 3) * (balance1 * 1000 - amount1In * 3)
+            >= uint(reserve0) * reserve1 * 1000**2, 'K');
+    sync();
+  }
+}
@@ -0,0 +1,56 @@
+// SPDX-License-Identifier: UNLICENSED
+pragma solidity >=0.8.0;
+
+import "../uniswap/interfaces/IERC20.sol";
+import "./MockUniswapV2Factory.sol";
+
+// The router calls the arbitrage contracts use, for single hop paths.
+contract MockUniswapV2Router {
+  address public factory;
+
+  constructor(address _factory) {
+    factory = _factory;
+  }
+
+  function getReserves(address _tokenIn, address _tokenOut) internal view returns (address pair, uint reserveIn, uint reserveOut) {
+    pair = MockUniswapV2Factory(factory).getPair(_tokenIn, _tokenOut);
+    require(pair != address(0), 'no pair');
+    (uint reserve0, uint reserve1, ) = MockUniswapV2Pair(pair).getReserves();
+    (reserveIn, reserveOut) = _tokenIn == MockUniswapV2Pair(pair).token0() ? (reserve0, reserve1) : (reserve1, reserve0);
+  }
+
+  function getAmountOut(uint _amountIn, uint _reserveIn, uint _reserveOut) public pure returns (uint) {
+    uint amountInWithFee = _amountIn * 997;
+    return amountInWithFee * _reserveOut / (_reserveIn * 1000 + amountInWithFee);
+  }
+
+  function getAmountIn(uint _amountOut, uint _reserveIn, uint _reserveOut) public pure returns (uint) {
+    return _reserveIn * _amountOut * 1000 / ((_reserveOut - _amountOut) * 997) + 1;
+  }
+
+  function getAmountsOut(uint _amountIn, address[] memory _path) public view returns (uint[] memory amounts) {
+    require(_path.length == 2, 'single hop only');
+    (, uint reserveIn, uint reserveOut) = getReserves(_path[0], _path[1]);
+    amounts = new uint[](2);
+    amounts[0] = _amountIn;
+    amounts[1] = getAmountOut(_amountIn, reserveIn, reserveOut);
+  }
+
+  function getAmountsIn(uint _amountOut, address[] memory _path) public view returns (uint[] memory amounts) {
+    require(_path.length == 2, 'single hop only');
+    (, uint reserveIn, uint reserveOut) = getReserves(_path[0], _path[1]);
+    amounts = new uint[](2);
+    amounts[0] = getAmountIn(_amountOut, reserveIn, reserveOut);
+    amounts[1] = _amountOut;
+  }
+
+  function swapExactTokensForTokens(uint _amountIn, uint _amountOutMin, address[] calldata _path, address _to, uint _deadline) external returns (uint[] memory amounts) {
+    require(_deadline >= block.timestamp, 'expired');
+    amounts = getAmountsOut(_amountIn, _path);
+    require(amounts[1] >= _amountOutMin, 'insufficient output');
+    (address pair, , ) = getReserves(_path[0], _path[1]);
+    IERC20(_path[0]).transferFrom(msg.sender, pair, _amountIn);
+    bool zeroForOne = _path[0] == MockUniswapV2Pair(pair).token0();
+    MockUniswapV2Pair(pair).swap(zeroForOne ? 0 : amounts[1], zeroForOne ? amounts[1] : 0, _to, new bytes(0));
+  }
+}
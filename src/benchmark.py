@@ -0,0 +1,272 @@
+import argparse
+import asyncio
+import contextlib
+import io
+import json
+import math
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+import run
+from models.data import Data, create_namespace
+from models.market import Path
+from helpers.blocks import Head
+from helpers.paths import (generate_healthy_loop_names,
+                           generate_healthy_triangle_names,
+                           load_healthy_loops,
+                           load_healthy_triangles)
+from helpers.pruning import get_fee_multiplier, get_v3_virtual_reserves
+from helpers.scheduling import CycleScheduler
+from helpers.cycles import CycleRegistry
+
+# (token count, v2 dex count, v3 dex count, edge probability)
+MARKET_SIZES = [(10, 2, 1, 0.6),
+                (20, 3, 1, 0.4),
+                (40, 4, 2, 0.2),
+                (80, 5, 2, 0.1)]
+
+
+class SyntheticMarket:
+    """
+    A random token graph on fake dexes. Every token is worth one USD and
+    every pool is priced slightly off, so cycles exist at every size.
+    Reserves live here and are handed out as block states, v3 pools are quoted from
+    their virtual reserves instead of the quoter.
+    """
+
+    def __init__(self, token_count: int,
+                 v2_dex_count: int,
+                 v3_dex_count: int,
+                 edge_probability: float,
+                 seed: int = 0) -> None:
+        self.random = random.Random(seed)
+        self.token_names = ["T{}".format(i) for i in range(token_count)]
+        self.dex_names = ["dex{}v2".format(i) for i in range(v2_dex_count)] + \
+            ["dex{}v3".format(i) for i in range(v3_dex_count)]
+        self.edge_probability = edge_probability
+        self.pools = {}
+
+    def get_address_data(self) -> dict:
+        return {
+            "dex": {name: {} for name in self.dex_names},
+            "token": {name: {"address": "0x{:040x}".format(self.random.randrange(2**160)),
+                             "relative_price": 1,
+                             "decimals": 18}
+                      for name in self.token_names}
+        }
+
+    def get_path_names(self) -> list[str]:
+        """
+        Picks the pools and returns the names of both directions of each.
+        """
+        path_names = []
+        for dex_name in self.dex_names:
+            for i, token0 in enumerate(self.token_names):
+                for token1 in self.token_names[i + 1:]:
+                    if self.random.random() < self.edge_probability:
+                        self.pools[(dex_name, token0, token1)] = (0, 0)
+                        path_names.append("{} {} {}".format(dex_name, token0, token1))
+                        path_names.append("{} {} {}".format(dex_name, token1, token0))
+        return path_names
+
+    def move_prices(self, share: float = 1) -> None:
+        """
+        Redraws the depth and the mispricing of a share of the pools.
+        """
+        for key in self.pools:
+            if self.random.random() < share:
+                depth = 10**self.random.uniform(3, 7) * 10**18
+                skew = 1 + self.random.gauss(0, 0.005)
+                self.pools[key] = (depth, depth * skew)
+
+    def get_states(self) -> tuple[dict, dict]:
+        reserves = {}
+        v3_states = {}
+        for (dex_name, token0, token1), (r0, r1) in self.pools.items():
+            for path, (reserve_in, reserve_out) in [
+                    (Path.get_path_from_name(dex_name, token0, token1), (r0, r1)),
+                    (Path.get_path_from_name(dex_name, token1, token0), (r1, r0))]:
+                if not path.is_v3:
+                    reserves[path] = (int(reserve_in), int(reserve_out))
+                    continue
+                if not path.zero_for_one:
+                    reserve_in, reserve_out = reserve_out, reserve_in
+                v3_states[path] = (int(math.sqrt(reserve_out / reserve_in) * 2**96),
+                                   int(math.sqrt(reserve_in * reserve_out)))
+        return reserves, v3_states
+
+
+class SyntheticQuoter:
+    """
+    Stands in for the quoter as Data.v3_quoter, swaps on the virtual
+    reserves of the pool and counts the quotes.
+    """
+
+    def __init__(self) -> None:
+        self.count = 0
+
+    async def __call__(self, paths: list[Path],
+                       amounts: list[float],
+                       snapshot) -> list[float]:
+        self.count += len(paths)
+        quotes = []
+        for path, amount in zip(paths, amounts):
+            r1, r2 = get_v3_virtual_reserves(path, snapshot.v3_states[path])
+            local_amount = path.from_token.get_relative_price(amount) * \
+                get_fee_multiplier(path)
+            quotes.append(path.to_token.recover_original_price(
+                local_amount * r2 / (r1 + local_amount)))
+        return quotes
+
+
+def get_head(block_number: int) -> Head:
+    return Head(block_number, "0x{:064x}".format(block_number),
+                "0x{:064x}".format(block_number - 1))
+
+
+def measure(function, repeats: int) -> dict[str, float]:
+    """
+    Returns the best wall time of the repeats and the peak memory of one
+    extra traced run.
+    """
+    times = []
+    for _ in range(repeats):
+        start_time = time.perf_counter()
+        function()
+        times.append(time.perf_counter() - start_time)
+
+    tracemalloc.start()
+    function()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {"time": min(times), "peak_memory": peak}
+
+
+def reset_market(market: SyntheticMarket, assets_folder: str) -> int:
+    """
+    Points Data and the interned models at a fresh synthetic market and
+    writes its healthy files. Returns the number of paths.
+    """
+    Data.use(create_namespace(assets_folder=assets_folder))
+    Data.address_data = market.get_address_data()
+    Data.pricing_contracts = {name: None for name in market.dex_names}
+    Data.factories = {"F" + name: None for name in market.dex_names}
+    Data.rpc_pool = None
+    Data.v3_quoter = SyntheticQuoter()
+
+    path_names = market.get_path_names()
+    with open(Data.get_asset_path('healthy_paths'), 'w') as file:
+        file.write("\n".join(path_names))
+    generate_healthy_loop_names()
+    generate_healthy_triangle_names()
+
+    market.move_prices()
+    return len(path_names)
+
+
+def benchmark_market(size: tuple, blocks: int, repeats: int,
+                     aggregate: bool = False) -> dict:
+    market = SyntheticMarket(*size)
+    loop = asyncio.get_event_loop()
+    results = {}
+
+    async def next_block(head):
+        market.move_prices(0.1)
+        return market.get_states()
+
+    def run_block(block_number: int) -> None:
+        loop.run_until_complete(run._main(float("inf"), get_head(block_number),
+                                          fetch_states=next_block))
+
+    with tempfile.TemporaryDirectory() as assets_folder, \
+            contextlib.redirect_stdout(io.StringIO()):
+        path_count = reset_market(market, assets_folder)
+        results["load_healthy_loops"] = measure(load_healthy_loops, repeats)
+        results["load_healthy_triangles"] = measure(load_healthy_triangles, repeats)
+        Data.lines = load_healthy_loops()
+        Data.triangles = load_healthy_triangles()
+        results["cycle_registry"] = measure(
+            lambda: CycleRegistry(Data.lines, Data.triangles), repeats)
+        # Every cycle is searched each block, whatever the machine.
+        Data.scheduler = CycleScheduler(Data.lines, Data.triangles,
+                                        budget=float("inf"),
+                                        aggregate=aggregate)
+        results["block"] = measure(
+            lambda: [run_block(block_number) for block_number in range(blocks)],
+            repeats)
+        results["block"]["time"] /= blocks
+        Data.v3_quoter.count = 0
+        for block_number in range(blocks):
+            run_block(block_number)
+
+    results["quotes"] = Data.v3_quoter.count // blocks
+    results["paths"] = path_count
+    results["lines"] = sum(len(backward_paths) for backward_paths in Data.lines.values())
+    results["triangles"] = sum(len(right_paths) for ear_paths in Data.triangles.values()
+                               for right_paths in ear_paths.values())
+    results["cycles"] = len(Data.scheduler.cycles)
+    return results
+
+
+def find_regressions(results: dict, baseline: dict, tolerance: float) -> list[str]:
+    regressions = []
+    for size, stages in results.items():
+        for stage, metrics in stages.items():
+            if not isinstance(metrics, dict) or stage not in baseline.get(size, {}):
+                continue
+            for metric, value in metrics.items():
+                limit = baseline[size][stage][metric] * (1 + tolerance)
+                if value > limit:
+                    regressions.append("{} {} {}: {:.6g} > {:.6g}".format(
+                        size, stage, metric, value, limit))
+    return regressions
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(
+        description="Benchmarks the detection hot loop on synthetic markets.")
+    parser.add_argument("--blocks", type=int, default=3)
+    parser.add_argument("--repeats", type=int, default=3)
+    parser.add_argument("--sizes", type=int, default=len(MARKET_SIZES),
+                        help="number of market sizes to run, smallest first")
+    parser.add_argument("--save", help="writes the results to this json file")
+    parser.add_argument("--baseline", help="fails on a regression against this json file")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    parser.add_argument("--aggregate", action="store_true",
+                        help="searches token cycles over aggregated edges")
+    args = parser.parse_args()
+
+    results = {}
+    for size in MARKET_SIZES[:args.sizes]:
+        name = "{}x{}x{}@{}".format(*size)
+        results[name] = benchmark_market(size, args.blocks, args.repeats,
+                                         args.aggregate)
+        print("{}: {} paths, {} lines, {} triangles, {} distinct cycles, "
+              "{} v3 quotes per block".format(
+                  name, results[name]["paths"], results[name]["lines"],
+                  results[name]["triangles"], results[name]["cycles"],
+                  results[name]["quotes"]))
+        for stage, metrics in results[name].items():
+            if isinstance(metrics, dict):
+                print("    {:<24} {:>10.6f}s {:>10.1f} KiB".format(
+                    stage, metrics["time"], metrics["peak_memory"] / 1024))
+
+    if args.save:
+        with open(args.save, "w") as file:
+            json.dump(results, file, indent=4)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = find_regressions(results, json.load(file), args.tolerance)
+        for regression in regressions:
+            print("Regression: " + regression)
+        return int(bool(regressions))
+
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,101 @@
+import argparse
+import asyncio
+import json
+import os
+import threading
+import time
+from brownie import Contract, network
+from helpers.calls import (GET_RESERVES,
+                           aggregate_payload,
+                           encode_aggregate3)
+from helpers.simulation import SimulatedMarket, SimulatedNode
+
+
+def start_node(market: SimulatedMarket, port: int) -> tuple[SimulatedNode, asyncio.AbstractEventLoop]:
+    """
+    Serves the market from a thread, brownie's calls block the main one.
+    Blocks are only mined by hand.
+    """
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    node = SimulatedNode(market, block_time=3600)
+    asyncio.run_coroutine_threadsafe(node.start(port=port), loop).result()
+    return node, loop
+
+
+def load_pair_contracts(market: SimulatedMarket) -> list[Contract]:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    pair_abi = json.load(open(os.path.join(script_dir, 'helpers', 'assets',
+                                           'abi', 'pair.json')))
+    return [Contract.from_abi(pool.name, pool.address, pair_abi)
+            for pool in market.pools.values() if not pool.is_v3]
+
+
+def contract_round(contracts: list[Contract], block_number: int) -> list[tuple[int, int]]:
+    """
+    The brownie path: one eth_call per pair, encoded and decoded by
+    Contract.getReserves.call.
+    """
+    return [tuple(contract.getReserves.call(block_identifier=block_number)[:2])
+            for contract in contracts]
+
+
+def raw_round(loop: asyncio.AbstractEventLoop, payload: bytes, block_number: int,
+              reserve0: list[int], reserve1: list[int]) -> None:
+    """
+    The hot path: one multicall with the cached payload, results unpacked
+    from fixed offsets into preallocated lists.
+    """
+    results = loop.run_until_complete(aggregate_payload(payload, block_number))
+    for i, result in enumerate(results):
+        reserve0[i] = int.from_bytes(result[0:32], "big")
+        reserve1[i] = int.from_bytes(result[32:64], "big")
+
+
+def benchmark(token_count: int, port: int, rounds: int) -> None:
+    market = SimulatedMarket(token_count=token_count, edge_probability=0.5)
+    node, node_loop = start_node(market, port)
+    network.connect("simulated")
+    loop = asyncio.new_event_loop()
+    try:
+        contracts = load_pair_contracts(market)
+        block_number = market.head.number
+        payload = encode_aggregate3([(contract.address, GET_RESERVES)
+                                     for contract in contracts])
+        reserve0 = [0] * len(contracts)
+        reserve1 = [0] * len(contracts)
+
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            expected = contract_round(contracts, block_number)
+        contract_time = (time.perf_counter() - start_time) / rounds
+
+        start_time = time.perf_counter()
+        for _ in range(rounds):
+            raw_round(loop, payload, block_number, reserve0, reserve1)
+        raw_time = (time.perf_counter() - start_time) / rounds
+
+        assert expected == list(zip(reserve0, reserve1))
+        print("{} pairs: Contract.getReserves.call {:.4f}s, raw {:.4f}s, "
+              "speedup {:.1f}x".format(len(contracts), contract_time, raw_time,
+                                       contract_time / raw_time))
+    finally:
+        loop.close()
+        network.disconnect()
+        asyncio.run_coroutine_threadsafe(node.stop(), node_loop).result()
+        node_loop.call_soon_threadsafe(node_loop.stop)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Reads the reserves of every pair of a simulated market "
+        "through brownie's Contract calls and through the raw multicall "
+        "layer. Needs the brownie network of the README: "
+        "brownie networks add Ethereum simulated host=http://127.0.0.1:8545 "
+        "chainid=1337")
+    parser.add_argument("--tokens", type=int, nargs="+", default=[10, 20, 40])
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--rounds", type=int, default=3)
+    args = parser.parse_args()
+    for token_count in args.tokens:
+        benchmark(token_count, args.port, args.rounds)
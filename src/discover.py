@@ -0,0 +1,20 @@
+import argparse
+import asyncio
+from helpers.initialize import setup
+from helpers.discovery import scan_factories, select_token_universe
+
+
+async def _main(start_block: int = None):
+    await setup()
+    await scan_factories(start_block)
+    await select_token_universe()
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Scans the factories for pools and selects the token "
+        "universe. A factory is scanned from its cursor, its factory_block "
+        "in address_data.json or the start block.")
+    parser.add_argument("--start-block", type=int)
+    args = parser.parse_args()
+    loop = asyncio.get_event_loop()
+    loop.run_until_complete(_main(args.start_block))
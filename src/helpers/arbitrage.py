@@ -1,78 +1,208 @@
-import asyncio
-from collections import defaultdict
+import math
 from models.market import Path
-from helpers.price import (direct_prices,
-                           direct_indexed_prices,
-                           reverse_prices)
-from helpers.utility import (fill_missing_triangles,
-                             get_remaning_paths)
+from helpers.price import direct_list_prices
+from helpers.cycles import CycleRegistry
+from helpers.snapshot import MarketSnapshot
+from helpers.pruning import get_cycle_upper_bound
+from helpers.profiling import profiler
 
+GOLDEN_RATIO = (math.sqrt(5) - 1) / 2
+EXPANSION_STEP = 1
 
-async def calculate_arbitrage(lines: dict[Path, list[Path]],
-                              triangles: dict[Path, dict[Path, Path]],
-                              amount_in: float):
+
+async def price_trades(trades: list[tuple[Path, float]],
+                       snapshot: MarketSnapshot) -> list[float]:
+    """
+    Prices (path, amount) trades in one round, equal trades share a quote.
+    """
+    unique_trades = list(dict.fromkeys(trades))
+    prices = dict(zip(unique_trades, await direct_list_prices(
+        [path for path, _ in unique_trades],
+        [amount for _, amount in unique_trades], snapshot)))
+    return [prices[trade] for trade in trades]
+
+
+async def get_cycle_profits(cycles: list[tuple[Path, ...]],
+                            amount_ins: list[float],
+                            snapshot: MarketSnapshot) -> list[float]:
+    """
+    Returns the profit of trading each amount_in through its cycle, chaining
+    exact-input quotes leg by leg, one pricing round per leg for all the
+    cycles at once. Cycles sharing a prefix share its quotes.
+    -inf where a quote failed.
+    """
+    amount_outs = list(amount_ins)
+    for leg in range(max(map(len, cycles), default=0)):
+        indices = [i for i, cycle in enumerate(cycles)
+                   if leg < len(cycle) and amount_outs[i] > 0]
+        prices = await price_trades([(cycles[i][leg], amount_outs[i])
+                                     for i in indices], snapshot)
+        for i, amount_out in zip(indices, prices):
+            amount_outs[i] = amount_out
+    return [amount_out - amount_in if amount_out > 0 else float("-inf")
+            for amount_in, amount_out in zip(amount_ins, amount_outs)]
+
+
+class CycleSearch:
+    """
+    Searches the most profitable log(amount_in) of one cycle. The output of
+    a cycle is concave in its input for any mix of v2 and v3 legs, so its
+    profit is unimodal. The search steps up from min_amount_in until the
+    profit falls, then narrows the bracket around the best point with
+    golden-section steps.
+    A probe whose upper bound from the liquidity index can't beat the best
+    profit seen so far is settled without a quote.
+    """
+
+    def __init__(self, cycle: tuple[Path, ...],
+                 snapshot: MarketSnapshot,
+                 min_amount_in: float,
+                 max_amount_in: float,
+                 profit: float) -> None:
+        self.cycle = cycle
+        self.snapshot = snapshot
+        self.low = self.point = math.log(min_amount_in)
+        self.high = math.log(max_amount_in)
+        self.profit = profit
+        self.expanding = True
+        self.probe = None
+        self.probe_profit = None
+
+    @property
+    def best(self) -> tuple[float, float]:
+        return (math.exp(self.point), self.profit)
+
+    def get_bound(self, point: float) -> float:
+        """
+        Upper bound on the profit at a point.
+        """
+        amount_in = math.exp(point)
+        return get_cycle_upper_bound(list(self.cycle), amount_in,
+                                     self.snapshot) - amount_in
+
+    def set_probe_profit(self, profit: float) -> None:
+        self.probe_profit = profit
+
+    def update(self, profit_tolerance: float) -> bool:
+        """
+        Moves the bracket with the profit of the last probe.
+        Returns False once a golden-section probe is flat within
+        profit_tolerance. While expanding, a flat step only means the
+        profit grows slowly, the peak may still be further up.
+        """
+        probe, profit = self.probe, self.probe_profit
+        self.probe = self.probe_profit = None
+        flat = not self.expanding and abs(profit - self.profit) < profit_tolerance
+        if profit > self.profit:
+            if probe > self.point:
+                self.low = self.point
+            else:
+                self.high = self.point
+            self.point, self.profit = probe, profit
+            if self.expanding and self.point >= self.high:
+                self.expanding = False
+        else:
+            self.expanding = False
+            if probe > self.point:
+                self.high = probe
+            else:
+                self.low = probe
+        return not flat
+
+    def next_probe(self, size_tolerance: float,
+                   profit_tolerance: float) -> float:
+        """
+        Narrows the bracket as far as the known profits allow and returns
+        the point which needs a quote, None once the search is done.
+        """
+        while True:
+            if self.probe is not None:
+                if not self.update(profit_tolerance):
+                    return None
+            if self.expanding:
+                probe = min(self.point + EXPANSION_STEP, self.high)
+            elif self.high - self.low < size_tolerance:
+                return None
+            elif self.high - self.point > self.point - self.low:
+                probe = self.point + (1 - GOLDEN_RATIO) * (self.high - self.point)
+            else:
+                probe = self.point - (1 - GOLDEN_RATIO) * (self.point - self.low)
+            self.probe = probe
+            if self.get_bound(probe) >= self.profit:
+                return probe
+            self.probe_profit = float("-inf")
+
+
+async def search_cycles(cycles: list[tuple[Path, ...]],
+                        snapshot: MarketSnapshot,
+                        min_amount_in: float,
+                        max_amount_in: float,
+                        size_tolerance: float = 0.1,
+                        profit_tolerance: float = 0.01) -> dict[tuple, tuple[float, float]]:
+    """
+    Finds the most profitable amount_in of each cycle between the bounds,
+    see CycleSearch. Every round prices the pending probes of all cycles
+    together.
+    A cycle stops once its bracket is narrower than size_tolerance, in
+    log terms, or a step moves its profit by less than profit_tolerance USD.
+    Concavity also means that the profit per dollar only falls with size,
+    so cycles which lose at min_amount_in are dropped right away.
+    Returns (amount_in, profit) of the cycles profitable at min_amount_in.
+    """
+    cycles = [cycle for cycle in cycles
+              if get_cycle_upper_bound(list(cycle), min_amount_in,
+                                       snapshot) > min_amount_in]
+    if not cycles:
+        return {}
+
+    with profiler.stage("pricing"):
+        profits = await get_cycle_profits(cycles, [min_amount_in] * len(cycles),
+                                          snapshot)
+    searches = [CycleSearch(cycle, snapshot, min_amount_in, max_amount_in, profit)
+                for cycle, profit in zip(cycles, profits) if profit > 0]
+
+    probes = [(search, search.next_probe(size_tolerance, profit_tolerance))
+              for search in searches]
+    probes = [(search, point) for search, point in probes if point is not None]
+    while probes:
+        amount_ins = [math.exp(point) for _, point in probes]
+        with profiler.stage("pricing"):
+            profits = await get_cycle_profits([search.cycle for search, _ in probes],
+                                              amount_ins, snapshot)
+        for (search, _), profit in zip(probes, profits):
+            search.set_probe_profit(profit)
+        probes = [(search, search.next_probe(size_tolerance, profit_tolerance))
+                  for search, _ in probes]
+        probes = [(search, point) for search, point in probes if point is not None]
+
+    return {search.cycle: search.best for search in searches}
+
+
+def split_results(results: dict[tuple, tuple[float, float]]) -> tuple[list, list]:
+    """
+    Splits search results into line and triangle tuples, amount_in first
+    and profit last.
+    """
+    line_results = []
+    triangular_results = []
+    for cycle, (amount_in, profit) in results.items():
+        if len(cycle) == 2:
+            line_results.append((amount_in, *cycle, profit))
+        else:
+            triangular_results.append((amount_in, *cycle, profit))
+
+    return line_results, triangular_results
+
+
+async def search_arbitrage(snapshot: MarketSnapshot,
+                           min_amount_in: float,
+                           max_amount_in: float,
+                           size_tolerance: float = 0.1,
+                           profit_tolerance: float = 0.01):
     """
-    Calculate the arbitrage for a given amount_in and triangles.
+    Searches every distinct cycle of the lines and triangles of a snapshot
+    at once, see search_cycles.
     """
-    new_triangles = fill_missing_triangles(triangles)
-    middle_paths = list(new_triangles.keys())
-    remaining_paths, start_index, end_index = get_remaning_paths(middle_paths,
-                                                                 lines.keys())
-
-    initial_results = (await asyncio.gather(
-        asyncio.gather(
-            *[direct_prices(middle_paths + remaining_paths,
-                            [amount_in] * end_index)],
-            *[reverse_prices(middle_paths, [amount_in] * start_index)])
-    ))[0]
-
-    whole_direct_results = initial_results[0]
-    right_results = initial_results[1]
-    paths_of_connection_hit_targets = []
-    amounts_of_connection_hit_targets = []
-    for middle_path in middle_paths:
-        for left_path in new_triangles[middle_path].keys():
-            paths_of_connection_hit_targets.append((3, left_path, middle_path))
-            amounts_of_connection_hit_targets.append(
-                whole_direct_results[left_path])
-
-    start_index = len(paths_of_connection_hit_targets)
-    for forward_path in lines.keys():
-        for backward_path in lines[forward_path]:
-            paths_of_connection_hit_targets.append((2, forward_path,
-                                                    backward_path))
-            amounts_of_connection_hit_targets.append(
-                whole_direct_results[forward_path])
-
-    final_amount_outs = (await asyncio.gather(
-        *[direct_indexed_prices(paths_of_connection_hit_targets,
-                                amounts_of_connection_hit_targets)]))[0]
-
-    line_outs = defaultdict(int)
-    triangular_outs = defaultdict(int)
-    for (n, left_path, middle_path), price in final_amount_outs:
-        if n == 2:
-            line_outs[(left_path, middle_path)] = price
-        if n == 3:
-            triangular_outs[(left_path, middle_path)] = price
-
-    triangular_arbitrage_results = []
-    for middle_path in middle_paths:
-        for left_path in new_triangles[middle_path].keys():
-            for right_path in new_triangles[middle_path][left_path]:
-                arbitrage_result = triangular_outs[(left_path,
-                                                    middle_path)] - right_results[right_path]
-                if right_results[right_path] <= 0 or triangular_outs[(left_path, middle_path)] <= 0:
-                    arbitrage_result = float("-inf")
-                triangular_arbitrage_results.append(
-                    (left_path,
-                     middle_path,
-                     right_path,
-                     arbitrage_result))
-
-    line_arbitrage_results = []
-    for (forward_path, backward_path), price in line_outs.items():
-        line_arbitrage_results.append(
-            (forward_path, backward_path, price - amount_in))
-
-    return line_arbitrage_results, triangular_arbitrage_results
+    return split_results(await search_cycles(
+        CycleRegistry(snapshot.lines, snapshot.triangles).cycles, snapshot,
+        min_amount_in, max_amount_in, size_tolerance, profit_tolerance))
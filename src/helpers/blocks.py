@@ -0,0 +1,141 @@
+import asyncio
+import json
+from dataclasses import dataclass
+import websockets
+from models.data import Data
+from helpers.rpc import send_request
+
+
+@dataclass(frozen=True)
+class Head:
+    number: int
+    hash: str
+    parent_hash: str
+    reorg: bool = False
+
+
+def normalize_header(header) -> tuple[int, str, str]:
+    """
+    Accepts both raw JSON-RPC headers and web3 block objects.
+    """
+    number, block_hash, parent_hash = (header["number"],
+                                       header["hash"],
+                                       header["parentHash"])
+    if isinstance(number, str):
+        number = int(number, 16)
+    if not isinstance(block_hash, str):
+        block_hash = "0x" + bytes(block_hash).hex()
+    if not isinstance(parent_hash, str):
+        parent_hash = "0x" + bytes(parent_hash).hex()
+    return number, block_hash.lower(), parent_hash.lower()
+
+
+class BlockTrigger:
+    """
+    Emits each new head once, driven by a newHeads subscription and falling
+    back to polling while the websocket is down. Only the newest head is
+    kept, so a slow consumer skips the heads it could not keep up with.
+    """
+
+    def __init__(self, ws_url: str = None,
+                 poll_interval: float = 1,
+                 retry_interval: float = 30,
+                 max_depth: int = 64) -> None:
+        self.ws_url = ws_url
+        self.poll_interval = poll_interval
+        self.retry_interval = retry_interval
+        self.max_depth = max_depth
+        self.hashes = {}
+        self.latest = None
+        self.event = asyncio.Event()
+        self.task = None
+        self.duplicates = 0
+        self.reorgs = 0
+
+    @staticmethod
+    def from_env() -> "BlockTrigger":
+        return BlockTrigger(Data.get_env("WS_ENDPOINT", shared=False))
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    def on_header(self, header) -> None:
+        """
+        Deduplicates a header, flags reorgs and publishes it as the latest.
+        """
+        number, block_hash, parent_hash = normalize_header(header)
+        if self.hashes.get(number) == block_hash:
+            self.duplicates += 1
+            return
+        if self.latest is not None and number < self.latest.number - self.max_depth:
+            self.duplicates += 1
+            return
+
+        known_parent = self.hashes.get(number - 1)
+        reorg = number in self.hashes or \
+            (known_parent is not None and known_parent != parent_hash)
+        if reorg:
+            self.reorgs += 1
+            for stale_number in [n for n in self.hashes if n >= number]:
+                del self.hashes[stale_number]
+
+        self.hashes[number] = block_hash
+        for old_number in [n for n in self.hashes
+                           if n <= number - self.max_depth]:
+            del self.hashes[old_number]
+
+        self.latest = Head(number, block_hash, parent_hash, reorg)
+        self.event.set()
+
+    async def next_head(self) -> Head:
+        """
+        Waits for a head that wasn't returned before.
+        """
+        self.start()
+        await self.event.wait()
+        self.event.clear()
+        return self.latest
+
+    async def subscribe(self) -> None:
+        async with websockets.connect(self.ws_url) as websocket:
+            await websocket.send(json.dumps({"jsonrpc": "2.0", "id": 1,
+                                             "method": "eth_subscribe",
+                                             "params": ["newHeads"]}))
+            response = json.loads(await websocket.recv())
+            if "error" in response:
+                raise ConnectionError(response["error"])
+            async for message in websocket:
+                params = json.loads(message).get("params")
+                if params:
+                    self.on_header(params["result"])
+
+    async def get_latest_header(self) -> dict:
+        return await send_request("eth_getBlockByNumber", ["latest", False])
+
+    async def poll(self, duration: float = None) -> None:
+        loop = asyncio.get_running_loop()
+        end_time = None if duration is None else loop.time() + duration
+        while end_time is None or loop.time() < end_time:
+            try:
+                self.on_header(await self.get_latest_header())
+            except Exception as e:
+                print("Polling the latest block failed: {}".format(e))
+            await asyncio.sleep(self.poll_interval)
+
+    async def run(self) -> None:
+        if not self.ws_url:
+            await self.poll()
+        while True:
+            try:
+                await self.subscribe()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("newHeads subscription dropped: {}".format(e))
+            await self.poll(self.retry_interval)
@@ -0,0 +1,407 @@
+import asyncio
+import time
+from collections import Counter
+import aiohttp
+from eth_utils import keccak
+from models.market import Path
+from models.data import Data
+from helpers.rpc import RPCError, send_request
+
+MULTICALL_ADDRESS = "0xcA11bde05977b3631167028862bE2a173976CA11"
+MULTICALL_BATCH_SIZE = 512
+MIN_BATCH_SIZE = 8
+MAX_BATCH_SIZE = 4096
+
+
+def get_selector(signature: str) -> bytes:
+    return keccak(text=signature)[:4]
+
+
+AGGREGATE3 = get_selector("aggregate3((address,bool,bytes)[])")
+GET_RESERVES = get_selector("getReserves()")
+SLOT0 = get_selector("slot0()")
+LIQUIDITY = get_selector("liquidity()")
+QUOTE_EXACT_INPUT_SINGLE = get_selector(
+    "quoteExactInputSingle((address,address,uint256,uint24,uint160))")
+QUOTE_EXACT_OUTPUT_SINGLE = get_selector(
+    "quoteExactOutputSingle((address,address,uint256,uint24,uint160))")
+
+
+def word(value: int) -> bytes:
+    return value.to_bytes(32, "big")
+
+
+def address_word(address: str) -> bytes:
+    return bytes(12) + bytes.fromhex(address[2:])
+
+
+def encode_aggregate3(calls: list[tuple[str, bytes]]) -> bytes:
+    """
+    Encodes aggregate3 with allowFailure set for every call.
+    """
+    heads = []
+    tails = []
+    offset = 32 * len(calls)
+    for target, calldata in calls:
+        padding = bytes(-len(calldata) % 32)
+        tail = address_word(target) + word(1) + word(96) + \
+            word(len(calldata)) + calldata + padding
+        heads.append(word(offset))
+        tails.append(tail)
+        offset += len(tail)
+
+    return AGGREGATE3 + word(32) + word(len(calls)) + \
+        b"".join(heads) + b"".join(tails)
+
+
+def decode_aggregate3(data: bytes) -> list[memoryview]:
+    """
+    Returns the return data of each call as a zero copy view,
+    None for failed calls.
+    """
+    view = memoryview(data)
+    start = int.from_bytes(view[0:32], "big") + 32
+    count = int.from_bytes(view[start - 32:start], "big")
+    results = []
+    for i in range(count):
+        element = start + int.from_bytes(view[start + 32 * i:start + 32 * (i + 1)], "big")
+        success = view[element + 31]
+        data_start = element + int.from_bytes(view[element + 32:element + 64], "big")
+        length = int.from_bytes(view[data_start:data_start + 32], "big")
+        results.append(view[data_start + 32:data_start + 32 + length]
+                       if success else None)
+    return results
+
+
+async def aggregate(calls: list[tuple[str, bytes]],
+                    block_identifier="latest",
+                    keys: list = None,
+                    payloads: dict = None,
+                    count_reverts: bool = True) -> list[memoryview]:
+    """
+    Sends the calls as raw multicall eth_calls, batched by the batch
+    controller of the network.
+    """
+    return await get_batch_controller().aggregate(calls, block_identifier,
+                                                  keys, payloads, count_reverts)
+
+
+async def aggregate_payload(payload: bytes,
+                            block_identifier="latest") -> list[memoryview]:
+    if isinstance(block_identifier, int):
+        block_identifier = hex(block_identifier)
+    result = await send_request("eth_call", [{"to": MULTICALL_ADDRESS,
+                                              "data": "0x" + payload.hex()},
+                                             block_identifier])
+    return decode_aggregate3(bytes.fromhex(result[2:]))
+
+
+class BatchController:
+    """
+    Sizes multicall batches from what the node does with them. Sizes are
+    powers of two: a batch slower than target_latency halves the size,
+    grow_after full batches in a row under half of it double it.
+    A batch failing as a whole, on gas, payload size or a timeout, halves
+    the size once and is bisected until the failing calls are alone, so a
+    bad call costs about log2(size) requests instead of failing its batch.
+    At most max_failed_requests failed requests are bisected per aggregate
+    call, the rest of a failing round returns None rather than storming
+    the node. Transport errors are not the calls' fault and aren't
+    bisected.
+    A key (a pair, a pool, a quoted path) failing max_failures times in a
+    row is quarantined for quarantine_blocks blocks, its calls return None
+    without being sent. Calls which revert on their own, like quotes of
+    amounts beyond a pool's depth, may be left out of that count, only
+    calls failing their batch count then. Decisions are counted in
+    metrics, the exceptions of failed calls by type in errors.
+    The send function is injected, so the controller runs against any
+    stand-in node.
+    """
+
+    def __init__(self, batch_size: int = MULTICALL_BATCH_SIZE,
+                 target_latency: float = 1,
+                 grow_after: int = 4,
+                 concurrency: int = 4,
+                 max_failures: int = 3,
+                 quarantine_blocks: int = 20,
+                 max_failed_requests: int = 32,
+                 send=None) -> None:
+        self.batch_size = batch_size
+        self.target_latency = target_latency
+        self.grow_after = grow_after
+        self.concurrency = concurrency
+        self.max_failures = max_failures
+        self.quarantine_blocks = quarantine_blocks
+        self.max_failed_requests = max_failed_requests
+        self.send = send or aggregate_payload
+        self.block_number = 0
+        self.fast_batches = 0
+        self.failures = Counter()
+        self.quarantine = {}
+        self.metrics = Counter()
+        self.errors = Counter()
+
+    def begin_block(self, block_number: int) -> None:
+        self.block_number = block_number
+        for key, release_block in list(self.quarantine.items()):
+            if release_block <= block_number:
+                del self.quarantine[key]
+
+    def is_quarantined(self, key) -> bool:
+        return key in self.quarantine
+
+    def record(self, key, success: bool, error: Exception = None) -> None:
+        """
+        Counts the consecutive failures of a key and quarantines it.
+        """
+        if success:
+            self.failures.pop(key, None)
+            return
+        self.metrics["failed_calls"] += 1
+        if error is not None:
+            self.errors[type(error).__name__] += 1
+        self.failures[key] += 1
+        if self.failures[key] >= self.max_failures:
+            del self.failures[key]
+            self.quarantine[key] = self.block_number + self.quarantine_blocks
+            self.metrics["quarantined"] += 1
+
+    def shrink(self) -> None:
+        self.fast_batches = 0
+        if self.batch_size > MIN_BATCH_SIZE:
+            self.batch_size //= 2
+            self.metrics["shrinks"] += 1
+
+    def observe(self, latency: float, full: bool) -> None:
+        if latency > self.target_latency:
+            self.shrink()
+        elif latency < self.target_latency / 2 and full:
+            self.fast_batches += 1
+            if self.fast_batches >= self.grow_after and \
+                    self.batch_size < MAX_BATCH_SIZE:
+                self.fast_batches = 0
+                self.batch_size *= 2
+                self.metrics["grows"] += 1
+
+    async def send_batch(self, calls: list[tuple[str, bytes]],
+                         keys: list,
+                         block_identifier,
+                         payload: bytes,
+                         budget: list[int],
+                         count_reverts: bool = True,
+                         bisected: bool = False) -> list[memoryview]:
+        self.metrics["requests"] += 1
+        start_time = time.perf_counter()
+        try:
+            results = await self.send(payload or encode_aggregate3(calls),
+                                      block_identifier)
+        except (RPCError, asyncio.TimeoutError, ValueError) as e:
+            self.metrics["failed_batches"] += 1
+            # The halves of a bisection fail because of the same calls.
+            if not bisected:
+                self.shrink()
+            budget[0] -= 1
+            if len(calls) == 1:
+                self.metrics["isolated_calls"] += 1
+                self.record(keys[0], False, e)
+                return [None]
+            if budget[0] < 0:
+                self.metrics["abandoned_calls"] += len(calls)
+                return [None] * len(calls)
+            self.metrics["bisections"] += 1
+            half = len(calls) // 2
+            first, second = await asyncio.gather(
+                self.send_batch(calls[:half], keys[:half], block_identifier,
+                                None, budget, count_reverts, True),
+                self.send_batch(calls[half:], keys[half:], block_identifier,
+                                None, budget, count_reverts, True))
+            return first + second
+        except (aiohttp.ClientError, OSError):
+            self.metrics["transport_failures"] += 1
+            return [None] * len(calls)
+
+        self.observe(time.perf_counter() - start_time,
+                     len(calls) >= self.batch_size)
+        for key, result in zip(keys, results):
+            if result is not None or count_reverts:
+                self.record(key, result is not None)
+        return results
+
+    async def aggregate(self, calls: list[tuple[str, bytes]],
+                        block_identifier="latest",
+                        keys: list = None,
+                        payloads: dict = None,
+                        count_reverts: bool = True) -> list[memoryview]:
+        """
+        Returns the return data of each call, None where it failed or is
+        quarantined. Keys default to the call targets. payloads caches the
+        encoded batches of a call list which is sent again and again, by
+        first index and batch size. Without count_reverts, calls which
+        revert in a batch that went through don't count as failures.
+        """
+        keys = keys or [target for target, _ in calls]
+        indices = [i for i, key in enumerate(keys) if key not in self.quarantine]
+        if len(indices) < len(calls):
+            self.metrics["skipped_calls"] += len(calls) - len(indices)
+            payloads = None
+        self.metrics["calls"] += len(indices)
+        results = [None] * len(calls)
+        size = self.batch_size
+        semaphore = asyncio.Semaphore(self.concurrency)
+        budget = [self.max_failed_requests]
+
+        async def send_indices(batch: list[int]) -> None:
+            batch_calls = [calls[i] for i in batch]
+            payload = None
+            if payloads is not None:
+                payload = payloads.get((batch[0], size))
+                if payload is None:
+                    payload = payloads[(batch[0], size)] = \
+                        encode_aggregate3(batch_calls)
+            async with semaphore:
+                batch_results = await self.send_batch(
+                    batch_calls, [keys[i] for i in batch],
+                    block_identifier, payload, budget, count_reverts)
+            for i, result in zip(batch, batch_results):
+                results[i] = result
+
+        await asyncio.gather(*[send_indices(indices[i:i + size])
+                               for i in range(0, len(indices), size)])
+        return results
+
+    def get_report(self) -> str:
+        return "batch size {}, {} calls in {} requests, {} failed batches, " \
+            "{} bisections, {} failed calls{}, {} quarantined now".format(
+                self.batch_size, self.metrics["calls"], self.metrics["requests"],
+                self.metrics["failed_batches"], self.metrics["bisections"],
+                self.metrics["failed_calls"],
+                " ({})".format(", ".join(
+                    "{} {}".format(count, name)
+                    for name, count in self.errors.most_common()))
+                if self.errors else "",
+                len(self.quarantine))
+
+
+class ReserveReader:
+    """
+    Reads v2 reserves with multicall payloads which are encoded once per
+    batch size and cached. Results are unpacked from fixed offsets straight
+    into preallocated lists, one slot per pair.
+    """
+
+    def __init__(self, paths: list[Path], pair_addresses: dict[str, str]) -> None:
+        self.paths = paths
+        self.addresses = sorted({pair_addresses[str(path)] for path in paths})
+        self.index = {address: i for i, address in enumerate(self.addresses)}
+        self.path_indices = [self.index[pair_addresses[str(path)]]
+                             for path in paths]
+        self.reserve0 = [0] * len(self.addresses)
+        self.reserve1 = [0] * len(self.addresses)
+        self.calls = [(address, GET_RESERVES) for address in self.addresses]
+        self.payloads = {}
+
+    async def fetch(self, block_identifier="latest") -> dict[Path, tuple[int, int]]:
+        """
+        Returns the reserves of every path, ordered in its direction.
+        """
+        results = await aggregate(self.calls, block_identifier,
+                                  payloads=self.payloads)
+        for i, result in enumerate(results):
+            if result is None:
+                self.reserve0[i] = self.reserve1[i] = 0
+            else:
+                self.reserve0[i] = int.from_bytes(result[0:32], "big")
+                self.reserve1[i] = int.from_bytes(result[32:64], "big")
+
+        reserves = {}
+        for path, i in zip(self.paths, self.path_indices):
+            if path.zero_for_one:
+                reserves[path] = (self.reserve0[i], self.reserve1[i])
+            else:
+                reserves[path] = (self.reserve1[i], self.reserve0[i])
+        return reserves
+
+
+class StateReader:
+    """
+    Reads slot0 and liquidity of v3 pools with cached payloads.
+    """
+
+    def __init__(self, paths: list[Path], pool_addresses: dict[str, str]) -> None:
+        self.paths = paths
+        self.calls = []
+        for path in paths:
+            address = pool_addresses[str(path)]
+            self.calls.extend([(address, SLOT0), (address, LIQUIDITY)])
+        self.payloads = {}
+
+    async def fetch(self, block_identifier="latest") -> dict[Path, tuple[int, int]]:
+        results = await aggregate(self.calls, block_identifier,
+                                  payloads=self.payloads)
+
+        states = {}
+        for i, path in enumerate(self.paths):
+            slot0, liquidity = results[2 * i], results[2 * i + 1]
+            if slot0 is None or liquidity is None:
+                states[path] = (0, 0)
+            else:
+                states[path] = (int.from_bytes(slot0[0:32], "big"),
+                                int.from_bytes(liquidity[0:32], "big"))
+        return states
+
+
+class QuoteTemplates:
+    """
+    Keeps the quoter calldata of each v3 path with everything but the
+    amount already encoded.
+    """
+
+    def __init__(self) -> None:
+        self.templates = {}
+
+    def get_templates(self, path: Path) -> tuple[bytes, bytes]:
+        templates = self.templates.get(path)
+        if templates is None:
+            templates = (QUOTE_EXACT_INPUT_SINGLE +
+                         address_word(path.from_token.address) +
+                         address_word(path.to_token.address),
+                         word(path.dex.fee) + word(0))
+            self.templates[path] = templates
+        return templates
+
+    def encode(self, path: Path, amount: int) -> bytes:
+        prefix, suffix = self.get_templates(path)
+        return prefix + word(amount) + suffix
+
+    async def quote(self, paths: list[Path], amounts: list[float],
+                    block_identifier="latest") -> list[float]:
+        """
+        Quotes exact input USD amounts through the quoters in raw
+        multicalls. Returns USD amounts like direct_V3_price, 0 where the
+        quote failed.
+        """
+        calls = [(path.dex.pricing_contract.address,
+                  self.encode(path, int(path.from_token.get_relative_price(amount))))
+                 for path, amount in zip(paths, amounts)]
+
+        # The size search probes amounts beyond the depth of a pool, those
+        # quotes revert without anything being wrong with the path.
+        results = await aggregate(calls, block_identifier,
+                                  [str(path) for path in paths],
+                                  count_reverts=False)
+        return [0 if result is None else
+                path.to_token.recover_original_price(
+                    int.from_bytes(result[0:32], "big"))
+                for path, result in zip(paths, results)]
+
+
+def get_batch_controller() -> BatchController:
+    if Data.batch_controller is None:
+        Data.batch_controller = BatchController()
+    return Data.batch_controller
+
+
+def get_quote_templates() -> QuoteTemplates:
+    if Data.quote_templates is None:
+        Data.quote_templates = QuoteTemplates()
+    return Data.quote_templates
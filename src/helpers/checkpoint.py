@@ -0,0 +1,164 @@
+import atexit
+import json
+import os
+import queue
+import threading
+from models.market import Path
+from models.data import Data
+from helpers.scheduling import CycleScheduler
+from helpers.state import BlockState, StateManager
+
+
+def get_delta(mapping, last_mapping) -> dict[str, list]:
+    return {str(path): list(value) for path, value in mapping.items()
+            if last_mapping.get(path) != value}
+
+
+def read_records(file_name: str) -> list[dict]:
+    """
+    Reads the records of a checkpoint file up to the first broken line.
+    """
+    records = []
+    with open(file_name) as file:
+        for line in file:
+            try:
+                records.append(json.loads(line))
+            except json.JSONDecodeError:
+                break
+    return records
+
+
+class Checkpoint:
+    """
+    Keeps the runtime state in a local file, so that a restart evaluates
+    its first block instead of reading the whole market again: the last
+    block, its reserves and v3 states, the carried results of the
+    scheduler and its expected profits and sizes.
+
+    The file is json lines. A base record holds the whole state, every
+    block appends a delta record with the reserves and states which
+    differ from the previous record. Every base_interval blocks the file
+    is replaced by a new base, which is when the scheduler is saved, so
+    the paths changed after the base are searched again after a restart.
+    A line cut short by a crash is ignored.
+    Records are encoded and written by a background thread, snapshots
+    can't change so they are handed over as they are.
+    """
+
+    def __init__(self, file_name: str, base_interval: int = 100) -> None:
+        self.file_name = file_name
+        self.base_interval = base_interval
+        self.network_name = Data.network_name
+        self.blocks = 0
+        self.last_snapshot = None
+        self.file = None
+        self.queue = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self.write, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def from_env() -> "Checkpoint":
+        """
+        Checkpoints to CHECKPOINT_FILE, suffixed with the network when there
+        are several, returns None if it is not set.
+        """
+        file_name = os.environ.get("CHECKPOINT_FILE")
+        if not file_name:
+            return None
+        if Data.network_name:
+            root, extension = os.path.splitext(file_name)
+            file_name = "{}_{}{}".format(root, Data.network_name, extension)
+        return Checkpoint(file_name, int(Data.get_env("CHECKPOINT_INTERVAL", 100)))
+
+    def add(self, block: BlockState, scheduler: CycleScheduler) -> None:
+        """
+        Queues the state of a block, with the scheduler's when a new base
+        is due.
+        """
+        scheduler_state = scheduler.get_state() \
+            if self.blocks % self.base_interval == 0 else None
+        self.blocks += 1
+        self.queue.put((block.number, block.hash, block.parent_hash,
+                        block.snapshot, scheduler_state))
+
+    def write(self) -> None:
+        while True:
+            item = self.queue.get()
+            if item is None:
+                if self.file:
+                    self.file.close()
+                    self.file = None
+                return
+            block_number, block_hash, parent_hash, snapshot, scheduler_state = item
+            record = {"block": [block_number, block_hash, parent_hash]}
+            if scheduler_state is not None:
+                record.update(network=self.network_name,
+                              reserves=get_delta(snapshot.reserves, {}),
+                              v3_states=get_delta(snapshot.v3_states, {}),
+                              scheduler=scheduler_state)
+                self.write_base(record)
+            else:
+                record.update(reserves=get_delta(snapshot.reserves,
+                                                 self.last_snapshot.reserves),
+                              v3_states=get_delta(snapshot.v3_states,
+                                                  self.last_snapshot.v3_states))
+                self.file.write(json.dumps(record) + "\n")
+                self.file.flush()
+            self.last_snapshot = snapshot
+
+    def write_base(self, record: dict) -> None:
+        if self.file:
+            self.file.close()
+        with open(self.file_name + ".tmp", "w") as file:
+            file.write(json.dumps(record) + "\n")
+        os.replace(self.file_name + ".tmp", self.file_name)
+        self.file = open(self.file_name, "a")
+
+    def close(self) -> None:
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+
+    def restore(self, state: StateManager, scheduler: CycleScheduler) -> bool:
+        """
+        Restores the state manager and the scheduler from the file. Paths
+        of the topology missing from the checkpoint and paths changed after
+        its base are read again when the manager catches up. Returns
+        whether there was a usable checkpoint.
+        """
+        if not os.path.exists(self.file_name):
+            return False
+        try:
+            base, *deltas = read_records(self.file_name)
+            if base["network"] != self.network_name:
+                raise ValueError("it is for {}".format(base["network"]))
+            names = {}
+            changed_names = set()
+            for record in [base] + deltas:
+                for field in ["reserves", "v3_states"]:
+                    names.update(record[field])
+                    if record is not base:
+                        changed_names.update(record[field])
+
+            reserves = {}
+            v3_states = {}
+            paths = set()
+            for path in Path.get_all_v2_paths() + Path.get_all_v3_paths():
+                value = names.get(str(path))
+                if value is None or str(path) in changed_names:
+                    paths.add(path)
+                if value is not None:
+                    (v3_states if path.is_v3 else reserves)[path] = tuple(value)
+            block_number, block_hash, parent_hash = (deltas or [base])[-1]["block"]
+            state.restore(block_number, block_hash, parent_hash,
+                          reserves, v3_states, paths)
+            scheduler.set_state(base["scheduler"])
+        except (KeyError, ValueError) as e:
+            print("Checkpoint {} is unusable, starting cold: {}".format(
+                self.file_name, e))
+            return False
+
+        print("Restored checkpoint block {}, {} paths to read again".format(
+            block_number, len(paths)))
+        return True
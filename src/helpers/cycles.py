@@ -0,0 +1,135 @@
+from collections import defaultdict
+from models.market import Path, Token
+from helpers.pruning import get_cycle_upper_bound
+from helpers.snapshot import MarketSnapshot
+
+
+def get_rotations(cycle: tuple[Path, ...]) -> list[tuple[Path, ...]]:
+    return [cycle[i:] + cycle[:i] for i in range(len(cycle))]
+
+
+def get_canonical_cycle(cycle: tuple[Path, ...]) -> tuple[Path, ...]:
+    """
+    The rotation starting with the smallest path name. Rotations trade the
+    same pools in the same direction, so they are one opportunity.
+    """
+    return min(get_rotations(cycle), key=lambda rotation: str(rotation[0]))
+
+
+def get_start_results(cycle: tuple[Path, ...],
+                      amount_in: float,
+                      profit: float) -> dict[Token, tuple[tuple[Path, ...], float, float]]:
+    """
+    Derives the result of every start token from one evaluation. Amounts
+    and profits are in USD, so to first order they don't depend on where
+    the cycle starts; the on-chain check settles the rest.
+    """
+    return {rotation[0].from_token: (rotation, amount_in, profit)
+            for rotation in get_rotations(cycle)}
+
+
+def decode_cycle(names: list[str]) -> tuple:
+    """
+    Inverse of str over the legs of a path cycle or a token cycle.
+    """
+    return tuple(Path.get_path_from_name(*name.split(' ')) if ' ' in name
+                 else Token.get_token_from_name(name) for name in names)
+
+
+class CycleRegistry:
+    """
+    Every directed cycle of the lines and triangles, stored once under its
+    canonical rotation. Data.lines holds both orientations of each line and
+    the healthy triangles every rotation of each triangle, so this is about
+    half the lines and a third of the triangles.
+    """
+
+    def __init__(self, lines: dict[Path, list[Path]],
+                 triangles: dict[Path, dict[Path, list[Path]]]) -> None:
+        cycles = {}
+        for forward_path, backward_paths in lines.items():
+            for backward_path in backward_paths:
+                cycles.setdefault(get_canonical_cycle((forward_path, backward_path)))
+        for middle_path, ear_paths in triangles.items():
+            for left_path, right_paths in ear_paths.items():
+                for right_path in right_paths:
+                    cycles.setdefault(get_canonical_cycle(
+                        (left_path, middle_path, right_path)))
+        self.cycles = list(cycles)
+        self.path_cycles = defaultdict(list)
+        for cycle in self.cycles:
+            for path in cycle:
+                self.path_cycles[path].append(cycle)
+
+    def resolve(self, cycle: tuple[Path, ...],
+                amount_in: float,
+                snapshot: MarketSnapshot) -> tuple[Path, ...]:
+        return cycle
+
+    def __len__(self) -> int:
+        return len(self.cycles)
+
+
+def get_token_cycle(cycle: tuple[Path, ...]) -> tuple[Token, ...]:
+    return min(get_rotations(tuple(path.from_token for path in cycle)),
+               key=lambda rotation: rotation[0].name)
+
+
+class TokenCycleRegistry:
+    """
+    Aggregated-edge mode: the parallel pools of a token pair on every dex
+    are merged into one edge, and the cycles are the distinct token cycles,
+    up to 7 dexes to the power of the legs fewer than the dex-expanded ones.
+    Before a search each token cycle is resolved to one path per leg, the
+    one whose upper bound returns the most for the amount carried so far
+    by the liquidity index of the snapshot, so the choice follows the
+    reserves of the block.
+    A pool can't be traded back through in the same cycle.
+    Splitting an amount across parallel pools isn't supported by the
+    contracts, so the edge is the best single pool.
+    """
+
+    def __init__(self, lines: dict[Path, list[Path]],
+                 triangles: dict[Path, dict[Path, list[Path]]]) -> None:
+        dex_cycles = CycleRegistry(lines, triangles).cycles
+        self.edges = defaultdict(set)
+        cycles = {}
+        for cycle in dex_cycles:
+            for path in cycle:
+                self.edges[(path.from_token, path.to_token)].add(path)
+            cycles.setdefault(get_token_cycle(cycle))
+        self.edges = {edge: sorted(paths, key=str)
+                      for edge, paths in self.edges.items()}
+        self.cycles = list(cycles)
+        self.path_cycles = defaultdict(list)
+        for cycle in self.cycles:
+            for edge in zip(cycle, cycle[1:] + cycle[:1]):
+                for path in self.edges[edge]:
+                    self.path_cycles[path].append(cycle)
+
+    def resolve(self, cycle: tuple[Token, ...],
+                amount_in: float,
+                snapshot: MarketSnapshot) -> tuple[Path, ...]:
+        """
+        Returns the best path of each leg of a token cycle, None when a leg
+        has no usable pool.
+        """
+        paths = []
+        amount = amount_in
+        for edge in zip(cycle, cycle[1:] + cycle[:1]):
+            best_path, best_amount = None, 0
+            for path in self.edges[edge]:
+                if any(path.dex == previous.dex and path.to_token == previous.from_token
+                       for previous in paths):
+                    continue
+                amount_out = get_cycle_upper_bound([path], amount, snapshot)
+                if amount_out > best_amount:
+                    best_path, best_amount = path, amount_out
+            if best_path is None:
+                return None
+            paths.append(best_path)
+            amount = best_amount
+        return tuple(paths)
+
+    def __len__(self) -> int:
+        return len(self.cycles)
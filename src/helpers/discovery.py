@@ -0,0 +1,308 @@
+import asyncio
+import io
+import json
+import os
+import time
+from collections import defaultdict
+from contextlib import redirect_stderr
+from brownie import Contract
+from eth_utils import keccak, to_checksum_address
+from models.data import Data
+from helpers.rpc import RPCError, send_request
+
+dummy_stderr = io.StringIO()
+with redirect_stderr(dummy_stderr):
+    from dank_mids.brownie_patch import patch_contract
+
+ANCHOR_TOKEN_NAMES = ["WETH", "USDC", "USDT", "DAI"]
+CONFIRMATIONS = 12
+MIN_CHUNK_SIZE = 100
+MAX_CHUNK_SIZE = 100000
+
+
+def get_discovery_files() -> tuple[str, str]:
+    return (Data.get_asset_path('discovered_pools.jsonl'),
+            Data.get_asset_path('discovery_cursor.json'))
+
+
+def load_cursor() -> dict[str, int]:
+    """
+    Loads the last scanned block of each dex.
+    """
+    _, cursor_file = get_discovery_files()
+    if not os.path.exists(cursor_file):
+        return {}
+    with open(cursor_file, 'r') as file:
+        return json.load(file)
+
+
+def save_cursor(cursor: dict[str, int]) -> None:
+    _, cursor_file = get_discovery_files()
+    with open(cursor_file + ".tmp", "w") as file:
+        json.dump(cursor, file, indent=4)
+    os.replace(cursor_file + ".tmp", cursor_file)
+
+
+def load_discovered_pools() -> list[dict]:
+    """
+    Loads the discovered pools keyed by pool address. A scan which stopped
+    between appending a chunk and moving the cursor appends it again on
+    resume, the first entry of a pool wins.
+    """
+    pools_file, _ = get_discovery_files()
+    if not os.path.exists(pools_file):
+        return []
+    pools = {}
+    with open(pools_file, 'r') as file:
+        for line in file:
+            if line.strip():
+                pool = json.loads(line)
+                pools.setdefault(pool["pool"], pool)
+    return list(pools.values())
+
+
+def topic_to_address(topic: str) -> str:
+    return to_checksum_address("0x" + topic[-40:])
+
+
+def decode_creation_log(dex_name: str, log: dict) -> dict:
+    """
+    Decodes a PairCreated (v2) or PoolCreated (v3) log.
+    """
+    data = log["data"][2:]
+    pool = {
+        "dex": dex_name,
+        "token0": topic_to_address(log["topics"][1]),
+        "token1": topic_to_address(log["topics"][2]),
+        "block": int(log["blockNumber"], 16)
+    }
+    if dex_name.endswith("v3"):
+        pool["fee"] = int(log["topics"][3], 16)
+        pool["pool"] = to_checksum_address("0x" + data[64 + 24:128])
+    else:
+        pool["pool"] = to_checksum_address("0x" + data[24:64])
+    return pool
+
+
+def get_creation_topic(dex_name: str) -> str:
+    if dex_name.endswith("v3"):
+        signature = "PoolCreated(address,address,uint24,int24,address)"
+    else:
+        signature = "PairCreated(address,address,address,uint256)"
+    return "0x" + keccak(text=signature).hex()
+
+
+async def scan_factory(dex_name: str,
+                       from_block: int,
+                       to_block: int,
+                       chunk_size: int = 10000) -> None:
+    """
+    Scans the creation logs of a factory in chunks. Results are appended to
+    discovered_pools.jsonl and the cursor is moved after every chunk, so an
+    interrupted scan resumes where it stopped. A chunk appended before a
+    crash is appended again, load_discovered_pools drops the duplicates. The chunk size halves when
+    the node refuses a range and grows back on success.
+    """
+    pools_file, _ = get_discovery_files()
+    factory_address = Data.get_factory_address_from_name(dex_name)
+    topic = get_creation_topic(dex_name)
+
+    start = from_block
+    while start <= to_block:
+        end = min(start + chunk_size - 1, to_block)
+        try:
+            logs = await send_request("eth_getLogs", [{
+                "address": factory_address,
+                "topics": [topic],
+                "fromBlock": hex(start),
+                "toBlock": hex(end)}])
+        except (RPCError, asyncio.TimeoutError) as e:
+            if chunk_size <= MIN_CHUNK_SIZE:
+                raise e
+            chunk_size //= 2
+            continue
+
+        with open(pools_file, "a") as file:
+            for log in logs:
+                file.write(json.dumps(decode_creation_log(dex_name, log)) + "\n")
+        cursor = load_cursor()
+        cursor[dex_name] = end
+        save_cursor(cursor)
+
+        start = end + 1
+        chunk_size = min(chunk_size * 2, MAX_CHUNK_SIZE)
+
+
+def get_from_block(dex_name: str, cursor: dict[str, int],
+                   start_block: int = None) -> int:
+    """
+    A factory is scanned from its cursor, else from its factory_block in
+    address_data.json, else from start_block. Scanning from genesis is
+    never implied.
+    """
+    if dex_name in cursor:
+        return cursor[dex_name] + 1
+    from_block = Data.get_factory_block_from_name(dex_name)
+    if from_block is None:
+        from_block = start_block
+    if from_block is None:
+        raise ValueError("No start block for {}, set its factory_block in "
+                         "address_data.json or pass one".format(dex_name))
+    return from_block
+
+
+async def scan_factories(start_block: int = None) -> None:
+    """
+    Brings every factory in address_data.json up to the confirmed head.
+    """
+    start_time = time.perf_counter()
+    cursor = load_cursor()
+    from_blocks = {dex_name: get_from_block(dex_name, cursor, start_block)
+                   for dex_name in Data.get_dex_names()}
+    head = int(await send_request("eth_blockNumber"), 16) - CONFIRMATIONS
+    await asyncio.gather(
+        *[scan_factory(dex_name, from_block, head)
+          for dex_name, from_block in from_blocks.items()])
+
+    end_time = time.perf_counter()
+    print("Scanned factory logs up to block {} in {} seconds".format(
+        head, end_time - start_time))
+
+
+def load_abi(name: str) -> list:
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    return json.load(open(os.path.join(script_dir, 'assets', 'abi',
+                                       "{}.json".format(name))))
+
+
+def load_patched_contracts(addresses: list[str], abi_name: str) -> dict[str, Contract]:
+    abi = load_abi(abi_name)
+    contracts = {address: Contract.from_abi(address, address, abi)
+                 for address in set(addresses)}
+    _ = [patch_contract(contract, Data.dank_w3)
+         for contract in contracts.values()]
+    return contracts
+
+
+async def get_anchor_liquidities(pools: list[dict],
+                                 anchors: dict[str, str]) -> list[float]:
+    """
+    Returns the USD value of the anchor side of each pool. v2 reserves come
+    from getReserves, v3 balances from the anchor token's balanceOf.
+    All calls are batched into multicalls by dank_mids.
+    """
+    v2_contracts = load_patched_contracts(
+        [pool["pool"] for pool in pools if pool["dex"].endswith("v2")], "pair")
+    anchor_contracts = load_patched_contracts(list(anchors.values()), "erc20")
+
+    async def get_anchor_balance(pool):
+        if pool["dex"].endswith("v2"):
+            reserve0, reserve1, _ = \
+                await v2_contracts[pool["pool"]].getReserves.coroutine()
+            return reserve0 if pool["token0"] in anchors.values() else reserve1
+        anchor = pool["token0"] if pool["token0"] in anchors.values() \
+            else pool["token1"]
+        return await anchor_contracts[anchor].balanceOf.coroutine(pool["pool"])
+
+    balances = await asyncio.gather(
+        *[get_anchor_balance(pool) for pool in pools], return_exceptions=True)
+
+    anchor_names = {address: name for name, address in anchors.items()}
+    liquidities = []
+    for pool, balance in zip(pools, balances):
+        if isinstance(balance, Exception):
+            liquidities.append(0)
+            continue
+        anchor = pool["token0"] if pool["token0"] in anchor_names else pool["token1"]
+        anchor_name = anchor_names[anchor]
+        liquidities.append(balance / (Data.get_token_relative_price_from_name(anchor_name) *
+                                      10**Data.get_token_decimals_from_name(anchor_name)))
+    return liquidities
+
+
+async def get_token_metadata(addresses: list[str]) -> dict[str, tuple[str, int]]:
+    """
+    Fetches symbol and decimals of tokens, skipping non standard ones.
+    Whitespace is removed from symbols since path names are space separated.
+    """
+    contracts = load_patched_contracts(addresses, "erc20")
+    results = await asyncio.gather(
+        *[asyncio.gather(contract.symbol.coroutine(),
+                         contract.decimals.coroutine())
+          for contract in contracts.values()], return_exceptions=True)
+    metadata = {}
+    for address, result in zip(contracts.keys(), results):
+        if not isinstance(result, Exception):
+            symbol, decimals = result
+            metadata[address] = ("_".join(str(symbol).split()), decimals)
+    return metadata
+
+
+async def select_token_universe(min_liquidity: float = 100000,
+                                max_tokens: int = 200) -> dict:
+    """
+    Picks the tokens with the deepest liquidity against the anchor tokens
+    and writes them with the dexes to discovered_address_data.json, in the
+    format of address_data.json. The relative price of a token comes from
+    its deepest v2 pool against an anchor.
+    The file is not loaded by setup: it has to be reviewed and merged into
+    address_data.json by hand, after which the healthy files are
+    regenerated with reload_healthy.
+    """
+    start_time = time.perf_counter()
+    universe_file = Data.get_asset_path('discovered_address_data.json')
+    anchors = {name: to_checksum_address(
+        Data.get_token_address_from_name(name)) for name in ANCHOR_TOKEN_NAMES}
+    anchor_addresses = set(anchors.values())
+
+    pools = [pool for pool in load_discovered_pools()
+             if (pool["token0"] in anchor_addresses) != (pool["token1"] in anchor_addresses)
+             and (pool["dex"].endswith("v2") or pool.get("fee") == 3000)]
+    liquidities = await get_anchor_liquidities(pools, anchors)
+
+    scores = defaultdict(float)
+    deepest_pools = {}
+    for pool, liquidity in zip(pools, liquidities):
+        token = pool["token1"] if pool["token0"] in anchor_addresses else pool["token0"]
+        scores[token] += liquidity
+        if pool["dex"].endswith("v2") and \
+                liquidity > deepest_pools.get(token, (None, 0))[1]:
+            deepest_pools[token] = (pool, liquidity)
+
+    candidates = sorted([token for token, score in scores.items()
+                         if score >= min_liquidity and token in deepest_pools],
+                        key=lambda token: -scores[token])[:max_tokens]
+    metadata = await get_token_metadata(candidates)
+    pair_contracts = load_patched_contracts(
+        [deepest_pools[token][0]["pool"] for token in metadata], "pair")
+    reserves = await asyncio.gather(
+        *[pair_contracts[deepest_pools[token][0]["pool"]].getReserves.coroutine()
+          for token in metadata])
+
+    tokens = {name: {"address": Data.get_token_address_from_name(name),
+                     "relative_price": Data.get_token_relative_price_from_name(name),
+                     "decimals": Data.get_token_decimals_from_name(name)}
+              for name in Data.get_token_names()}
+    known_addresses = {to_checksum_address(token["address"])
+                       for token in tokens.values()}
+    for (token, (symbol, decimals)), reserve in zip(metadata.items(), reserves):
+        if token in known_addresses:
+            continue
+        pool, liquidity = deepest_pools[token]
+        token_reserve = reserve[0] if pool["token0"] == token else reserve[1]
+        name = symbol if symbol not in tokens else "{}_{}".format(symbol,
+                                                                token[2:8])
+        tokens[name] = {"address": token.lower(),
+                        "relative_price": token_reserve / 10**decimals / liquidity,
+                        "decimals": decimals}
+
+    universe = {"dex": Data.address_data["dex"], "token": tokens}
+    with open(universe_file, "w") as file:
+        json.dump(universe, file, indent=2)
+
+    end_time = time.perf_counter()
+    print("Selected {} tokens in {} seconds".format(len(tokens),
+                                                    end_time - start_time))
+    print("Merge {} into address_data.json and reload the healthy files "
+          "to use them".format(universe_file))
+    return universe
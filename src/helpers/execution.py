@@ -0,0 +1,237 @@
+import asyncio
+import json
+import os
+import time
+import logging
+from collections import deque
+from brownie import Contract, accounts, network, web3
+from models.market import Path
+from helpers.multihop import load_multihop_contract, encode_route
+from helpers.blocks import normalize_header
+from helpers.rpc import send_request
+
+
+class Executor:
+    """
+    Turns detected line arbitrages into startArbitrage transactions.
+    The signer, nonce and fee fields are kept warm between blocks so that a
+    submission costs one eth_call and one eth_sendRawTransaction. The node
+    is only reached through send_request and signing runs in the default
+    executor, so nothing blocks the event loop.
+    """
+
+    def __init__(self, account, contract_address: str,
+                 priority_fee: int, gas_limit: int,
+                 multihop_address: str = None,
+                 funded_tokens: list[str] = ()) -> None:
+        script_dir = os.path.dirname(os.path.abspath(__file__))
+        abi_file = os.path.join(script_dir, 'assets', 'abi', 'arbitrage.json')
+
+        self.account = account
+        self.contract = Contract.from_abi("UniswapV2BasedDexArb",
+                                          contract_address,
+                                          json.load(open(abi_file)))
+        self.multihop = load_multihop_contract(multihop_address) \
+            if multihop_address else None
+        self.funded_tokens = set(funded_tokens)
+        self.chain_id = web3.eth.chain_id
+        self.priority_fee = priority_fee
+        self.gas_limit = gas_limit
+        self.nonce = None
+        self.block_number = None
+        self.block_hash = None
+        self.max_fee = None
+        self.latencies = deque(maxlen=1000)
+
+    @staticmethod
+    def from_env() -> "Executor":
+        """
+        Creates an executor from the environment, returns None if
+        ARBITRAGE_CONTRACT_ADDRESS is not set. MULTIHOP_CONTRACT_ADDRESS
+        optionally enables the execution of triangles which start from one
+        of the tokens in MULTIHOP_FUNDED_TOKENS, the comma separated names
+        of the tokens the contract holds.
+        On the development network the first unlocked account is used when
+        EXECUTION_ACCOUNT is not set.
+        """
+        contract_address = os.environ.get("ARBITRAGE_CONTRACT_ADDRESS")
+        if not contract_address:
+            return None
+
+        account_name = os.environ.get("EXECUTION_ACCOUNT")
+        if account_name:
+            account = accounts.load(
+                account_name, os.environ.get("EXECUTION_ACCOUNT_PASSWORD"))
+        elif network.show_active() == "development":
+            account = accounts[0]
+        else:
+            return None
+
+        priority_fee = int(
+            float(os.environ.get("PRIORITY_FEE_GWEI", 1)) * 10**9)
+        gas_limit = int(os.environ.get("EXECUTION_GAS_LIMIT", 400000))
+        funded_tokens = [name.strip() for name in os.environ.get(
+            "MULTIHOP_FUNDED_TOKENS", "").split(",") if name.strip()]
+        return Executor(account, contract_address, priority_fee, gas_limit,
+                        os.environ.get("MULTIHOP_CONTRACT_ADDRESS"),
+                        funded_tokens)
+
+    async def get_pending_nonce(self) -> int:
+        return int(await send_request("eth_getTransactionCount",
+                                      [self.account.address, "pending"]), 16)
+
+    async def refresh(self, block_number: int, block_hash: str = None) -> None:
+        """
+        Pins the block which the next simulations run against and updates
+        the fee fields from its base fee.
+        """
+        if block_hash:
+            block = await send_request("eth_getBlockByHash", [block_hash, False])
+        else:
+            block = await send_request("eth_getBlockByNumber",
+                                       [hex(block_number), False])
+        if self.nonce is None:
+            self.nonce = await self.get_pending_nonce()
+        self.block_number = block_number
+        self.block_hash = block_hash
+        self.max_fee = 2 * int(block.get("baseFeePerGas", "0x0"), 16) + \
+            self.priority_fee
+
+    @staticmethod
+    def is_executable(forward_path: Path, backward_path: Path) -> bool:
+        """
+        startArbitrage flash swaps on a v2 pair and sells through a v2 router.
+        """
+        return not forward_path.is_v3 and not backward_path.is_v3
+
+    def is_funded(self, paths: list[Path]) -> bool:
+        """
+        MultiHopArb trades its own balance, a cycle can only start from a
+        token it holds.
+        """
+        return paths[0].from_token.name in self.funded_tokens
+
+    def encode_line(self, forward_path: Path, backward_path: Path,
+                    amount_in: float) -> str:
+        """
+        Encodes the startArbitrage calldata for a line and a USD amount_in.
+        """
+        return self.contract.startArbitrage.encode_input(
+            forward_path.from_token.address,
+            forward_path.to_token.address,
+            int(forward_path.from_token.get_relative_price(amount_in)),
+            forward_path.dex.pricing_contract.address,
+            backward_path.dex.pricing_contract.address,
+            forward_path.dex.factory.address)
+
+    def build_transaction(self, calldata: str, to: str = None) -> dict:
+        return {
+            "from": self.account.address,
+            "to": to or self.contract.address,
+            "data": calldata,
+            "value": 0,
+            "nonce": self.nonce,
+            "gas": self.gas_limit,
+            "maxFeePerGas": self.max_fee,
+            "maxPriorityFeePerGas": self.priority_fee,
+            "chainId": self.chain_id
+        }
+
+    async def simulate(self, transaction: dict) -> bool:
+        """
+        Runs the transaction with eth_call at the pinned block.
+        """
+        try:
+            await send_request("eth_call", [{"from": transaction["from"],
+                                             "to": transaction["to"],
+                                             "data": transaction["data"],
+                                             "gas": hex(transaction["gas"])},
+                                            hex(self.block_number)])
+            return True
+        except Exception:
+            return False
+
+    async def send(self, transaction: dict) -> str:
+        """
+        Signs the transaction off the event loop and sends it raw. Unlocked
+        accounts, like the development ones, are left to the node to sign.
+        """
+        if not hasattr(self.account, "private_key"):
+            return await send_request("eth_sendTransaction", [{
+                key: hex(value) if isinstance(value, int) else value
+                for key, value in transaction.items()}])
+        signed = await asyncio.get_running_loop().run_in_executor(
+            None, web3.eth.account.sign_transaction,
+            transaction, self.account.private_key)
+        return await send_request("eth_sendRawTransaction",
+                                  ["0x" + bytes(signed.rawTransaction).hex()])
+
+    async def submit(self, transaction: dict) -> str:
+        """
+        Signs and sends the transaction, returns None if the pinned block
+        is already stale, or orphaned, or the node refuses it.
+        """
+        number, block_hash, _ = normalize_header(
+            await send_request("eth_getBlockByNumber", ["latest", False]))
+        if number != self.block_number or \
+                (self.block_hash and block_hash != self.block_hash):
+            return None
+        try:
+            tx_hash = await self.send(transaction)
+        except Exception:
+            self.nonce = await self.get_pending_nonce()
+            return None
+        self.nonce += 1
+        return tx_hash
+
+    async def execute(self, name: str, encode, to: str = None) -> str:
+        """
+        Encodes via the given callable, simulates and submits.
+        Returns the transaction hash if it was sent.
+        """
+        start_time = time.perf_counter()
+        transaction = self.build_transaction(encode(), to)
+        encode_time = time.perf_counter()
+        simulated = await self.simulate(transaction)
+        simulate_time = time.perf_counter()
+        tx_hash = await self.submit(transaction) if simulated else None
+        submit_time = time.perf_counter()
+
+        latency = {
+            "block": self.block_number,
+            "name": name,
+            "encode": encode_time - start_time,
+            "simulate": simulate_time - encode_time,
+            "submit": submit_time - simulate_time,
+            "tx_hash": tx_hash
+        }
+        self.latencies.append(latency)
+        logging.info("Execution {name} at {block}: encode {encode:.4f}s, "
+                     "simulate {simulate:.4f}s, submit {submit:.4f}s, "
+                     "tx {tx_hash}".format(**latency))
+        return tx_hash
+
+    async def execute_line(self, forward_path: Path, backward_path: Path,
+                           amount_in: float) -> str:
+        """
+        Encodes, simulates and submits a line arbitrage.
+        """
+        if not self.is_executable(forward_path, backward_path):
+            return None
+        return await self.execute(
+            Path.get_line_string(forward_path, backward_path),
+            lambda: self.encode_line(forward_path, backward_path, amount_in))
+
+    async def execute_triangle(self, left_path: Path, middle_path: Path,
+                               right_path: Path, amount_in: float) -> str:
+        """
+        Encodes, simulates and submits a triangle through MultiHopArb.
+        """
+        if not self.multihop or not self.is_funded([left_path]):
+            return None
+        return await self.execute(
+            Path.get_triangle_string(left_path, middle_path, right_path),
+            lambda: encode_route(self.multihop,
+                                 [left_path, middle_path, right_path],
+                                 amount_in),
+            self.multihop.address)
@@ -0,0 +1,228 @@
+import atexit
+import json
+import math
+import os
+import statistics
+import struct
+from multiprocessing import resource_tracker, shared_memory
+from models.market import Path
+from models.data import Data
+from helpers.snapshot import MarketSnapshot
+
+MAGIC = b"RHIST001"
+HEADER = struct.Struct("<8sQQQQQ")
+HEADER_SIZE = 64
+DEFAULT_CAPACITY = 1024
+
+
+def align(size: int) -> int:
+    return size + -size % 8
+
+
+class ReserveHistory:
+    """
+    Ring buffer of the reserves of every path over the last capacity
+    blocks, kept in a shared memory segment so other processes can read it
+    without going through the bot.
+    v2 paths store their reserves, v3 paths the virtual reserves of their
+    current tick range, both ordered in the direction of the path.
+
+    Layout, little endian:
+        header   magic, capacity, path count, sequence, blocks written,
+                 length of the path names
+        names    json list of path names, padded to 8 bytes
+        blocks   int64[capacity] block numbers
+        reserves float64[2][path count][capacity], reserve_in then
+                 reserve_out, so the history of one path is contiguous
+
+    The sequence is odd while a block is being written, readers retry
+    when it changed under them. blocks and reserves are plain memoryviews
+    of the segment, numpy.frombuffer(history.reserves) maps them without
+    a copy.
+    """
+
+    def __init__(self, segment: shared_memory.SharedMemory,
+                 owner: bool) -> None:
+        self.segment = segment
+        self.owner = owner
+        (magic, self.capacity, self.path_count, _, _,
+         names_length) = HEADER.unpack_from(segment.buf, 0)
+        assert magic == MAGIC, "{} is not a reserve history".format(segment.name)
+        self.path_names = json.loads(
+            bytes(segment.buf[HEADER_SIZE:HEADER_SIZE + names_length]))
+        self.index = {name: i for i, name in enumerate(self.path_names)}
+
+        self.header = segment.buf[:HEADER_SIZE].cast("Q")
+        offset = HEADER_SIZE + align(names_length)
+        self.blocks = segment.buf[offset:offset + 8 * self.capacity].cast("q")
+        offset += 8 * self.capacity
+        self.reserves = segment.buf[offset:].cast("d")
+        self.series_size = self.capacity * self.path_count
+
+    @staticmethod
+    def get_size(path_count: int, capacity: int, names_length: int) -> int:
+        return HEADER_SIZE + align(names_length) + 8 * capacity + \
+            16 * path_count * capacity
+
+    @staticmethod
+    def create(name: str,
+               paths: list[Path],
+               capacity: int = DEFAULT_CAPACITY) -> "ReserveHistory":
+        names = json.dumps([str(path) for path in paths]).encode()
+        try:
+            stale_segment = shared_memory.SharedMemory(name)
+            stale_segment.close()
+            stale_segment.unlink()
+        except FileNotFoundError:
+            pass
+        segment = shared_memory.SharedMemory(
+            name, create=True,
+            size=ReserveHistory.get_size(len(paths), capacity, len(names)))
+        segment.buf[:HEADER_SIZE] = bytes(HEADER_SIZE)
+        HEADER.pack_into(segment.buf, 0, MAGIC, capacity, len(paths),
+                         0, 0, len(names))
+        segment.buf[HEADER_SIZE:HEADER_SIZE + len(names)] = names
+        history = ReserveHistory(segment, owner=True)
+        history.paths = list(paths)
+        atexit.register(history.close)
+        return history
+
+    @staticmethod
+    def from_env() -> "ReserveHistory":
+        """
+        Creates the history of all healthy paths when RESERVE_HISTORY_BLOCKS
+        is set, the segment is named by RESERVE_HISTORY_NAME, suffixed with
+        the network when there are several.
+        """
+        capacity = Data.get_env("RESERVE_HISTORY_BLOCKS")
+        if not capacity:
+            return None
+        name = os.environ.get("RESERVE_HISTORY_NAME", "reserve_history")
+        if Data.network_name:
+            name += "_" + Data.network_name
+        return ReserveHistory.create(
+            name,
+            Path.get_all_v2_paths() + Path.get_all_v3_paths(),
+            int(capacity))
+
+    @staticmethod
+    def attach(name: str) -> "ReserveHistory":
+        """
+        Opens an existing history for reading, from any process.
+        """
+        try:
+            segment = shared_memory.SharedMemory(name, track=False)
+        except TypeError:
+            segment = shared_memory.SharedMemory(name)
+            # Before 3.13 attaching registers the segment with the resource
+            # tracker, which would unlink it when this process exits.
+            resource_tracker.unregister(segment._name, "shared_memory")
+        return ReserveHistory(segment, owner=False)
+
+    def resize(self, paths: list[Path]) -> "ReserveHistory":
+        """
+        Recreates the segment for a new set of paths, after a topology
+        swap. The blocks and the history of the paths which are kept carry
+        over, the added paths start empty. Readers attached to the old
+        segment keep reading it until they attach again.
+        """
+        history = ReserveHistory.create(self.segment.name, paths, self.capacity)
+        history.blocks[:] = self.blocks
+        history.header[4] = self.count
+        for j, path_name in enumerate(history.path_names):
+            i = self.index.get(path_name)
+            if i is None:
+                continue
+            for offset, old_offset in [(0, 0),
+                                       (history.series_size, self.series_size)]:
+                start = offset + j * self.capacity
+                old_start = old_offset + i * self.capacity
+                history.reserves[start:start + self.capacity] = \
+                    self.reserves[old_start:old_start + self.capacity]
+        # create unlinked the old segment, its name is the new one's now.
+        self.owner = False
+        atexit.unregister(self.close)
+        self.close()
+        return history
+
+    @property
+    def sequence(self) -> int:
+        return self.header[3]
+
+    @property
+    def count(self) -> int:
+        return self.header[4]
+
+    def record(self, snapshot: MarketSnapshot) -> None:
+        """
+        Appends the reserves of a snapshot as one block.
+        """
+        slot = self.count % self.capacity
+        reserves = self.reserves
+        out_offset = self.series_size
+        self.header[3] += 1
+        self.blocks[slot] = snapshot.block_number
+        for i, path in enumerate(self.paths):
+            reserve_in, reserve_out = snapshot.get_reserves(path)
+            position = i * self.capacity + slot
+            reserves[position] = reserve_in
+            reserves[out_offset + position] = reserve_out
+        self.header[4] += 1
+        self.header[3] += 1
+
+    def read(self, view: memoryview, offset: int,
+             slot: int, window: int) -> list:
+        """
+        Reads the window of slots ending before slot, as at most two slices.
+        """
+        first = slot - window
+        if first >= 0:
+            return view[offset + first:offset + slot].tolist()
+        return view[offset + self.capacity + first:offset + self.capacity].tolist() + \
+            view[offset:offset + slot].tolist()
+
+    def get_window(self, path_name: str,
+                   length: int = None) -> tuple[list[int], list[float], list[float]]:
+        """
+        Returns the block numbers, reserve_in and reserve_out of a path over
+        the last length blocks, oldest first.
+        """
+        start = self.index[path_name] * self.capacity
+        while True:
+            sequence = self.sequence
+            if sequence % 2:
+                continue
+            count = self.count
+            window = min(count, self.capacity) if length is None else \
+                min(length, count, self.capacity)
+            slot = count % self.capacity
+            blocks = self.read(self.blocks, 0, slot, window)
+            reserve_ins = self.read(self.reserves, start, slot, window)
+            reserve_outs = self.read(self.reserves, self.series_size + start,
+                                     slot, window)
+            if self.sequence == sequence:
+                return blocks, reserve_ins, reserve_outs
+
+    def get_volatility(self, path_name: str, length: int = None) -> float:
+        """
+        Standard deviation of the block to block log returns of the price
+        of a path, 0 without enough history.
+        """
+        _, reserve_ins, reserve_outs = self.get_window(path_name, length)
+        prices = [math.log(reserve_out / reserve_in)
+                  for reserve_in, reserve_out in zip(reserve_ins, reserve_outs)
+                  if reserve_in > 0 and reserve_out > 0]
+        returns = [current - previous
+                   for previous, current in zip(prices, prices[1:])]
+        if len(returns) < 2:
+            return 0
+        return statistics.stdev(returns)
+
+    def close(self) -> None:
+        self.header.release()
+        self.blocks.release()
+        self.reserves.release()
+        self.segment.close()
+        if self.owner:
+            self.segment.unlink()
+            self.owner = False
@@ -3,15 +3,18 @@ import os
 import io
 import time
 from contextlib import redirect_stderr
+import aiohttp
 from dotenv import load_dotenv
 from models.data import Data
 from models.market import Path
+from helpers.rpc import ProviderPool
 from helpers.utility import get_healthy_loops_report, get_healthy_triangles_report
 from helpers.paths import (
     generate_healthy_path_names,
     load_healthy_loops,
     generate_healthy_loop_names,
     generate_healthy_pairs,
+    generate_healthy_pools,
     generate_healthy_triangle_names,
     load_healthy_triangles
 )
@@ -23,13 +26,23 @@ with redirect_stderr(dummy_stderr):
     from dank_mids import setup_dank_w3_from_sync
 
 
-def connect(network_name: str) -> None:
+def connect(network_name: str,
+            primary: bool = True,
+            session: aiohttp.ClientSession = None) -> None:
     """
     Connects to the network specified by network_name.
+    If RPC_ENDPOINTS is set, a provider pool over them is created as well.
+    Brownie holds a single network per process, so the other networks are
+    read through their provider pool alone.
     """
     load_dotenv()
-    if not network.is_connected():
+    if primary and not network.is_connected():
         network.connect(network_name)
+    if Data.rpc_pool is None:
+        Data.rpc_pool = ProviderPool.from_env(session)
+    if not primary and Data.rpc_pool is None:
+        raise ValueError("{} is read through a provider pool, set {}".format(
+            network_name, Data.get_env_name("RPC_ENDPOINTS")))
 
 
 def load_main_contracts() -> tuple[dict[str, Contract],
@@ -43,6 +56,8 @@ def load_main_contracts() -> tuple[dict[str, Contract],
     router_abi = json.load(open(os.path.join(abi_folder, "router.json")))
     quoter_abi = json.load(open(os.path.join(abi_folder, "quoter.json")))
     factory_abi = json.load(open(os.path.join(abi_folder, "factory.json")))
+    v3_factory_abi = json.load(
+        open(os.path.join(abi_folder, "v3factory.json")))
 
     routers = {
         dex_name: Contract.from_abi(
@@ -62,7 +77,13 @@ def load_main_contracts() -> tuple[dict[str, Contract],
         for dex_name in Data.get_v2_dex_names()
     }
 
-    return factories, {**routers, **quoters}
+    v3_factories = {
+        "F" + dex_name: Contract.from_abi(
+            dex_name, Data.get_factory_address_from_name(dex_name), v3_factory_abi)
+        for dex_name in Data.get_v3_dex_names()
+    }
+
+    return {**factories, **v3_factories}, {**routers, **quoters}
 
 
 def load_pair_contracts() -> dict[str, Contract]:
@@ -71,7 +92,7 @@ def load_pair_contracts() -> dict[str, Contract]:
     """
     script_dir = os.path.dirname(os.path.abspath(__file__))
     abi_folder = os.path.join(script_dir, 'assets', 'abi')
-    pairs_file = os.path.join(script_dir, 'assets', 'healthy_pairs.json')
+    pairs_file = Data.get_asset_path('healthy_pairs.json')
 
     pair_abi = json.load(open(os.path.join(abi_folder, "pair.json")))
     pair_addresses = json.load(open(pairs_file))
@@ -87,38 +108,71 @@ def load_pair_contracts() -> dict[str, Contract]:
     return pairs
 
 
+def load_pool_contracts() -> dict[str, Contract]:
+    """
+    Loads v3 pool contracts via the local abis.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    abi_folder = os.path.join(script_dir, 'assets', 'abi')
+    pools_file = Data.get_asset_path('healthy_pools.json')
+
+    pool_abi = json.load(open(os.path.join(abi_folder, "pool.json")))
+    pool_addresses = json.load(open(pools_file))
+
+    pools = {
+        str(path): Contract.from_abi(
+            str(path),
+            pool_addresses[str(path)],
+            pool_abi)
+        for path in Path.get_all_v3_paths()
+    }
+
+    return pools
+
+
 async def setup(network_name: str = "mainnet",
-                reload_healthy: bool = False) -> None:
+                reload_healthy: bool = False,
+                primary: bool = True,
+                session: aiohttp.ClientSession = None) -> None:
     """
     Main initialization function. Reloads or generates 'healthy_loops' file
     if necessary. 
+    Networks other than the primary one need their healthy files, which
+    are generated by running them as the primary network.
     """
     start_time = time.perf_counter()
-    connect(network_name)
+    connect(network_name, primary, session)
     after_connect_time = time.perf_counter()
     print('Connection took {} seconds'.format(after_connect_time - start_time))
 
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    address_data_file = os.path.join(script_dir, 'assets', 'address_data.json')
-    paths_file = os.path.join(script_dir, 'assets', 'healthy_paths')
-    pairs_file = os.path.join(script_dir, 'assets', 'healthy_pairs.json')
-    triangles_file = os.path.join(
-        script_dir, 'assets', 'healthy_triangles.json')
+    address_data_file = Data.get_asset_path('address_data.json')
+    paths_file = Data.get_asset_path('healthy_paths')
+    pairs_file = Data.get_asset_path('healthy_pairs.json')
+    pools_file = Data.get_asset_path('healthy_pools.json')
+    triangles_file = Data.get_asset_path('healthy_triangles.json')
 
     with open(address_data_file, 'r') as file:
         Data.address_data = json.load(file)
 
     Data.factories, Data.pricing_contracts = load_main_contracts()
 
-    dank_w3 = setup_dank_w3_from_sync(web3)
-    _ = [patch_contract(contract, dank_w3)
-         for contract in {**Data.factories,
-                          **Data.pricing_contracts}.values()]
-
     healthy_paths_exists = os.path.exists(paths_file)
     healthy_pairs_exists = os.path.exists(pairs_file)
+    healthy_pools_exists = os.path.exists(pools_file)
     healthy_triangles_exists = os.path.exists(triangles_file)
 
+    if primary:
+        dank_w3 = setup_dank_w3_from_sync(web3)
+        Data.dank_w3 = dank_w3
+        _ = [patch_contract(contract, dank_w3)
+             for contract in {**Data.factories,
+                              **Data.pricing_contracts}.values()]
+    elif reload_healthy or not all([healthy_paths_exists, healthy_pairs_exists,
+                                    healthy_pools_exists, healthy_triangles_exists]):
+        raise FileNotFoundError(
+            "The healthy files of {} in {} are missing, run it as the "
+            "primary network first".format(network_name, Data.assets_folder))
+
     if reload_healthy or not healthy_paths_exists:
         await generate_healthy_path_names()
         generate_healthy_loop_names()
@@ -128,8 +182,15 @@ async def setup(network_name: str = "mainnet",
         await generate_healthy_pairs()
     Data.pairs = load_pair_contracts()
 
-    _ = [patch_contract(pair_contract, dank_w3)
-         for pair_contract in Data.pairs.values()]
+    _ = [patch_contract(pair_contract, Data.dank_w3)
+         for pair_contract in Data.pairs.values() if primary]
+
+    if reload_healthy or not healthy_pools_exists:
+        await generate_healthy_pools()
+    Data.pools = load_pool_contracts()
+
+    _ = [patch_contract(pool_contract, Data.dank_w3)
+         for pool_contract in Data.pools.values() if primary]
 
     if reload_healthy or not healthy_triangles_exists:
         generate_healthy_triangle_names()
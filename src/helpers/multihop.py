@@ -0,0 +1,110 @@
+import asyncio
+import json
+import os
+from brownie import Contract
+from models.data import Data
+from models.market import Path
+from helpers.rpc import send_request
+
+CHECK_BATCH_SIZE = 50
+
+
+def load_multihop_contract(contract_address: str) -> Contract:
+    """
+    Loads the deployed MultiHopArb contract via the local abi.
+    """
+    script_dir = os.path.dirname(os.path.abspath(__file__))
+    abi_file = os.path.join(script_dir, 'assets', 'abi', 'multihop.json')
+
+    return Contract.from_abi("MultiHopArb",
+                             contract_address,
+                             json.load(open(abi_file)))
+
+
+def get_leg(path: Path) -> tuple[str, bool, bool]:
+    """
+    Returns the (pool, isV3, zeroForOne) leg struct for a given path.
+    """
+    is_v3 = path.is_v3
+    pool = Data.pools[str(path)] if is_v3 else Data.pairs[str(path)]
+
+    return (pool.address, is_v3, path.zero_for_one)
+
+
+def get_route(paths: list[Path]) -> list[tuple[str, bool, bool]]:
+    """
+    Returns the leg structs of a 2 or 3 leg cycle.
+    """
+    assert 2 <= len(paths) <= 3
+    assert all(Path.is_composable(start_path, return_path)
+               for start_path, return_path in zip(paths, paths[1:] + paths[:1]))
+
+    return [get_leg(path) for path in paths]
+
+
+def get_local_amount_in(paths: list[Path], amount_in: float) -> int:
+    return int(paths[0].from_token.get_relative_price(amount_in))
+
+
+def encode_route(contract: Contract,
+                 paths: list[Path],
+                 amount_in: float,
+                 min_profit: float = 0) -> str:
+    """
+    Encodes the execute calldata for a cycle, amounts are in USD.
+    execute trades the contract's own balance, so it has to hold amount_in
+    of the start token.
+    """
+    return contract.execute.encode_input(
+        get_route(paths),
+        get_local_amount_in(paths, amount_in),
+        int(paths[0].from_token.get_relative_price(min_profit)))
+
+
+async def call_check_many(contract: Contract,
+                          routes: list[list[Path]],
+                          amount_ins: list[float],
+                          block_number: int = None) -> list[int]:
+    """
+    checkMany quotes through the v3 quoter and so is not a view function,
+    it is only ever run with eth_call, never sent.
+    """
+    calldata = contract.checkMany.encode_input(
+        [get_route(paths) for paths in routes],
+        [get_local_amount_in(paths, amount_in)
+         for paths, amount_in in zip(routes, amount_ins)])
+    result = await send_request("eth_call", [
+        {"to": contract.address, "data": calldata},
+        hex(block_number) if block_number is not None else "latest"])
+    return contract.checkMany.decode_output(result)
+
+
+async def check_routes(contract: Contract,
+                       routes: list[list[Path]],
+                       amount_ins: list[float],
+                       block_number: int = None) -> list[float]:
+    """
+    Validates many cycles on chain via checkMany, in batches, at the given
+    block or the latest one.
+    Returns the USD profit of each cycle, -inf where the check reverted.
+    """
+    assert len(routes) == len(amount_ins)
+
+    batches = [(routes[i:i + CHECK_BATCH_SIZE],
+                amount_ins[i:i + CHECK_BATCH_SIZE])
+               for i in range(0, len(routes), CHECK_BATCH_SIZE)]
+    results = await asyncio.gather(
+        *[call_check_many(contract, batch_routes, batch_amount_ins,
+                          block_number)
+          for batch_routes, batch_amount_ins in batches])
+
+    profits = []
+    for (batch_routes, _), batch_profits in zip(batches, results):
+        for paths, profit in zip(batch_routes, batch_profits):
+            if profit == -2**255:
+                profits.append(float("-inf"))
+            else:
+                profits.append(
+                    paths[0].from_token.recover_original_price(profit))
+
+    return profits
@@ -0,0 +1,95 @@
+import asyncio
+import logging
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from models.data import Data
+from helpers.rpc import ProviderPool
+
+
+def get_network_names() -> list[str]:
+    """
+    The comma separated brownie network ids of NETWORKS, the first one is
+    the primary network, which brownie connects to and which executes.
+    """
+    return [name.strip() for name in os.environ.get("NETWORKS", "").split(",")
+            if name.strip()]
+
+
+class NetworkMetrics:
+    """
+    One view over every network the process scans: blocks, time per block,
+    opportunities, reorgs, the opportunities they invalidated and the
+    multicall counters of each.
+    """
+
+    def __init__(self) -> None:
+        self.networks = {}
+
+    def record(self, block_number: int, duration: float,
+               opportunities: int) -> None:
+        """
+        Records a block of the current network.
+        """
+        metrics = self.networks.setdefault(Data.network_name, {
+            "blocks": 0, "time": 0, "opportunities": 0})
+        metrics["block"] = block_number
+        metrics["blocks"] += 1
+        metrics["time"] += duration
+        metrics["opportunities"] += opportunities
+        metrics["reorgs"] = Data.state.reorgs if Data.state else 0
+        metrics["invalidated"] = Data.state.invalidated if Data.state else 0
+        metrics["multicall"] = dict(Data.batch_controller.metrics) \
+            if Data.batch_controller else {}
+        metrics["updated"] = time.time()
+
+    def get_report(self) -> str:
+        return "\n".join(
+            "{} block {} after {} blocks, {:.3f}s per block, {} opportunities, "
+            "{} reorgs invalidating {}, {} calls in {} requests".format(
+                network_name, metrics["block"], metrics["blocks"],
+                metrics["time"] / metrics["blocks"], metrics["opportunities"],
+                metrics["reorgs"], metrics["invalidated"],
+                metrics["multicall"].get("calls", 0),
+                metrics["multicall"].get("requests", 0))
+            for network_name, metrics in sorted(self.networks.items()))
+
+
+network_metrics = NetworkMetrics()
+
+
+async def run_networks(network_names: list[str],
+                       run_network,
+                       worker_threads: int = None) -> dict[str, Exception]:
+    """
+    Awaits run_network(network_name, primary, session) for every network
+    on the running loop. Each network runs in a task of its own, which
+    works on a fresh namespace of Data, so the networks share the loop,
+    one thread pool for blocking calls and one HTTP session, and so its
+    keep-alive connections, but nothing else.
+    A network which fails is logged and stops alone, the session is
+    closed once every network is done. Returns the exception of each
+    failed network.
+    """
+    loop = asyncio.get_running_loop()
+    loop.set_default_executor(ThreadPoolExecutor(worker_threads))
+    session = ProviderPool.create_session()
+
+    async def run(network_name: str, primary: bool) -> None:
+        Data.use(Data.create_network_namespace(network_name))
+        try:
+            await run_network(network_name, primary, session)
+        except Exception as e:
+            logging.exception("Network {} stopped".format(network_name))
+            raise e
+
+    try:
+        results = await asyncio.gather(
+            *[run(network_name, i == 0)
+              for i, network_name in enumerate(network_names)],
+            return_exceptions=True)
+    finally:
+        await session.close()
+    return {network_name: result
+            for network_name, result in zip(network_names, results)
+            if isinstance(result, Exception)}
@@ -1,4 +1,3 @@
-import os
 import time
 import json
 import asyncio
@@ -25,8 +24,7 @@ async def generate_healthy_pairs() -> None:
     Generates all possible pairs of tokens.
     """
     start_time = time.perf_counter()
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    pairs_file = os.path.join(script_dir, 'assets', 'healthy_pairs.json')
+    pairs_file = Data.get_asset_path('healthy_pairs.json')
     v2_paths = Path.get_all_v2_paths()
 
     pair_addresses = await asyncio.gather(
@@ -42,12 +40,43 @@ async def generate_healthy_pairs() -> None:
         end_time - start_time))
 
 
+async def get_pool_address_from_path(path: Path) -> str:
+    """
+    Returns the v3 pool address for a given path.
+    """
+    return await asyncio.gather(
+        *[path.dex.factory.getPool.coroutine(
+            path.from_token.address,
+            path.to_token.address,
+            path.dex.fee)])
+
+
+async def generate_healthy_pools() -> None:
+    """
+    Generates the v3 pool addresses of the healthy v3 paths.
+    """
+    start_time = time.perf_counter()
+    pools_file = Data.get_asset_path('healthy_pools.json')
+    v3_paths = Path.get_all_v3_paths()
+
+    pool_addresses = await asyncio.gather(
+        *[get_pool_address_from_path(path) for path in v3_paths])
+    pool_addresses = [pool_address[0] for pool_address in pool_addresses]
+    indexed_pool_addresses = dict(zip([str(path) for path in v3_paths],
+                                      pool_addresses))
+    with open(pools_file, "w") as file:
+        json.dump(indexed_pool_addresses, file, indent=4)
+
+    end_time = time.perf_counter()
+    print("Generated healthy_pools.json in {} seconds".format(
+        end_time - start_time))
+
+
 def load_healthy_pair_names() -> list[Path]:
     """
     Loads the healthy paths from the file 'healthy_paths'.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    paths_file = os.path.join(script_dir, 'assets', 'healthy_pairs.json')
+    paths_file = Data.get_asset_path('healthy_pairs.json')
 
     with open(paths_file, 'r') as file:
         healthy_pair_names = json.load(file)
@@ -73,29 +102,39 @@ def generate_all_paths() -> list[Path]:
     return all_paths
 
 
+async def get_healthy_paths(paths: list[Path],
+                            base_amount_in: float = 100) -> list[Path]:
+    """
+    Returns the paths which pass pricing calculation successfully.
+    """
+    path_count = len(paths)
+    path_results = (await asyncio.gather(
+        *[direct_initialization_prices(paths,
+                                       [base_amount_in]*path_count)]))[0]
+    reverse_results = (await asyncio.gather(
+        *[reverse_initialization_prices(paths,
+                                        [base_amount_in]*path_count)]))[0]
+    healthy_paths = []
+    for path, price in path_results.items():
+        if price > base_amount_in / 3 and price < base_amount_in * 3:
+            if reverse_results[path] > base_amount_in / 2 and reverse_results[path] < base_amount_in * 2:
+                healthy_paths.append(path)
+
+    return healthy_paths
+
+
 async def generate_healthy_path_names() -> None:
     """
     Generate the list of path names which pass pricing calculation successfully.
     Write them to the file 'healthy_paths'
     """
     start_time = time.perf_counter()
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    paths_file = os.path.join(script_dir, 'assets', 'healthy_paths')
-    base_amount_in = 100
-    all_paths = generate_all_paths()
-    path_count = len(all_paths)
+    paths_file = Data.get_asset_path('healthy_paths')
+    healthy_paths = await get_healthy_paths(generate_all_paths())
 
     with open(paths_file, "w") as file:
-        path_results = (await asyncio.gather(
-            *[direct_initialization_prices(all_paths,
-                                           [base_amount_in]*path_count)]))[0]
-        reverse_results = (await asyncio.gather(
-            *[reverse_initialization_prices(all_paths,
-                                            [base_amount_in]*path_count)]))[0]
-        for path, price in path_results.items():
-            if price > base_amount_in / 3 and price < base_amount_in * 3:
-                if reverse_results[path] > base_amount_in / 2 and reverse_results[path] < base_amount_in * 2:
-                    file.write("{}\n".format(str(path)))
+        for path in healthy_paths:
+            file.write("{}\n".format(str(path)))
 
     end_time = time.perf_counter()
     print("Generated healthy_paths in {} seconds".format(
@@ -106,26 +145,18 @@ def load_healthy_path_names() -> list[str]:
     """
     Loads the healthy paths from the file 'healthy_paths'.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    paths_file = os.path.join(script_dir, 'assets', 'healthy_paths')
+    paths_file = Data.get_asset_path('healthy_paths')
 
     with open(paths_file, 'r') as file:
         return [path.strip() for path in file.readlines()]
 
 
-def generate_healthy_loop_names() -> None:
+def get_loop_names(healthy_path_names: list[str]) -> dict[str, list[str]]:
     """
-    Generate the list of loop names via composition of healthy paths.
-    Write them to the file 'healthy_loops.json'
+    Composes the loop names of healthy paths.
     """
-    start_time = time.perf_counter()
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    loops_file = os.path.join(script_dir, 'assets', 'healthy_loops.json')
-    healthy_path_names = load_healthy_path_names()
     loops = defaultdict(list)
-
-    print('In total there are {} healthy paths.'.format(len(healthy_path_names)))
-
+    healthy_path_set = set(healthy_path_names)
     for path_name in healthy_path_names:
         path_dex_name, path_from_token_name, path_to_token_name = path_name.split(
             ' ')
@@ -134,11 +165,25 @@ def generate_healthy_loop_names() -> None:
                                                     path_to_token_name,
                                                     path_from_token_name)
             if candidate_dex_name != path_dex_name \
-                    and candidate_path_name in healthy_path_names:
+                    and candidate_path_name in healthy_path_set:
                 loops[path_name].append(candidate_path_name)
 
+    return loops
+
+
+def generate_healthy_loop_names() -> None:
+    """
+    Generate the list of loop names via composition of healthy paths.
+    Write them to the file 'healthy_loops.json'
+    """
+    start_time = time.perf_counter()
+    loops_file = Data.get_asset_path('healthy_loops.json')
+    healthy_path_names = load_healthy_path_names()
+
+    print('In total there are {} healthy paths.'.format(len(healthy_path_names)))
+
     with open(loops_file, "w") as file:
-        json.dump(loops, file, indent=4)
+        json.dump(get_loop_names(healthy_path_names), file, indent=4)
 
     end_time = time.perf_counter()
     print("Generated healthy_loops.json in {} seconds".format(
@@ -149,32 +194,27 @@ def load_healthy_loops() -> dict[Path, list[Path]]:
     """
     Loads the healthy loops from the file 'healthy_loops.json'.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    loops_file = os.path.join(script_dir, 'assets', 'healthy_loops.json')
+    loops_file = Data.get_asset_path('healthy_loops.json')
 
     with open(loops_file, 'r') as file:
-        healthy_loop_names = json.load(file)
-        loops = {}
-        for forward_path_name, backward_path_names in healthy_loop_names.items():
-            forward_path = Path.get_path_from_name(
-                *forward_path_name.split(' '))
-            backward_paths = [Path.get_path_from_name(*backward_path_name.split(' '))
-                              for backward_path_name in backward_path_names]
-            loops[forward_path] = backward_paths
+        return get_loops(json.load(file))
+
+
+def get_loops(loop_names: dict[str, list[str]]) -> dict[Path, list[Path]]:
+    loops = {}
+    for forward_path_name, backward_path_names in loop_names.items():
+        forward_path = Path.get_path_from_name(
+            *forward_path_name.split(' '))
+        backward_paths = [Path.get_path_from_name(*backward_path_name.split(' '))
+                          for backward_path_name in backward_path_names]
+        loops[forward_path] = backward_paths
     return loops
 
 
-def generate_healthy_triangle_names() -> None:
+def get_triangle_names(healthy_path_names: list[str]) -> dict[str, dict[str, list[str]]]:
     """
-    Generate the list of triangle names via composition of healthy paths.
-    Write them to the file 'healthy_triangles.json'
+    Composes the triangle names of healthy paths.
     """
-    start_time = time.perf_counter()
-
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    triangles_file = os.path.join(
-        script_dir, 'assets', 'healthy_triangles.json')
-    healthy_path_names = load_healthy_path_names()
     path_names = [path_name.split(' ') for path_name in healthy_path_names]
     left_map = defaultdict(list)
     right_map = defaultdict(list)
@@ -192,6 +232,19 @@ def generate_healthy_triangle_names() -> None:
                     triangles[' '.join(middle_path_name)][' '.join(left_path_name)].append(
                         ' '.join(right_path_name))
 
+    return triangles
+
+
+def generate_healthy_triangle_names() -> None:
+    """
+    Generate the list of triangle names via composition of healthy paths.
+    Write them to the file 'healthy_triangles.json'
+    """
+    start_time = time.perf_counter()
+
+    triangles_file = Data.get_asset_path('healthy_triangles.json')
+    triangles = get_triangle_names(load_healthy_path_names())
+
     with open(triangles_file, "w") as file:
         json.dump(triangles, file, indent=4)
 
@@ -205,22 +258,25 @@ def load_healthy_triangles() -> dict[Path, dict[Path, Path]]:
     """
     Loads the healthy triangles from the file 'healthy_triangles.json'.
     """
-    script_dir = os.path.dirname(os.path.abspath(__file__))
-    triangles_file = os.path.join(
-        script_dir, 'assets', 'healthy_triangles.json')
+    triangles_file = Data.get_asset_path('healthy_triangles.json')
 
     with open(triangles_file, 'r') as file:
-        healthy_triangle_names = json.load(file)
-        triangles = defaultdict(lambda: defaultdict(list))
-        for middle_path_name, ear_paths in healthy_triangle_names.items():
-            for left_path_name, right_path_names in ear_paths.items():
-                for right_path_name in right_path_names:
-                    middle_path = Path.get_path_from_name(
-                        *middle_path_name.split(' '))
-                    left_path = Path.get_path_from_name(
-                        *left_path_name.split(' '))
-                    right_path = Path.get_path_from_name(
-                        *right_path_name.split(' '))
-                    triangles[middle_path][left_path].append(right_path)
+        return get_triangles(json.load(file))
 
-    return triangles
+
+def get_triangles(triangle_names: dict[str, dict[str, list[str]]]) -> dict[Path, dict[Path, list[Path]]]:
+    triangles = defaultdict(lambda: defaultdict(list))
+    for middle_path_name, ear_paths in triangle_names.items():
+        for left_path_name, right_path_names in ear_paths.items():
+            for right_path_name in right_path_names:
+                middle_path = Path.get_path_from_name(
+                    *middle_path_name.split(' '))
+                left_path = Path.get_path_from_name(
+                    *left_path_name.split(' '))
+                right_path = Path.get_path_from_name(
+                    *right_path_name.split(' '))
+                triangles[middle_path][left_path].append(right_path)
+
+    # Plain dicts, so that the triangles pickle along with the snapshots.
+    return {middle_path: dict(ear_paths)
+            for middle_path, ear_paths in triangles.items()}
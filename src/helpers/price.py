@@ -1,6 +1,50 @@
 import asyncio
+import io
+from contextlib import redirect_stderr
+from typing import TYPE_CHECKING
+from brownie.exceptions import VirtualMachineError
+from web3.exceptions import BadFunctionCallOutput, ContractLogicError
 from models.market import Path
 from models.data import Data
+from helpers.calls import (GET_RESERVES,
+                           LIQUIDITY,
+                           SLOT0,
+                           ReserveReader,
+                           StateReader,
+                           aggregate,
+                           get_batch_controller,
+                           get_quote_templates)
+from helpers.rpc import RPCError
+
+if TYPE_CHECKING:
+    from helpers.snapshot import MarketSnapshot
+
+dummy_stderr = io.StringIO()
+with redirect_stderr(dummy_stderr):
+    try:
+        from dank_mids._exceptions import BadResponse
+        DANK_MIDS_ERRORS = (BadResponse,)
+    except ImportError:
+        DANK_MIDS_ERRORS = ()
+
+# What a reverted quote raises through brownie, web3, dank_mids' batches
+# or the raw RPC. web3 v6 reverts are ContractLogicErrors, which are no
+# longer ValueErrors, an empty return is a BadFunctionCallOutput.
+QUOTE_ERRORS = (ValueError, VirtualMachineError, RPCError,
+                ContractLogicError, BadFunctionCallOutput) + DANK_MIDS_ERRORS
+
+
+def record_quote_error(path: Path, error: Exception) -> None:
+    """
+    Counts a failed quote against its path, unless it merely reverted, as
+    the quotes of amounts beyond a pool's depth do during size searches.
+    """
+    batch_controller = get_batch_controller()
+    if isinstance(error, (VirtualMachineError, ContractLogicError)) or \
+            "revert" in str(error):
+        batch_controller.errors[type(error).__name__] += 1
+        return
+    batch_controller.record(str(path), False, error)
 
 
 def direct_sync_price(path: Path, amount_in: float) -> float:
@@ -10,7 +54,7 @@ def direct_sync_price(path: Path, amount_in: float) -> float:
     """
     local_amount_in = path.from_token.get_relative_price(amount_in)
     try:
-        if path.dex.name.endswith("v3"):
+        if path.is_v3:
             amount_out = path.dex.pricing_contract.quoteExactInputSingle.call(
                 (
                     path.from_token.address,
@@ -24,33 +68,7 @@ def direct_sync_price(path: Path, amount_in: float) -> float:
             amount_out = path.dex.pricing_contract.getAmountsOut(local_amount_in,
                                                                  path.get_address_path())[1]
         return path.to_token.recover_original_price(amount_out)
-    except:
-        return 0
-
-
-def reverse_sync_price(path: Path, amount_out: float) -> float:
-    """
-    Syncronous wrapper for both v2 and v3.
-    Reverse direction.
-    """
-    local_amount_out = path.to_token.get_relative_price(amount_out)
-    try:
-        if path.dex.name.endswith("v3"):
-            amount_in = path.dex.pricing_contract.quoteExactOutputSingle.call(
-                (
-                    path.from_token.address,
-                    path.to_token.address,
-                    local_amount_out,
-                    3000,
-                    0
-                )
-            )
-            amount_in = amount_in[0]
-        else:
-            amount_in = path.dex.pricing_contract.getAmountsIn(local_amount_out,
-                                                               path.get_address_path())[0]
-        return path.from_token.recover_original_price(amount_in)
-    except:
+    except QUOTE_ERRORS:
         return 0
 
 
@@ -67,62 +85,126 @@ def get_amount_out(amount_in: float,
     return numerator // denominator
 
 
-def get_amount_in(amount_out: float,
-                  reserve_in: float,
-                  reserve_out: float) -> float:
-    """
-    Simulates v2's router.getAmountsIn() function.
-    """
-    numerator = reserve_in * amount_out * 1000
-    denominator = (reserve_out - amount_out) * 997
-    return numerator // denominator + 1
-
-
-async def get_v2_reserves(path: Path) -> tuple[float,
-                                               tuple[float, float]]:
+async def get_v2_reserves(path: Path,
+                          block_identifier="latest") -> tuple[float,
+                                                              tuple[float, float]]:
     """
     Gets the reserves for a given path.
     """
     pair = Data.pairs[str(path)]
-    reserve_result = await asyncio.gather(*[pair.getReserves.coroutine()])
-    default_direction = int(path.from_token.address, 16) < \
-        int(path.to_token.address, 16)
+    reserve_result = await asyncio.gather(
+        *[pair.getReserves.coroutine(block_identifier=block_identifier)])
     r1, r2, _ = reserve_result[0]
-    if not default_direction:
+    if not path.zero_for_one:
         (r1, r2) = (r2, r1)
 
     return (path, (r1, r2))
 
 
-async def update_v2_reserves() -> None:
+async def fetch_v2_reserves(block_identifier="latest") -> dict[Path, tuple[int, int]]:
     """
-    Updates the reserves for all v2 paths.
+    Returns the reserves of all v2 paths.
+    With a provider pool, the cached raw multicalls are used.
     """
+    if Data.rpc_pool:
+        if Data.reserve_reader is None:
+            Data.reserve_reader = ReserveReader(
+                Path.get_all_v2_paths(),
+                {name: pair.address for name, pair in Data.pairs.items()})
+        return await Data.reserve_reader.fetch(block_identifier)
+
     reserves = (await asyncio.gather(
-        *[get_v2_reserves(path) for path in Path.get_all_v2_paths()]))
+        *[get_v2_reserves(path, block_identifier)
+          for path in Path.get_all_v2_paths()]))
 
-    Data.reserves = {path: reserve
-                     for path, reserve in reserves}
+    return {path: reserve
+            for path, reserve in reserves}
 
 
-def direct_V2_reserve_price(path: Path, amount_in: float) -> float:
+async def get_v3_state(path: Path,
+                       block_identifier="latest") -> tuple[Path,
+                                                           tuple[int, int]]:
     """
-    Uses the reserves to calculate the price for a given amount_in and path.
+    Gets the sqrtPriceX96 and the in-range liquidity for a given v3 path.
     """
-    r1, r2 = Data.reserves[path]
-    local_amount_in = path.from_token.get_relative_price(amount_in)
-    amount_out = get_amount_out(local_amount_in, r1, r2)
-    return path.to_token.recover_original_price(amount_out)
+    pool = Data.pools[str(path)]
+    slot0, liquidity = await asyncio.gather(
+        pool.slot0.coroutine(block_identifier=block_identifier),
+        pool.liquidity.coroutine(block_identifier=block_identifier))
+    return (path, (slot0[0], liquidity))
+
+
+async def fetch_v3_states(block_identifier="latest") -> dict[Path, tuple[int, int]]:
+    """
+    Returns the pool states of all v3 paths.
+    """
+    if Data.rpc_pool:
+        if Data.state_reader is None:
+            Data.state_reader = StateReader(
+                Path.get_all_v3_paths(),
+                {name: pool.address for name, pool in Data.pools.items()})
+        return await Data.state_reader.fetch(block_identifier)
+
+    states = (await asyncio.gather(
+        *[get_v3_state(path, block_identifier)
+          for path in Path.get_all_v3_paths()]))
+
+    return {path: state
+            for path, state in states}
 
 
-def reverse_V2_reserve_price(path: Path, amount_out: float) -> float:
+async def get_path_states(paths: list[Path],
+                          block_identifier="latest") -> tuple[dict, dict]:
     """
-    Uses the reserves to calculate the price for a given amount_out and path.
+    Reads the reserves and v3 states of some paths in raw multicalls,
+    each pair or pool once. Returns them like fetch_v2_reserves and
+    fetch_v3_states.
     """
-    r1, r2 = Data.reserves[path]
-    local_amount_out = path.to_token.get_relative_price(amount_out)
-    amount_in = get_amount_in(local_amount_out, r1, r2)
-    return path.from_token.recover_original_price(amount_in)
+    addresses = {path: (Data.pools[str(path)] if path.is_v3
+                        else Data.pairs[str(path)]).address for path in paths}
+    unique_addresses = list(dict.fromkeys(addresses.values()))
+    v3_addresses = {addresses[path] for path in paths if path.is_v3}
+    calls = []
+    for address in unique_addresses:
+        if address in v3_addresses:
+            calls.extend([(address, SLOT0), (address, LIQUIDITY)])
+        else:
+            calls.append((address, GET_RESERVES))
+    results = iter(await aggregate(calls, block_identifier))
+
+    words = {}
+    for address in unique_addresses:
+        data = [next(results) for _ in range(2 if address in v3_addresses else 1)]
+        if any(result is None for result in data):
+            words[address] = (0, 0)
+        elif address in v3_addresses:
+            words[address] = (int.from_bytes(data[0][0:32], "big"),
+                              int.from_bytes(data[1][0:32], "big"))
+        else:
+            words[address] = (int.from_bytes(data[0][0:32], "big"),
+                              int.from_bytes(data[0][32:64], "big"))
+
+    reserves = {}
+    v3_states = {}
+    for path, address in addresses.items():
+        if path.is_v3:
+            v3_states[path] = words[address]
+        elif path.zero_for_one:
+            reserves[path] = words[address]
+        else:
+            reserves[path] = words[address][::-1]
+    return reserves, v3_states
+
+
+def direct_V2_reserve_price(path: Path, amount_in: float,
+                            snapshot: "MarketSnapshot") -> float:
+    """
+    Uses the reserves to calculate the price for a given amount_in and path.
+    """
+    r1, r2 = snapshot.reserves[path]
+    local_amount_in = path.from_token.get_relative_price(amount_in)
+    amount_out = get_amount_out(local_amount_in, r1, r2)
+    return path.to_token.recover_original_price(amount_out)
 
 
 async def direct_V2_price(path: Path, amount_in: float) -> float:
@@ -130,34 +212,36 @@ async def direct_V2_price(path: Path, amount_in: float) -> float:
     Returns the exact quote for a given amount_in and path.
     For v2, uses dank_mid's multicall to make the calculations.
     """
-    price_to_be = await asyncio.gather(
-        *[path.dex.pricing_contract.
-            getAmountsOut.coroutine(
-                path.from_token.get_relative_price(amount_in),
-                path.get_address_path())])
     try:
-        return path.to_token.recover_original_price(price_to_be[0][1])
-    except:
+        price_to_be = await path.dex.pricing_contract.getAmountsOut.coroutine(
+            path.from_token.get_relative_price(amount_in),
+            path.get_address_path())
+    except QUOTE_ERRORS as e:
+        record_quote_error(path, e)
         return 0
+    get_batch_controller().record(str(path), True)
+    return path.to_token.recover_original_price(price_to_be[1])
 
 
-async def direct_V3_price(path: Path, amount_in: float) -> float:
+async def direct_V3_price(path: Path, amount_in: float,
+                          block_identifier="latest") -> float:
     """
     Returns the exact quote for a given amount_in and path.
     For v3, uses dank_mid's multicall to make the calculations.
     """
-    price_to_be = await asyncio.gather(
-        *[path.dex.pricing_contract.
-            quoteExactInputSingle.coroutine((
-                path.from_token.address,
-                path.to_token.address,
-                path.from_token.get_relative_price(amount_in),
-                path.dex.fee,
-                0))])
     try:
-        return path.to_token.recover_original_price(price_to_be[0][0])
-    except:
+        price_to_be = await path.dex.pricing_contract.quoteExactInputSingle.coroutine(
+            (path.from_token.address,
+             path.to_token.address,
+             path.from_token.get_relative_price(amount_in),
+             path.dex.fee,
+             0),
+            block_identifier=block_identifier)
+    except QUOTE_ERRORS as e:
+        record_quote_error(path, e)
         return 0
+    get_batch_controller().record(str(path), True)
+    return path.to_token.recover_original_price(price_to_be[0])
 
 
 async def reverse_V2_price(path: Path, amount_out: float) -> float:
@@ -165,38 +249,66 @@ async def reverse_V2_price(path: Path, amount_out: float) -> float:
     Returns the exact quote for a given amount_out and path.
     For v3, uses dank_mid's multicall to make the calculations.
     """
-    price_to_be = await asyncio.gather(
-        *[path.dex.pricing_contract.
-            getAmountsIn.coroutine(
-                path.to_token.get_relative_price(amount_out),
-                path.get_address_path())])
     try:
-        return path.from_token.recover_original_price(price_to_be[0][0])
-    except:
+        price_to_be = await path.dex.pricing_contract.getAmountsIn.coroutine(
+            path.to_token.get_relative_price(amount_out),
+            path.get_address_path())
+    except QUOTE_ERRORS as e:
+        record_quote_error(path, e)
         return 0
+    get_batch_controller().record(str(path), True)
+    return path.from_token.recover_original_price(price_to_be[0])
 
 
-async def reverse_V3_price(path: Path, amount_out: float) -> float:
+async def reverse_V3_price(path: Path, amount_out: float,
+                           block_identifier="latest") -> float:
     """
     Returns the exact quote for a given amount_out and path.
     For v3, uses dank_mid's multicall to make the calculations.
     """
-    price_to_be = await asyncio.gather(
-        *[path.dex.pricing_contract.
-            quoteExactOutputSingle.coroutine((
-                path.from_token.address,
-                path.to_token.address,
-                path.to_token.get_relative_price(amount_out),
-                path.dex.fee,
-                0))])
     try:
-        return path.from_token.recover_original_price(price_to_be[0][0])
-    except:
+        price_to_be = await path.dex.pricing_contract.quoteExactOutputSingle.coroutine(
+            (path.from_token.address,
+             path.to_token.address,
+             path.to_token.get_relative_price(amount_out),
+             path.dex.fee,
+             0),
+            block_identifier=block_identifier)
+    except QUOTE_ERRORS as e:
+        record_quote_error(path, e)
         return 0
+    get_batch_controller().record(str(path), True)
+    return path.from_token.recover_original_price(price_to_be[0])
+
+
+async def v3_prices(paths: list[Path],
+                    amounts: list[float],
+                    snapshot: "MarketSnapshot") -> list[float]:
+    """
+    Quotes v3 paths at the block of the snapshot, via raw multicalls when
+    there is a provider pool and via dank_mids otherwise. Quarantined
+    paths quote 0. Data.v3_quoter, a callable with the same arguments,
+    replaces the quoter when set.
+    """
+    if Data.v3_quoter:
+        return await Data.v3_quoter(paths, amounts, snapshot)
+    if Data.rpc_pool:
+        return await get_quote_templates().quote(paths, amounts,
+                                                 snapshot.block_identifier)
+    quotes = [0] * len(paths)
+    batch_controller = get_batch_controller()
+    indices = [i for i, path in enumerate(paths)
+               if not batch_controller.is_quarantined(str(path))]
+    for i, quote in zip(indices, await asyncio.gather(
+            *[direct_V3_price(paths[i], amounts[i], snapshot.block_identifier)
+              for i in indices])):
+        quotes[i] = quote
+    return quotes
 
 
 async def direct_prices(paths: list[Path],
-                        amount_ins: list[float]) -> dict[Path, float]:
+                        amount_ins: list[float],
+                        snapshot: "MarketSnapshot") -> dict[Path, float]:
     """
     Returns the exact quote for a list of amount_in and path pairs.
     """
@@ -206,47 +318,42 @@ async def direct_prices(paths: list[Path],
                     for path, amount_in in zip(paths, amount_ins)]
 
     v2_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v2")]
+                in filled_paths if not path.is_v3]
     v3_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v3")]
+                in filled_paths if path.is_v3]
 
-    v2_prices = [direct_V2_reserve_price(path, amount_in)
+    v2_prices = [direct_V2_reserve_price(path, amount_in, snapshot)
                  for (path, amount_in) in v2_paths]
-    v3_prices = await asyncio.gather(
-        *[direct_V3_price(path, amount_in) for (path, amount_in) in v3_paths])
+    v3_quotes = await v3_prices([path for (path, _) in v3_paths],
+                                [amount_in for (_, amount_in) in v3_paths],
+                                snapshot)
 
     amount_outs = {
         path:
         price for (path, _), price in
-        zip(v2_paths + v3_paths, v2_prices + v3_prices)}
+        zip(v2_paths + v3_paths, v2_prices + v3_quotes)}
 
     return amount_outs
 
 
-async def reverse_prices(paths: list[Path],
-                         amount_ins: list[float]) -> dict[Path, float]:
+async def direct_list_prices(paths: list[Path],
+                             amount_ins: list[float],
+                             snapshot: "MarketSnapshot") -> list[float]:
     """
-    Returns the exact quote for a list of amount_in and path pairs.
+    Similar to direct_prices but returns the amounts in the input order,
+    so the same path can be priced at many amounts.
     """
     assert len(paths) == len(amount_ins)
 
-    filled_paths = [(path, amount_in)
-                    for path, amount_in in zip(paths, amount_ins)]
-
-    v2_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v2")]
-    v3_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v3")]
-
-    v2_prices = [reverse_V2_reserve_price(path, amount_in)
-                 for (path, amount_in) in v2_paths]
-    v3_prices = await asyncio.gather(
-        *[reverse_V3_price(path, amount_in) for (path, amount_in) in v3_paths])
-
-    amount_outs = {
-        path:
-        price for (path, _), price in
-        zip(v2_paths + v3_paths, v2_prices + v3_prices)}
+    v3_indices = [i for i, path in enumerate(paths) if path.is_v3]
+    amount_outs = [0 if path.is_v3 else
+                   direct_V2_reserve_price(path, amount_in, snapshot)
+                   for path, amount_in in zip(paths, amount_ins)]
+    v3_quotes = await v3_prices([paths[i] for i in v3_indices],
+                                [amount_ins[i] for i in v3_indices],
+                                snapshot)
+    for i, price in zip(v3_indices, v3_quotes):
+        amount_outs[i] = price
 
     return amount_outs
 
@@ -262,9 +369,9 @@ async def direct_initialization_prices(paths: list[Path],
                     for path, amount_in in zip(paths, amount_ins)]
 
     v2_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v2")]
+                in filled_paths if not path.is_v3]
     v3_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v3")]
+                in filled_paths if path.is_v3]
 
     prices = await asyncio.gather(
         *[direct_V2_price(path, amount_in)
@@ -282,7 +389,8 @@ async def direct_initialization_prices(paths: list[Path],
 async def reverse_initialization_prices(paths: list[Path],
                                         amount_ins: list[float]) -> dict[Path, float]:
     """
-    Similar to reverse_prices but doesn't use reserves.
+    Similar to direct_initialization_prices but quotes the amount_in
+    each amount_out takes.
     """
     assert len(paths) == len(amount_ins)
 
@@ -290,9 +398,9 @@ async def reverse_initialization_prices(paths: list[Path],
                     for path, amount_in in zip(paths, amount_ins)]
 
     v2_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v2")]
+                in filled_paths if not path.is_v3]
     v3_paths = [(path, amount_in) for (path, amount_in)
-                in filled_paths if path.dex.name.endswith("v3")]
+                in filled_paths if path.is_v3]
 
     prices = await asyncio.gather(
         *[reverse_V2_price(path, amount_in)
@@ -306,30 +414,3 @@ async def reverse_initialization_prices(paths: list[Path],
 
     return amount_outs
 
-
-async def direct_indexed_prices(paths: list[Path],
-                                amount_ins: list[float]) -> dict[tuple[Path, Path],
-                                                                 float]:
-    """
-    Similar to direct_prices but parsing made easy for triangular arbitrage.
-    """
-    assert len(paths) == len(amount_ins)
-
-    filled_paths = [(n, left_path, middle_path, amount_in)
-                    for (n, left_path, middle_path), amount_in in zip(paths, amount_ins)]
-
-    v2_paths = [(n, left_path, middle_path, amount_in) for (n, left_path, middle_path, amount_in)
-                in filled_paths if middle_path.dex.name.endswith("v2")]
-    v3_paths = [(n, left_path, middle_path, amount_in) for (n, left_path, middle_path, amount_in)
-                in filled_paths if middle_path.dex.name.endswith("v3")]
-
-    v2_prices = [direct_V2_reserve_price(middle_path, amount_in)
-                 for (n, left_path, middle_path, amount_in) in v2_paths]
-    v3_prices = await asyncio.gather(
-        *[direct_V3_price(middle_path, amount_in) for (n, left_path, middle_path, amount_in) in v3_paths])
-
-    amount_outs = [
-        ((n, left_path, middle_path), price) for (n, left_path, middle_path, amount_in), price in
-        zip(v2_paths + v3_paths, v2_prices + v3_prices)]
-
-    return amount_outs
@@ -0,0 +1,164 @@
+import asyncio
+import contextvars
+import json
+import os
+import signal
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter, defaultdict
+from contextlib import contextmanager
+
+
+class Profiler:
+    """
+    Opt-in profiler for block iterations. Once armed for N iterations it
+    samples the main thread's stack from a background thread, times the
+    stages marked with stage() and counts the memory blocks each iteration
+    leaves allocated with tracemalloc.
+    Results are written as collapsed stacks, ready for flamegraph.pl or
+    speedscope, next to a json summary.
+    Arming works through SIGUSR1 or the local control endpoint.
+    The stack sampler and tracemalloc are process-wide, so only one network
+    is profiled, the tasks of the others call exclude().
+    """
+
+    def __init__(self, output_folder: str,
+                 sample_interval: float = 0.002,
+                 default_iterations: int = 5) -> None:
+        self.output_folder = output_folder
+        self.sample_interval = sample_interval
+        self.default_iterations = default_iterations
+        self.remaining_iterations = 0
+        self.active = False
+        self.current_stage = "idle"
+        self.samples = Counter()
+        self.stage_times = defaultdict(float)
+        self.iterations = []
+        self.iteration = None
+        self.sampler = None
+        self.start_snapshot = None
+        self.main_thread_id = threading.main_thread().ident
+        self.included = contextvars.ContextVar("profiled", default=True)
+
+    def arm(self, iterations: int = None) -> None:
+        """
+        Profiles the next iterations, can be called from a signal handler.
+        """
+        self.remaining_iterations = iterations or self.default_iterations
+
+    def exclude(self) -> None:
+        """
+        Leaves the iterations and stages of the current task unprofiled.
+        """
+        self.included.set(False)
+
+    def install_signal_handler(self) -> None:
+        if hasattr(signal, "SIGUSR1"):
+            signal.signal(signal.SIGUSR1, lambda *_: self.arm())
+
+    async def serve_control(self, port: int, get_metrics=None) -> None:
+        """
+        Listens on localhost for 'profile [iterations]' lines, and 'metrics'
+        lines answered with get_metrics().
+        """
+        async def handle(reader, writer):
+            words = (await reader.readline()).decode().split()
+            if words and words[0] == "profile":
+                self.arm(int(words[1]) if len(words) > 1 else None)
+                writer.write("armed for {} iterations\n".format(
+                    self.remaining_iterations).encode())
+            elif words == ["metrics"] and get_metrics:
+                writer.write((get_metrics() + "\n").encode())
+            else:
+                writer.write(b"usage: profile [iterations] | metrics\n")
+            await writer.drain()
+            writer.close()
+
+        await asyncio.start_server(handle, "127.0.0.1", port)
+
+    @contextmanager
+    def stage(self, name: str):
+        if not self.active or not self.included.get():
+            yield
+            return
+        previous_stage = self.current_stage
+        self.current_stage = name
+        start_time = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.stage_times[name] += time.perf_counter() - start_time
+            self.current_stage = previous_stage
+
+    def sample(self) -> None:
+        while self.active:
+            frame = sys._current_frames().get(self.main_thread_id)
+            stack = []
+            while frame is not None:
+                stack.append("{}:{}".format(
+                    os.path.basename(frame.f_code.co_filename),
+                    frame.f_code.co_name))
+                frame = frame.f_back
+            stack.append(self.current_stage)
+            self.samples[";".join(reversed(stack))] += 1
+            time.sleep(self.sample_interval)
+
+    def begin_iteration(self, block_number: int) -> None:
+        if not self.remaining_iterations or not self.included.get():
+            return
+        if not self.active:
+            self.active = True
+            self.samples = Counter()
+            self.iterations = []
+            tracemalloc.start()
+            self.sampler = threading.Thread(target=self.sample, daemon=True)
+            self.sampler.start()
+        self.stage_times = defaultdict(float)
+        tracemalloc.reset_peak()
+        self.iteration = {
+            "block": block_number,
+            "start": time.perf_counter()
+        }
+        self.start_snapshot = tracemalloc.take_snapshot()
+
+    def end_iteration(self) -> None:
+        if not self.active or not self.included.get():
+            return
+        snapshot = tracemalloc.take_snapshot()
+        _, peak = tracemalloc.get_traced_memory()
+        self.iteration.update({
+            "duration": time.perf_counter() - self.iteration.pop("start"),
+            "stages": dict(self.stage_times),
+            "allocations": sum(stat.count_diff for stat in
+                               snapshot.compare_to(self.start_snapshot,
+                                                   "filename")
+                               if stat.count_diff > 0),
+            "peak_memory": peak
+        })
+        self.iterations.append(self.iteration)
+        self.remaining_iterations -= 1
+        if not self.remaining_iterations:
+            self.stop()
+
+    def stop(self) -> None:
+        self.active = False
+        self.sampler.join()
+        tracemalloc.stop()
+        self.dump()
+
+    def dump(self) -> None:
+        os.makedirs(self.output_folder, exist_ok=True)
+        name = "profile_{}".format(self.iterations[0]["block"])
+        with open(os.path.join(self.output_folder, name + ".collapsed"), "w") as file:
+            for stack, count in self.samples.most_common():
+                file.write("{} {}\n".format(stack, count))
+        with open(os.path.join(self.output_folder, name + ".json"), "w") as file:
+            json.dump(self.iterations, file, indent=4)
+        print("Wrote {} profile of {} iterations".format(
+            name, len(self.iterations)))
+
+
+profiler = Profiler(os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'profiles'))
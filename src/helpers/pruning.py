@@ -0,0 +1,71 @@
+from typing import TYPE_CHECKING
+from models.market import Path
+from helpers.price import direct_V2_reserve_price
+
+if TYPE_CHECKING:
+    from helpers.snapshot import MarketSnapshot
+
+MIN_LIQUIDITY = 1000
+
+
+def get_fee_multiplier(path: Path) -> float:
+    """
+    Returns the share of amount_in which is left after the swap fee.
+    """
+    if path.is_v3:
+        return 1 - path.dex.fee / 1e6
+    return 0.997
+
+
+def get_v3_virtual_reserves(path: Path,
+                            state: tuple[int, int]) -> tuple[float, float]:
+    """
+    Converts the state of a v3 pool into the virtual reserves of its
+    current tick range, ordered in the direction of the path.
+    """
+    sqrt_price_x96, liquidity = state
+    if not sqrt_price_x96:
+        return (0, 0)
+    r1 = liquidity * 2**96 / sqrt_price_x96
+    r2 = liquidity * sqrt_price_x96 / 2**96
+    if not path.zero_for_one:
+        (r1, r2) = (r2, r1)
+
+    return (r1, r2)
+
+
+def get_path_liquidity(path: Path,
+                       reserves: tuple[float, float]) -> tuple[float, float]:
+    """
+    The liquidity index entry of a path: its marginal rate in USD terms,
+    fee included, and the USD value of its input side reserve.
+    """
+    r1, r2 = reserves
+    depth = path.from_token.recover_original_price(r1)
+    if depth <= 0:
+        return (0, 0)
+    rate = path.to_token.recover_original_price(r2) / depth
+    return (rate * get_fee_multiplier(path), depth)
+
+
+def get_cycle_upper_bound(paths: list[Path], amount_in: float,
+                          snapshot: "MarketSnapshot") -> float:
+    """
+    Returns an upper bound on the amount received after trading amount_in
+    through the given cycle. v2 legs are simulated with reserves, v3 legs
+    use their marginal rate, which no swap of positive size can beat.
+    """
+    amount = amount_in
+    for path in paths:
+        if path not in snapshot.liquidity:
+            return float("inf")
+        rate, depth = snapshot.liquidity[path]
+        if depth < MIN_LIQUIDITY:
+            return 0
+        if path in snapshot.reserves:
+            amount = direct_V2_reserve_price(path, amount, snapshot)
+        else:
+            amount *= rate
+
+    return amount
+
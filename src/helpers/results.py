@@ -0,0 +1,192 @@
+import atexit
+import glob
+import json
+import os
+import queue
+import struct
+import threading
+import time
+from array import array
+from models.data import Data
+
+MAGIC = b"RSTORE01"
+BATCH_HEADER = struct.Struct("<8sII")
+NO_PATH = -1
+
+
+class ResultStore:
+    """
+    Append-only store of every positive opportunity, one row per cycle and
+    block. The detection loop only queues the result tuples, a background
+    thread buffers them into columns and writes a batch every batch_rows
+    rows or flush_interval seconds. Files rotate at max_file_size.
+
+    Batch layout, little endian:
+        header  magic, row count, length of the path names
+        names   json list of the path names used by the batch
+        blocks  int64[rows]
+        amounts float64[rows]
+        profits float64[rows]
+        legs    int32[3][rows], indices into names, -1 for the missing
+                third leg of a line
+
+    A batch cut short by a crash is ignored by the reader.
+    """
+
+    def __init__(self, folder: str,
+                 batch_rows: int = 4096,
+                 flush_interval: float = 5,
+                 max_file_size: int = 64 * 2**20) -> None:
+        self.folder = folder
+        self.batch_rows = batch_rows
+        self.flush_interval = flush_interval
+        self.max_file_size = max_file_size
+        os.makedirs(folder, exist_ok=True)
+        self.file_index = len(get_result_files(folder))
+        self.file = None
+        self.rows = []
+        self.queue = queue.SimpleQueue()
+        self.writer = threading.Thread(target=self.write, daemon=True)
+        self.writer.start()
+        atexit.register(self.close)
+
+    @staticmethod
+    def from_env() -> "ResultStore":
+        """
+        Stores the results in the folder of the current network.
+        """
+        return ResultStore(get_result_folder(Data.network_name))
+
+    def add(self, block_number: int, lines: list, triangles: list) -> None:
+        """
+        Queues the lines (amount_in, forward, backward, profit) and triangles
+        (amount_in, left, middle, right, profit) found on a block.
+        """
+        if lines or triangles:
+            self.queue.put((block_number, lines, triangles))
+
+    def write(self) -> None:
+        deadline = time.monotonic() + self.flush_interval
+        while True:
+            try:
+                item = self.queue.get(
+                    timeout=max(deadline - time.monotonic(), 0))
+            except queue.Empty:
+                item = ()
+            if item is None:
+                self.flush()
+                return
+            if item:
+                block_number, lines, triangles = item
+                self.rows.extend(
+                    (block_number, amount_in, profit, forward_path, backward_path, None)
+                    for amount_in, forward_path, backward_path, profit in lines)
+                self.rows.extend(
+                    (block_number, amount_in, profit, left_path, middle_path, right_path)
+                    for amount_in, left_path, middle_path, right_path, profit in triangles)
+            if len(self.rows) >= self.batch_rows or time.monotonic() >= deadline:
+                self.flush()
+                deadline = time.monotonic() + self.flush_interval
+
+    def flush(self) -> None:
+        if not self.rows:
+            return
+        names = {}
+        blocks = array("q")
+        amounts = array("d")
+        profits = array("d")
+        legs = [array("i"), array("i"), array("i")]
+        for block_number, amount_in, profit, *paths in self.rows:
+            blocks.append(block_number)
+            amounts.append(amount_in)
+            profits.append(profit)
+            for column, path in zip(legs, paths):
+                column.append(NO_PATH if path is None else
+                              names.setdefault(str(path), len(names)))
+        encoded_names = json.dumps(list(names)).encode()
+        if self.file is None or self.file.tell() >= self.max_file_size:
+            self.rotate()
+        self.file.write(BATCH_HEADER.pack(MAGIC, len(self.rows), len(encoded_names)) +
+                        encoded_names + b"".join(column.tobytes() for column in
+                                                 [blocks, amounts, profits, *legs]))
+        self.file.flush()
+        self.rows = []
+
+    def rotate(self) -> None:
+        if self.file:
+            self.file.close()
+        self.file = open(os.path.join(
+            self.folder, "results-{:06d}.bin".format(self.file_index)), "ab")
+        self.file_index += 1
+
+    def close(self) -> None:
+        if self.writer.is_alive():
+            self.queue.put(None)
+            self.writer.join()
+        if self.file:
+            self.file.close()
+            self.file = None
+
+
+def get_result_folder(network_name: str = None) -> str:
+    """
+    RESULT_STORE_DIR, next to the log by default, in a subfolder per
+    network when there are several.
+    """
+    folder = os.environ.get("RESULT_STORE_DIR") or os.path.join(
+        os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+        "results")
+    if network_name:
+        folder = os.path.join(folder, network_name)
+    return folder
+
+
+def get_result_files(folder: str) -> list[str]:
+    return sorted(glob.glob(os.path.join(folder, "results-*.bin")))
+
+
+def read_batches(file_name: str):
+    """
+    Yields the columns of each complete batch of a result file.
+    """
+    with open(file_name, "rb") as file:
+        content = file.read()
+    offset = 0
+    while offset + BATCH_HEADER.size <= len(content):
+        magic, rows, names_length = BATCH_HEADER.unpack_from(content, offset)
+        assert magic == MAGIC, "{} is not a result file".format(file_name)
+        offset += BATCH_HEADER.size
+        end = offset + names_length + rows * (3 * 8 + 3 * 4)
+        if end > len(content):
+            return
+        names = json.loads(content[offset:offset + names_length])
+        offset += names_length
+        columns = {}
+        for column, typecode in [("block", "q"), ("amount_in", "d"),
+                                 ("profit", "d"), ("leg0", "i"),
+                                 ("leg1", "i"), ("leg2", "i")]:
+            values = array(typecode)
+            values.frombytes(content[offset:offset + rows * values.itemsize])
+            offset += rows * values.itemsize
+            columns[column] = values
+        columns["names"] = names
+        yield columns
+
+
+def read_results(folder: str, first_block: int = 0, last_block: int = None):
+    """
+    Yields (block, path names, amount_in, profit) of every stored result
+    between two blocks.
+    """
+    for file_name in get_result_files(folder):
+        for columns in read_batches(file_name):
+            names = columns["names"]
+            for block_number, amount_in, profit, *legs in zip(
+                    columns["block"], columns["amount_in"], columns["profit"],
+                    columns["leg0"], columns["leg1"], columns["leg2"]):
+                if block_number < first_block or \
+                        last_block is not None and block_number > last_block:
+                    continue
+                yield (block_number,
+                       tuple(names[leg] for leg in legs if leg != NO_PATH),
+                       amount_in, profit)
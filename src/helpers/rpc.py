@@ -0,0 +1,244 @@
+import asyncio
+import itertools
+import time
+from collections import deque
+import aiohttp
+from brownie import web3
+from models.data import Data
+
+
+class RPCError(Exception):
+    """
+    JSON-RPC error returned by a node, e.g. a reverted eth_call.
+    These are deterministic, so they are never retried on another node.
+    """
+
+    def __init__(self, error: dict) -> None:
+        super().__init__(error.get("message", str(error)))
+        self.code = error.get("code")
+        self.data = error.get("data")
+
+
+class Endpoint:
+    def __init__(self, url: str) -> None:
+        self.url = url
+        self.latencies = deque(maxlen=200)
+        self.head = 0
+        self.lagging = False
+        self.failures = 0
+
+    def record(self, latency: float) -> None:
+        self.latencies.append(latency)
+        self.failures = 0
+
+    def get_mean_latency(self) -> float:
+        """
+        Unmeasured endpoints report zero so that they get probed first,
+        when they lose the hedge their elapsed time is recorded anyway.
+        """
+        if not self.latencies:
+            return 0
+        return sum(self.latencies) / len(self.latencies)
+
+    def get_latency_quantile(self, quantile: float) -> float:
+        if not self.latencies:
+            return None
+        ordered = sorted(self.latencies)
+        return ordered[min(len(ordered) - 1, int(quantile * len(ordered)))]
+
+    def __str__(self) -> str:
+        return self.url
+
+
+class ProviderPool:
+    """
+    Sends JSON-RPC requests over keep-alive sessions to several endpoints.
+    Requests go to the endpoint with the lowest observed latency and are
+    hedged to the next one once they take longer than its p95 latency.
+    Endpoints whose head falls behind the best head are left out of rotation.
+    Pools of several networks can share one session, and so its keep-alive
+    connections, in which case closing is left to the session's owner.
+    """
+
+    def __init__(self, urls: list[str],
+                 hedge_quantile: float = 0.95,
+                 default_hedge_delay: float = 0.2,
+                 max_head_lag: int = 2,
+                 max_failures: int = 3,
+                 timeout: float = 10,
+                 session: aiohttp.ClientSession = None) -> None:
+        assert urls
+        self.endpoints = [Endpoint(url) for url in urls]
+        self.hedge_quantile = hedge_quantile
+        self.default_hedge_delay = default_hedge_delay
+        self.max_head_lag = max_head_lag
+        self.max_failures = max_failures
+        self.timeout = timeout
+        self.session = session
+        self.owns_session = session is None
+        self.ids = itertools.count(1)
+        self.hedged_requests = 0
+
+    @staticmethod
+    def from_env(session: aiohttp.ClientSession = None) -> "ProviderPool":
+        """
+        Creates a pool from the comma separated RPC_ENDPOINTS of the network,
+        returns None if it is not set.
+        """
+        urls = [url.strip() for url in
+                Data.get_env("RPC_ENDPOINTS", "", shared=False).split(",")
+                if url.strip()]
+        return ProviderPool(urls, session=session) if urls else None
+
+    @staticmethod
+    def create_session() -> aiohttp.ClientSession:
+        connector = aiohttp.TCPConnector(limit_per_host=64,
+                                         keepalive_timeout=60)
+        return aiohttp.ClientSession(connector=connector)
+
+    async def start(self) -> None:
+        if self.session is None:
+            self.session = self.create_session()
+
+    async def close(self) -> None:
+        if self.session is not None and self.owns_session:
+            await self.session.close()
+            self.session = None
+
+    def get_ranked_endpoints(self) -> list[Endpoint]:
+        """
+        Healthy endpoints sorted by mean latency, the rest at the end.
+        """
+        def is_healthy(endpoint):
+            return not endpoint.lagging and \
+                endpoint.failures < self.max_failures
+
+        return sorted(self.endpoints,
+                      key=lambda endpoint: (not is_healthy(endpoint),
+                                            endpoint.get_mean_latency()))
+
+    def get_hedge_delay(self, endpoint: Endpoint) -> float:
+        delay = endpoint.get_latency_quantile(self.hedge_quantile)
+        return self.default_hedge_delay if delay is None else delay
+
+    async def post(self, endpoint: Endpoint, payload):
+        """
+        Posts a payload to one endpoint and records its latency.
+        """
+        await self.start()
+        start_time = time.perf_counter()
+        try:
+            async with self.session.post(
+                    endpoint.url, json=payload,
+                    timeout=aiohttp.ClientTimeout(total=self.timeout)) as response:
+                response.raise_for_status()
+                result = await response.json(content_type=None)
+        except (aiohttp.ClientError, asyncio.TimeoutError):
+            endpoint.failures += 1
+            raise
+        except asyncio.CancelledError:
+            # A hedge loser took at least this long. Without it, a slow
+            # endpoint which always loses would never be measured, and
+            # would rank first for good.
+            endpoint.latencies.append(time.perf_counter() - start_time)
+            raise
+        endpoint.record(time.perf_counter() - start_time)
+        return result
+
+    async def hedged_post(self, payload):
+        """
+        Posts to the best endpoint, hedges to the second best after its p95
+        latency and falls back to the rest on transport errors.
+        """
+        endpoints = self.get_ranked_endpoints()
+        pending = set()
+        last_error = None
+        for i, endpoint in enumerate(endpoints):
+            pending.add(asyncio.ensure_future(self.post(endpoint, payload)))
+            hedge = i + 1 < len(endpoints)
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending,
+                    timeout=self.get_hedge_delay(endpoint) if hedge else None,
+                    return_when=asyncio.FIRST_COMPLETED)
+                if not done:
+                    self.hedged_requests += 1
+                    break
+                for task in done:
+                    if task.exception() is None:
+                        for other in pending:
+                            other.cancel()
+                        return task.result()
+                    last_error = task.exception()
+                if not pending:
+                    break
+        raise last_error
+
+    async def request(self, method: str, params: list = None):
+        payload = {"jsonrpc": "2.0", "id": next(self.ids),
+                   "method": method, "params": params or []}
+        response = await self.hedged_post(payload)
+        if "error" in response:
+            raise RPCError(response["error"])
+        return response["result"]
+
+    async def batch_request(self, calls: list[tuple[str, list]]) -> list:
+        """
+        Sends a JSON-RPC batch, results keep the order of calls.
+        Failed calls are returned as RPCError instances.
+        """
+        if not calls:
+            return []
+        payload = [{"jsonrpc": "2.0", "id": next(self.ids),
+                    "method": method, "params": params}
+                   for method, params in calls]
+        responses = {response["id"]: response
+                     for response in await self.hedged_post(payload)}
+        return [RPCError(responses[call["id"]]["error"])
+                if "error" in responses[call["id"]]
+                else responses[call["id"]]["result"]
+                for call in payload]
+
+    async def update_heads(self) -> int:
+        """
+        Polls every endpoint for its head and flags the lagging ones.
+        Returns the best head.
+        """
+        payload = {"jsonrpc": "2.0", "id": 0,
+                   "method": "eth_blockNumber", "params": []}
+        responses = await asyncio.gather(
+            *[self.post(endpoint, payload) for endpoint in self.endpoints],
+            return_exceptions=True)
+        for endpoint, response in zip(self.endpoints, responses):
+            if isinstance(response, dict) and "result" in response:
+                endpoint.head = int(response["result"], 16)
+
+        best_head = max(endpoint.head for endpoint in self.endpoints)
+        for endpoint in self.endpoints:
+            endpoint.lagging = best_head - endpoint.head > self.max_head_lag
+        return best_head
+
+    def get_report(self) -> str:
+        return ", ".join(
+            "{} head {} mean {:.4f}s p95 {:.4f}s{}".format(
+                endpoint,
+                endpoint.head,
+                endpoint.get_mean_latency(),
+                endpoint.get_latency_quantile(0.95) or 0,
+                " lagging" if endpoint.lagging else "")
+            for endpoint in self.endpoints)
+
+
+async def send_request(method: str, params: list = None):
+    """
+    Sends a JSON-RPC request through the provider pool if there is one,
+    otherwise through brownie's provider.
+    """
+    if Data.rpc_pool:
+        return await Data.rpc_pool.request(method, params)
+    loop = asyncio.get_running_loop()
+    response = await loop.run_in_executor(None, web3.provider.make_request,
+                                          method, params or [])
+    if "error" in response:
+        raise RPCError(response["error"])
+    return response["result"]
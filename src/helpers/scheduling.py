@@ -0,0 +1,191 @@
+import time
+from collections import defaultdict
+from models.market import Path
+from models.data import Data
+from helpers.arbitrage import search_cycles
+from helpers.cycles import CycleRegistry, TokenCycleRegistry, decode_cycle
+from helpers.snapshot import MarketSnapshot
+
+
+class CycleScheduler:
+    """
+    Decides which cycles are searched each block, and in which order.
+    Cycles with no leg touched this block keep their last result, nothing
+    about them changed, and it is kept apart in carried rather than
+    emitted again. Touched cycles are searched in chunks, the highest
+    expected profit first, until the time budget of the block runs out.
+    Chunks grow by growth but never beyond what the time per cycle of the
+    last chunk fits in the rest of the budget. Each chunk's results are
+    emitted as soon as they exist. Touched cycles the budget left out stay
+    pending and are searched with the next block's.
+
+    The expected profit of a cycle is the moving average of its best
+    profits plus the sum of the volatilities of its legs times its last
+    best size, as a price move of sigma opens a spread of about sigma.
+    Volatilities come from Data.history when it is enabled.
+
+    With aggregate set the cycles are token cycles, see TokenCycleRegistry,
+    resolved to their best pools each time they are touched.
+    """
+
+    def __init__(self, lines: dict[Path, list[Path]],
+                 triangles: dict[Path, dict[Path, list[Path]]],
+                 budget: float = 3,
+                 first_chunk: int = 32,
+                 growth: int = 4,
+                 smoothing: float = 0.5,
+                 volatility_window: int = 100,
+                 aggregate: bool = False) -> None:
+        self.registry = TokenCycleRegistry(lines, triangles) if aggregate \
+            else CycleRegistry(lines, triangles)
+        self.cycles = self.registry.cycles
+        self.path_cycles = self.registry.path_cycles
+        self.resolved = {}
+        self.budget = budget
+        self.first_chunk = first_chunk
+        self.growth = growth
+        self.smoothing = smoothing
+        self.volatility_window = volatility_window
+        self.results = {}
+        self.carried = {}
+        self.pending = set()
+        self.expected_profits = defaultdict(float)
+        self.sizes = {}
+        self.volatilities = defaultdict(float)
+        self.evaluated = 0
+        self.skipped = 0
+
+    @staticmethod
+    def from_env(lines: dict[Path, list[Path]],
+                 triangles: dict[Path, dict[Path, list[Path]]]) -> "CycleScheduler":
+        return CycleScheduler(lines, triangles,
+                              float(Data.get_env("CYCLE_BUDGET_SECONDS", 3)),
+                              aggregate=bool(Data.get_env("AGGREGATE_EDGES")))
+
+    def adopt(self, scheduler: "CycleScheduler") -> None:
+        """
+        Takes over what another scheduler learned about the cycles both
+        have, after a topology change.
+        """
+        cycles = set(self.cycles)
+        for name in ["resolved", "results", "expected_profits", "sizes"]:
+            getattr(self, name).update({
+                cycle: value for cycle, value in getattr(scheduler, name).items()
+                if cycle in cycles})
+        self.volatilities.update(scheduler.volatilities)
+        self.pending.update(scheduler.pending & cycles)
+
+    def get_state(self) -> dict:
+        """
+        What the scheduler learned, as lists of names for a checkpoint.
+        Cycles never seen profitable are left out.
+        """
+        def encode(cycle):
+            return [str(leg) for leg in cycle]
+
+        return {"expected_profits": [[encode(cycle), profit] for cycle, profit
+                                     in self.expected_profits.items() if profit > 0],
+                "sizes": [[encode(cycle), size] for cycle, size in self.sizes.items()],
+                "results": [[encode(cycle), encode(self.resolved[cycle]), amount_in, profit]
+                            for cycle, (amount_in, profit) in self.results.items()],
+                "pending": [encode(cycle) for cycle in self.pending]}
+
+    def set_state(self, state: dict) -> None:
+        """
+        Takes over a state of get_state, for the cycles which still exist.
+        """
+        cycles = set(self.cycles)
+        for names, profit in state["expected_profits"]:
+            cycle = decode_cycle(names)
+            if cycle in cycles:
+                self.expected_profits[cycle] = profit
+        for names, size in state["sizes"]:
+            cycle = decode_cycle(names)
+            if cycle in cycles:
+                self.sizes[cycle] = size
+        for names, resolved_names, amount_in, profit in state["results"]:
+            cycle = decode_cycle(names)
+            if cycle in cycles:
+                self.resolved[cycle] = decode_cycle(resolved_names)
+                self.results[cycle] = (amount_in, profit)
+        for names in state.get("pending", []):
+            cycle = decode_cycle(names)
+            if cycle in cycles:
+                self.pending.add(cycle)
+
+    def get_touched_cycles(self, changed_paths: set[Path]) -> set[tuple]:
+        if changed_paths is None:
+            return set(self.cycles)
+        return {cycle for path in changed_paths
+                for cycle in self.path_cycles.get(path, [])}
+
+    def update_volatilities(self, changed_paths: set[Path]) -> None:
+        if not Data.history:
+            return
+        for path in changed_paths if changed_paths is not None else self.path_cycles:
+            if str(path) in Data.history.index:
+                self.volatilities[path] = Data.history.get_volatility(
+                    str(path), self.volatility_window)
+
+    def get_priority(self, cycle: tuple, min_amount_in: float) -> float:
+        return self.expected_profits[cycle] + \
+            sum(self.volatilities[path] for path in self.resolved[cycle]) * \
+            self.sizes.get(cycle, min_amount_in)
+
+    def record(self, cycles: list[tuple], results: dict) -> None:
+        for cycle in cycles:
+            amount_in, profit = results.get(self.resolved[cycle], (None, 0))
+            self.expected_profits[cycle] = \
+                self.smoothing * self.expected_profits[cycle] + \
+                (1 - self.smoothing) * max(profit, 0)
+            if profit > 0:
+                self.results[cycle] = (amount_in, profit)
+                self.sizes[cycle] = amount_in
+
+    async def run(self, snapshot: MarketSnapshot,
+                  changed_paths: set[Path],
+                  min_amount_in: float,
+                  max_amount_in: float,
+                  on_results) -> None:
+        """
+        Searches the touched cycles of a snapshot, and those still pending
+        from earlier blocks, by priority and awaits on_results with each
+        chunk of results. changed_paths are those which changed since the
+        previous snapshot, None means all of them.
+        """
+        start_time = time.perf_counter()
+        touched_cycles = self.get_touched_cycles(changed_paths) | self.pending
+        for cycle in touched_cycles:
+            self.results.pop(cycle, None)
+        self.carried = {self.resolved[cycle]: result
+                        for cycle, result in self.results.items()}
+
+        for cycle in touched_cycles:
+            self.resolved[cycle] = self.registry.resolve(cycle, min_amount_in,
+                                                         snapshot)
+        self.update_volatilities(changed_paths)
+        queue = sorted([cycle for cycle in touched_cycles if self.resolved[cycle]],
+                       key=lambda cycle: self.get_priority(cycle, min_amount_in),
+                       reverse=True)
+        chunk_size = self.first_chunk
+        index = 0
+        while index < len(queue) and \
+                time.perf_counter() - start_time < self.budget:
+            chunk = queue[index:index + chunk_size]
+            index += len(chunk)
+            chunk_start_time = time.perf_counter()
+            results = await search_cycles([self.resolved[cycle] for cycle in chunk],
+                                          snapshot, min_amount_in, max_amount_in)
+            self.record(chunk, results)
+            await on_results(results)
+            end_time = time.perf_counter()
+            chunk_time = end_time - chunk_start_time
+            chunk_size *= self.growth
+            if chunk_time > 0:
+                remaining = self.budget - (end_time - start_time)
+                chunk_size = max(1, int(min(chunk_size,
+                                            remaining * len(chunk) / chunk_time)))
+
+        self.evaluated = index
+        self.skipped = len(queue) - index
+        self.pending = set(queue[index:])
@@ -0,0 +1,778 @@
+import asyncio
+import contextvars
+import itertools
+import json
+import math
+import os
+import random
+from collections import Counter, defaultdict, deque
+from dataclasses import dataclass
+from aiohttp import WSMsgType, web
+from eth_utils import keccak, to_checksum_address
+from models.data import Data, create_namespace
+from helpers.calls import (AGGREGATE3,
+                           GET_RESERVES,
+                           LIQUIDITY,
+                           MULTICALL_ADDRESS,
+                           QUOTE_EXACT_INPUT_SINGLE,
+                           QUOTE_EXACT_OUTPUT_SINGLE,
+                           SLOT0,
+                           address_word,
+                           get_selector,
+                           word)
+from helpers.paths import generate_healthy_loop_names, generate_healthy_triangle_names
+
+GET_PAIR = get_selector("getPair(address,address)")
+GET_POOL = get_selector("getPool(address,address,uint24)")
+GET_AMOUNTS_OUT = get_selector("getAmountsOut(uint256,address[])")
+GET_AMOUNTS_IN = get_selector("getAmountsIn(uint256,address[])")
+TRY_AGGREGATE = get_selector("tryAggregate(bool,(address,bytes)[])")
+TRY_BLOCK_AND_AGGREGATE = get_selector("tryBlockAndAggregate(bool,(address,bytes)[])")
+SYNC_TOPIC = "0x" + keccak(text="Sync(uint112,uint112)").hex()
+SWAP_TOPIC = "0x" + keccak(
+    text="Swap(address,address,int256,int256,uint160,uint128,int24)").hex()
+ZERO_ADDRESS = "0x" + "00" * 20
+ZERO_HASH = "0x" + "00" * 32
+V3_FEE = 3000
+QUOTE_GAS = 100000
+GAS_PRICE = 10**9
+GENESIS_TIMESTAMP = 1700000000
+
+
+class NodeError(Exception):
+    """
+    A JSON-RPC error answered by the simulated node.
+    """
+
+    def __init__(self, message: str, code: int = -32000) -> None:
+        super().__init__(message)
+        self.code = code
+
+
+class Revert(NodeError):
+    def __init__(self, reason: str) -> None:
+        super().__init__("execution reverted: " + reason, 3)
+
+
+def read_word(data: bytes, start: int) -> int:
+    return int.from_bytes(data[start:start + 32], "big")
+
+
+def read_address(data: bytes, start: int) -> str:
+    return "0x" + data[start + 12:start + 32].hex()
+
+
+def decode_calls(data: bytes, start: int, head_words: int,
+                 allow_failure: bool = True) -> list[tuple[str, bool, bytes]]:
+    """
+    Inverse of encode_aggregate3 over the (address,bool,bytes)[] starting at
+    start, or over the (address,bytes)[] of tryAggregate when head_words is
+    2, in which case every call gets allow_failure.
+    """
+    count = read_word(data, start)
+    calls = []
+    for i in range(count):
+        element = start + 32 + read_word(data, start + 32 * (i + 1))
+        if head_words == 3:
+            allow_failure = bool(read_word(data, element + 32))
+        data_start = element + read_word(data, element + 32 * (head_words - 1))
+        length = read_word(data, data_start)
+        calls.append((read_address(data, element), allow_failure,
+                      data[data_start + 32:data_start + 32 + length]))
+    return calls
+
+
+def encode_results(results: list[tuple[bool, bytes]]) -> bytes:
+    """
+    Encodes the (bool,bytes)[] returned by the multicalls, from its length.
+    """
+    heads = []
+    tails = []
+    offset = 32 * len(results)
+    for success, data in results:
+        tail = word(int(success)) + word(64) + word(len(data)) + \
+            data + bytes(-len(data) % 32)
+        heads.append(word(offset))
+        tails.append(tail)
+        offset += len(tail)
+    return word(len(results)) + b"".join(heads) + b"".join(tails)
+
+
+def get_sqrt_price(reserve0: int, reserve1: int) -> int:
+    return math.isqrt((reserve1 << 192) // reserve0)
+
+
+def get_tick(sqrt_price: int) -> int:
+    return math.floor(2 * math.log(sqrt_price / 2**96) / math.log(1.0001))
+
+
+@dataclass
+class Pool:
+    name: str
+    address: str
+    dex_name: str
+    token0: str
+    token1: str
+    depth: float
+    is_v3: bool
+
+
+@dataclass
+class Block:
+    number: int
+    hash: str
+    parent_hash: str
+    timestamp: int
+    changes: dict[str, tuple[int, int]]
+    states: dict[str, tuple[int, int]]
+
+
+class SimulatedMarket:
+    """
+    A deterministic synthetic market on the contracts the bot reads: v2
+    pairs, v3 pools, their factories, v2 routers, v3 quoters and multicall.
+    There is no EVM, each call is answered from the reserves of the pool,
+    v3 pools swap along their virtual reserves.
+    Every token has a USD price which takes a random step of
+    token_volatility each block, and each block a move_share of the pools
+    is redrawn around the prices with a mispricing of spread, so cycles
+    open and close. The script adds moves at given blocks:
+    {"block": n, "token": name, "move": 0.05} moves a price,
+    {"block": n, "pool": "dex0v2 T0 T1", "skew": 0.03} misprices a pool and
+    {"block": n, "reorg": depth} replaces the last blocks, as reorg_rate
+    does at random. The same seed and script give the same blocks.
+    The states of the last state_depth blocks can be read, the logs of the
+    last log_depth blocks, like a pruned node. A multicall of more than
+    max_multicall_calls calls runs out of gas.
+    """
+
+    def __init__(self, token_count: int = 40,
+                 v2_dex_count: int = 4,
+                 v3_dex_count: int = 2,
+                 edge_probability: float = 0.2,
+                 token_volatility: float = 0.001,
+                 move_share: float = 0.1,
+                 spread: float = 0.003,
+                 reorg_rate: float = 0,
+                 script: list[dict] = None,
+                 max_multicall_calls: int = None,
+                 state_depth: int = 64,
+                 log_depth: int = 4096,
+                 chain_id: int = 1337,
+                 seed: int = 0) -> None:
+        self.random = random.Random(seed)
+        self.token_volatility = token_volatility
+        self.move_share = move_share
+        self.spread = spread
+        self.reorg_rate = reorg_rate
+        self.max_multicall_calls = max_multicall_calls
+        self.state_depth = state_depth
+        self.log_depth = log_depth
+        self.chain_id = chain_id
+        self.script = defaultdict(list)
+        for event in script or []:
+            self.script[event["block"]].append(event)
+
+        self.token_names = ["T{}".format(i) for i in range(token_count)]
+        self.token_addresses = {name: self.get_address("token", name)
+                                for name in self.token_names}
+        self.decimals = {name: self.random.choice([6, 8, 18])
+                         for name in self.token_names}
+        self.prices = {name: 10**self.random.uniform(-3, 4)
+                       for name in self.token_names}
+        self.relative_prices = {name: 1 / price for name, price in self.prices.items()}
+        self.dex_names = ["dex{}v2".format(i) for i in range(v2_dex_count)] + \
+            ["dex{}v3".format(i) for i in range(v3_dex_count)]
+        self.contracts = {}
+        for dex_name in self.dex_names:
+            self.contracts[self.get_address("factory", dex_name)] = ("factory", dex_name)
+            kind = "quoter" if dex_name.endswith("v3") else "router"
+            self.contracts[self.get_address(kind, dex_name)] = (kind, dex_name)
+
+        self.pools = {}
+        self.pool_index = {}
+        self.pool_names = {}
+        for dex_name in self.dex_names:
+            for i, token_a in enumerate(self.token_names):
+                for token_b in self.token_names[i + 1:]:
+                    if self.random.random() >= edge_probability:
+                        continue
+                    name = "{} {} {}".format(dex_name, token_a, token_b)
+                    token0, token1 = sorted([self.token_addresses[token_a],
+                                             self.token_addresses[token_b]])
+                    pool = Pool(name, self.get_address("pool", name), dex_name,
+                                token0, token1, 10**self.random.uniform(4, 7),
+                                dex_name.endswith("v3"))
+                    self.pools[pool.address] = pool
+                    self.pool_index[(dex_name, token0, token1)] = pool
+                    self.pool_names[name] = pool
+                    self.pool_names["{} {} {}".format(dex_name, token_b, token_a)] = pool
+        self.token_names_by_address = {address: name for name, address
+                                       in self.token_addresses.items()}
+        for event in script or []:
+            if ("pool" in event and event["pool"] not in self.pool_names) or \
+                    ("token" in event and event["token"] not in self.prices):
+                raise ValueError("The script moves {}, which isn't in the market".format(
+                    event.get("pool") or event.get("token")))
+
+        states = {address: self.draw_state(pool, self.random.gauss(0, self.spread))
+                  for address, pool in self.pools.items()}
+        genesis = Block(0, "0x" + keccak(text="genesis {}".format(seed)).hex(),
+                        ZERO_HASH, GENESIS_TIMESTAMP, states, states)
+        self.chain = [genesis]
+        self.blocks = {genesis.hash: genesis}
+        self.history = deque([genesis])
+        self.readable = deque([genesis])
+        self.reorgs = 0
+        self.calls = 0
+
+    @staticmethod
+    def get_address(kind: str, name: str) -> str:
+        return "0x" + keccak(text="{} {}".format(kind, name))[12:].hex()
+
+    @property
+    def head(self) -> Block:
+        return self.chain[-1]
+
+    def draw_state(self, pool: Pool, skew: float) -> tuple[int, int]:
+        """
+        Reserves of both tokens worth depth USD, the second off by skew.
+        """
+        token0 = self.token_names_by_address[pool.token0]
+        token1 = self.token_names_by_address[pool.token1]
+        return (max(int(pool.depth * 10**self.decimals[token0] / self.prices[token0]), 1),
+                max(int(pool.depth * (1 + skew) * 10**self.decimals[token1] /
+                        self.prices[token1]), 1))
+
+    def mine(self) -> list[Block]:
+        """
+        Mines the next block, or replaces the last blocks with as many plus
+        one when a reorg is scripted or drawn. Returns the new blocks.
+        """
+        number = self.head.number + 1
+        events = self.script.get(number, [])
+        depth = sum(event.get("reorg", 0) for event in events)
+        if not depth and self.reorg_rate and self.random.random() < self.reorg_rate:
+            depth = self.random.randint(1, 3)
+        depth = min(depth, len(self.chain) - 1, self.state_depth - 1)
+        if depth:
+            self.reorgs += 1
+            del self.chain[-depth:]
+        blocks = []
+        while self.head.number < number:
+            blocks.append(self.append(events if self.head.number + 1 == number else []))
+        return blocks
+
+    def append(self, events: list[dict]) -> Block:
+        parent = self.head
+        number = parent.number + 1
+        for name in self.token_names:
+            self.prices[name] *= math.exp(self.random.gauss(0, self.token_volatility))
+        for event in events:
+            if "token" in event:
+                self.prices[event["token"]] *= 1 + event["move"]
+
+        changes = {}
+        for address, pool in self.pools.items():
+            if self.random.random() < self.move_share:
+                changes[address] = self.draw_state(pool, self.random.gauss(0, self.spread))
+        for event in events:
+            if "pool" in event:
+                pool = self.pool_names[event["pool"]]
+                changes[pool.address] = self.draw_state(pool, event.get("skew", 0))
+
+        states = dict(parent.states)
+        states.update(changes)
+        block = Block(number,
+                      "0x" + keccak(bytes.fromhex(parent.hash[2:]) +
+                                    word(number) + word(self.reorgs)).hex(),
+                      parent.hash, GENESIS_TIMESTAMP + 12 * number,
+                      changes, states)
+        self.chain.append(block)
+        self.blocks[block.hash] = block
+        self.history.append(block)
+        self.readable.append(block)
+        while self.readable[0].number <= number - self.state_depth:
+            self.readable.popleft().states = None
+        while self.history[0].number <= number - self.log_depth:
+            del self.blocks[self.history.popleft().hash]
+        if len(self.chain) > 2 * self.log_depth:
+            del self.chain[:-self.log_depth]
+        return block
+
+    def get_canonical_block(self, number: int) -> Block:
+        i = number - self.chain[0].number
+        return self.chain[i] if 0 <= i < len(self.chain) else None
+
+    def get_block(self, identifier) -> Block:
+        """
+        Resolves a block tag, number or EIP-1898 object, None if unknown.
+        """
+        if isinstance(identifier, dict):
+            if "blockHash" in identifier:
+                return self.blocks.get(identifier["blockHash"].lower())
+            identifier = identifier.get("blockNumber", "latest")
+        if identifier in ("latest", "pending", "safe", "finalized"):
+            return self.head
+        if identifier == "earliest":
+            return self.chain[0]
+        return self.get_canonical_block(
+            identifier if isinstance(identifier, int) else int(identifier, 16))
+
+    def get_header(self, block: Block) -> dict:
+        if block is None:
+            return None
+        return {"number": hex(block.number),
+                "hash": block.hash,
+                "parentHash": block.parent_hash,
+                "timestamp": hex(block.timestamp),
+                "gasLimit": hex(30000000),
+                "gasUsed": "0x0",
+                "baseFeePerGas": hex(GAS_PRICE),
+                "difficulty": "0x0",
+                "miner": ZERO_ADDRESS,
+                "extraData": "0x",
+                "nonce": "0x0000000000000000",
+                "sha3Uncles": ZERO_HASH,
+                "stateRoot": ZERO_HASH,
+                "transactionsRoot": ZERO_HASH,
+                "receiptsRoot": ZERO_HASH,
+                "logsBloom": "0x" + "00" * 256,
+                "size": "0x0",
+                "transactions": [],
+                "uncles": []}
+
+    def get_code(self, address: str) -> str:
+        address = address.lower()
+        return "0x00" if address in self.pools or address in self.contracts or \
+            address == MULTICALL_ADDRESS.lower() else "0x"
+
+    def get_pool(self, dex_name: str, token_a: str, token_b: str) -> Pool:
+        token0, token1 = sorted([token_a, token_b])
+        return self.pool_index.get((dex_name, token0, token1))
+
+    def get_reserves(self, pool: Pool, token_in: str, block: Block) -> tuple[int, int]:
+        """
+        Reserves of the pool ordered in the direction of the swap.
+        """
+        reserve0, reserve1 = block.states[pool.address]
+        return (reserve0, reserve1) if token_in == pool.token0 else (reserve1, reserve0)
+
+    def call(self, target: str, data: bytes, block: Block) -> bytes:
+        """
+        Returns what a call to target returns at block, raises Revert.
+        """
+        self.calls += 1
+        selector = data[:4]
+        if target == MULTICALL_ADDRESS.lower():
+            return self.multicall(data, block)
+
+        pool = self.pools.get(target)
+        if pool is not None:
+            reserve0, reserve1 = block.states[target]
+            if pool.is_v3 and selector == SLOT0:
+                sqrt_price = get_sqrt_price(reserve0, reserve1)
+                return word(sqrt_price) + word(get_tick(sqrt_price) % 2**256) + \
+                    word(0) + word(1) + word(1) + word(0) + word(1)
+            if pool.is_v3 and selector == LIQUIDITY:
+                return word(math.isqrt(reserve0 * reserve1))
+            if not pool.is_v3 and selector == GET_RESERVES:
+                return word(reserve0) + word(reserve1) + word(block.timestamp % 2**32)
+            raise Revert("unknown selector")
+
+        kind, dex_name = self.contracts.get(target, (None, None))
+        if kind == "factory":
+            return self.get_pool_address(dex_name, data)
+        if kind == "router":
+            return self.get_amounts(dex_name, data, block)
+        if kind == "quoter":
+            return self.quote(dex_name, data, block)
+        return b""
+
+    def multicall(self, data: bytes, block: Block) -> bytes:
+        selector = data[:4]
+        if selector == AGGREGATE3:
+            calls = decode_calls(data, 4 + read_word(data, 4), 3)
+        elif selector in (TRY_AGGREGATE, TRY_BLOCK_AND_AGGREGATE):
+            calls = decode_calls(data, 4 + read_word(data, 36), 2,
+                                 not read_word(data, 4))
+        else:
+            raise Revert("unknown selector")
+        if self.max_multicall_calls and len(calls) > self.max_multicall_calls:
+            raise NodeError("out of gas")
+
+        results = []
+        for target, allow_failure, calldata in calls:
+            try:
+                results.append((True, self.call(target, calldata, block)))
+            except Revert:
+                if not allow_failure:
+                    raise
+                results.append((False, b""))
+        if selector == TRY_BLOCK_AND_AGGREGATE:
+            return word(block.number) + bytes.fromhex(block.hash[2:]) + \
+                word(96) + encode_results(results)
+        return word(32) + encode_results(results)
+
+    def get_pool_address(self, dex_name: str, data: bytes) -> bytes:
+        """
+        getPair of a v2 factory, getPool of a v3 one.
+        """
+        selector = data[:4]
+        if selector != (GET_POOL if dex_name.endswith("v3") else GET_PAIR):
+            raise Revert("unknown selector")
+        pool = self.get_pool(dex_name, read_address(data, 4), read_address(data, 36))
+        if pool is None or (selector == GET_POOL and read_word(data, 68) != V3_FEE):
+            return address_word(ZERO_ADDRESS)
+        return address_word(pool.address)
+
+    def get_amounts(self, dex_name: str, data: bytes, block: Block) -> bytes:
+        """
+        getAmountsOut and getAmountsIn of a v2 router.
+        """
+        selector = data[:4]
+        if selector not in (GET_AMOUNTS_OUT, GET_AMOUNTS_IN):
+            raise Revert("unknown selector")
+        start = 4 + read_word(data, 36)
+        tokens = [read_address(data, start + 32 * (i + 1))
+                  for i in range(read_word(data, start))]
+        if len(tokens) < 2:
+            raise Revert("UniswapV2Library: INVALID_PATH")
+        hops = []
+        for token_in, token_out in zip(tokens, tokens[1:]):
+            pool = self.get_pool(dex_name, token_in, token_out)
+            if pool is None or pool.is_v3:
+                raise Revert("no pair")
+            hops.append(self.get_reserves(pool, token_in, block))
+
+        amounts = [read_word(data, 4)]
+        if selector == GET_AMOUNTS_OUT:
+            for reserve_in, reserve_out in hops:
+                amount_in_with_fee = amounts[-1] * 997
+                amounts.append(amount_in_with_fee * reserve_out //
+                               (reserve_in * 1000 + amount_in_with_fee))
+        else:
+            for reserve_in, reserve_out in reversed(hops):
+                if amounts[0] >= reserve_out:
+                    raise Revert("UniswapV2Library: INSUFFICIENT_LIQUIDITY")
+                amounts.insert(0, reserve_in * amounts[0] * 1000 //
+                               ((reserve_out - amounts[0]) * 997) + 1)
+        return word(32) + word(len(amounts)) + b"".join(word(amount) for amount in amounts)
+
+    def quote(self, dex_name: str, data: bytes, block: Block) -> bytes:
+        """
+        quoteExactInputSingle and quoteExactOutputSingle of a v3 quoter, as
+        a swap along the virtual reserves.
+        """
+        selector = data[:4]
+        if selector not in (QUOTE_EXACT_INPUT_SINGLE, QUOTE_EXACT_OUTPUT_SINGLE):
+            raise Revert("unknown selector")
+        token_in, token_out = read_address(data, 4), read_address(data, 36)
+        amount, fee = read_word(data, 68), read_word(data, 100)
+        pool = self.get_pool(dex_name, token_in, token_out)
+        if pool is None or fee != V3_FEE:
+            raise Revert("no pool")
+        reserve_in, reserve_out = self.get_reserves(pool, token_in, block)
+        if selector == QUOTE_EXACT_INPUT_SINGLE:
+            amount_in = amount
+            amount_in_with_fee = amount * (10**6 - fee) // 10**6
+            amount_out = reserve_out * amount_in_with_fee // (reserve_in + amount_in_with_fee)
+        else:
+            if amount >= reserve_out:
+                raise Revert("SPL")
+            amount_out = amount
+            amount_in = reserve_in * amount // (reserve_out - amount) * \
+                10**6 // (10**6 - fee) + 1
+        reserve_in += amount_in
+        reserve_out -= amount_out
+        if token_in != pool.token0:
+            reserve_in, reserve_out = reserve_out, reserve_in
+        return word(amount_out if selector == QUOTE_EXACT_INPUT_SINGLE else amount_in) + \
+            word(get_sqrt_price(reserve_in, max(reserve_out, 1))) + word(0) + word(QUOTE_GAS)
+
+    def get_logs(self, log_filter: dict) -> list[dict]:
+        """
+        The Sync events of the v2 pairs and the Swap events of the v3 pools
+        changed in the blocks of the filter. Topics past the first aren't
+        filtered.
+        """
+        if "blockHash" in log_filter:
+            blocks = [self.blocks.get(log_filter["blockHash"].lower())]
+        else:
+            first = self.get_block(log_filter.get("fromBlock", "latest"))
+            last = self.get_block(log_filter.get("toBlock", "latest"))
+            blocks = [None] if first is None or last is None else \
+                [self.get_canonical_block(number)
+                 for number in range(first.number, last.number + 1)]
+        if None in blocks:
+            raise NodeError("block range is not available")
+
+        addresses = log_filter.get("address")
+        if isinstance(addresses, str):
+            addresses = [addresses]
+        addresses = {address.lower() for address in addresses} if addresses else None
+        topics = (log_filter.get("topics") or [None])[0]
+        if isinstance(topics, str):
+            topics = [topics]
+        topics = {topic.lower() for topic in topics} if topics else None
+
+        logs = []
+        for block in blocks:
+            for index, (address, (reserve0, reserve1)) in enumerate(block.changes.items()):
+                pool = self.pools[address]
+                topic = SWAP_TOPIC if pool.is_v3 else SYNC_TOPIC
+                if (addresses and address not in addresses) or \
+                        (topics and topic not in topics):
+                    continue
+                if pool.is_v3:
+                    sqrt_price = get_sqrt_price(reserve0, reserve1)
+                    data = word(0) + word(0) + word(sqrt_price) + \
+                        word(math.isqrt(reserve0 * reserve1)) + \
+                        word(get_tick(sqrt_price) % 2**256)
+                    log_topics = [topic, ZERO_HASH, ZERO_HASH]
+                else:
+                    data = word(reserve0) + word(reserve1)
+                    log_topics = [topic]
+                logs.append({"address": address,
+                             "topics": log_topics,
+                             "data": "0x" + data.hex(),
+                             "blockNumber": hex(block.number),
+                             "blockHash": block.hash,
+                             "transactionHash": "0x" + keccak(
+                                 bytes.fromhex(block.hash[2:]) + word(index)).hex(),
+                             "transactionIndex": hex(index),
+                             "logIndex": hex(index),
+                             "removed": False})
+        return logs
+
+    def get_address_data(self) -> dict:
+        dexes = {}
+        for dex_name in self.dex_names:
+            kind = "quoter" if dex_name.endswith("v3") else "router"
+            dexes[dex_name] = {
+                kind + "_address": to_checksum_address(self.get_address(kind, dex_name)),
+                "factory_address": to_checksum_address(self.get_address("factory", dex_name))}
+        return {"dex": dexes,
+                "token": {name: {"address": self.token_addresses[name],
+                                 "relative_price": self.relative_prices[name],
+                                 "decimals": self.decimals[name]}
+                          for name in self.token_names}}
+
+    def write_assets(self, assets_folder: str, healthy: bool = False) -> None:
+        """
+        Writes the address_data.json of the market to an assets folder.
+        With healthy, the healthy files of every pool as well, which the
+        networks the bot doesn't run as primary need.
+        """
+        os.makedirs(assets_folder, exist_ok=True)
+        address_data = self.get_address_data()
+        with open(os.path.join(assets_folder, "address_data.json"), "w") as file:
+            json.dump(address_data, file, indent=4)
+        if not healthy:
+            return
+
+        path_names = []
+        addresses = ({}, {})
+        for pool in self.pools.values():
+            token0 = self.token_names_by_address[pool.token0]
+            token1 = self.token_names_by_address[pool.token1]
+            for from_token, to_token in [(token0, token1), (token1, token0)]:
+                path_name = "{} {} {}".format(pool.dex_name, from_token, to_token)
+                path_names.append(path_name)
+                addresses[pool.is_v3][path_name] = to_checksum_address(pool.address)
+        with open(os.path.join(assets_folder, "healthy_paths"), "w") as file:
+            file.write("".join(name + "\n" for name in path_names))
+        for asset_name, content in [("healthy_pairs.json", addresses[False]),
+                                    ("healthy_pools.json", addresses[True])]:
+            with open(os.path.join(assets_folder, asset_name), "w") as file:
+                json.dump(content, file, indent=4)
+
+        def generate():
+            Data.use(create_namespace(assets_folder=assets_folder))
+            Data.address_data = address_data
+            generate_healthy_loop_names()
+            generate_healthy_triangle_names()
+
+        contextvars.copy_context().run(generate)
+
+    def get_report(self) -> str:
+        return "block {}, {} pools, {} calls, {} reorgs".format(
+            self.head.number, len(self.pools), self.calls, self.reorgs)
+
+
+class SimulatedNode:
+    """
+    Serves a SimulatedMarket as a JSON-RPC node: single and batched posts
+    on /, and websockets on the same url, which answer the same methods and
+    eth_subscribe to newHeads. A block is mined every block_time seconds.
+    Each answer waits latency seconds, give or take jitter, plus
+    call_latency per call it made, multicalled ones included, and
+    error_rate of the posts fail with a 503, so the hedging, the batch
+    sizing and the bisection of the bot meet a loaded node.
+    Transactions aren't supported. The node runs in the process of the bot
+    or of a test as well as on its own, from simulate.py.
+    """
+
+    def __init__(self, market: SimulatedMarket,
+                 block_time: float = 1,
+                 latency: float = 0,
+                 jitter: float = 0,
+                 call_latency: float = 0,
+                 error_rate: float = 0,
+                 seed: int = 0) -> None:
+        self.market = market
+        self.block_time = block_time
+        self.latency = latency
+        self.jitter = jitter
+        self.call_latency = call_latency
+        self.error_rate = error_rate
+        self.random = random.Random(seed)
+        self.methods = {
+            "web3_clientVersion": lambda: "SimulatedNode",
+            "net_version": lambda: str(market.chain_id),
+            "eth_chainId": lambda: hex(market.chain_id),
+            "eth_blockNumber": lambda: hex(market.head.number),
+            "eth_gasPrice": lambda: hex(GAS_PRICE),
+            "eth_getBlockByNumber": lambda identifier, full=False:
+                market.get_header(market.get_block(identifier)),
+            "eth_getBlockByHash": lambda block_hash, full=False:
+                market.get_header(market.blocks.get(block_hash.lower())),
+            "eth_getCode": lambda address, identifier="latest":
+                market.get_code(address),
+            "eth_call": self.call,
+            "eth_getLogs": market.get_logs}
+        self.subscriptions = {}
+        self.ids = itertools.count(1)
+        self.metrics = Counter()
+        self.runner = None
+        self.task = None
+        self.url = None
+        self.ws_url = None
+
+    async def start(self, host: str = "127.0.0.1", port: int = 8545) -> None:
+        """
+        Serves on host and port, 0 picks a free port, and starts mining.
+        """
+        app = web.Application(client_max_size=2**26)
+        app.router.add_post("/", self.handle_post)
+        app.router.add_get("/", self.handle_websocket)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+        await web.TCPSite(self.runner, host, port).start()
+        host, port = self.runner.addresses[0][:2]
+        self.url = "http://{}:{}".format(host, port)
+        self.ws_url = "ws://{}:{}".format(host, port)
+        self.task = asyncio.ensure_future(self.produce())
+
+    async def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+
+    async def produce(self) -> None:
+        """
+        Mines on a steady cadence, however long a block takes to mine.
+        """
+        loop = asyncio.get_running_loop()
+        next_time = loop.time()
+        while True:
+            next_time += self.block_time
+            await asyncio.sleep(max(next_time - loop.time(), 0))
+            for block in self.market.mine():
+                await self.publish(block)
+
+    async def publish(self, block: Block) -> None:
+        header = self.market.get_header(block)
+        for subscription_id, websocket in list(self.subscriptions.items()):
+            try:
+                await websocket.send_json({"jsonrpc": "2.0",
+                                           "method": "eth_subscription",
+                                           "params": {"subscription": subscription_id,
+                                                      "result": header}})
+            except ConnectionError:
+                del self.subscriptions[subscription_id]
+
+    def call(self, transaction: dict, identifier="latest") -> str:
+        block = self.market.get_block(identifier)
+        if block is None:
+            raise NodeError("header not found")
+        if block.states is None:
+            raise NodeError("missing trie node")
+        data = transaction.get("data") or transaction.get("input") or "0x"
+        return "0x" + self.market.call(transaction["to"].lower(),
+                                       bytes.fromhex(data[2:]), block).hex()
+
+    def handle(self, request: dict) -> dict:
+        response = {"jsonrpc": "2.0", "id": request.get("id")}
+        method = request.get("method")
+        self.metrics[method] += 1
+        try:
+            if method not in self.methods:
+                raise NodeError("the method {} does not exist".format(method), -32601)
+            response["result"] = self.methods[method](*(request.get("params") or []))
+        except NodeError as e:
+            response["error"] = {"code": e.code, "message": str(e)}
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            response["error"] = {"code": -32602, "message": "invalid params: {}".format(e)}
+        return response
+
+    async def answer(self, payload):
+        """
+        Handles a request or a batch, and waits as long as the node takes.
+        """
+        calls = self.market.calls
+        if isinstance(payload, list):
+            response = [self.handle(request) for request in payload]
+        else:
+            response = self.handle(payload)
+        delay = self.latency + self.call_latency * (self.market.calls - calls)
+        if self.jitter:
+            delay += self.random.gauss(0, self.jitter)
+        if delay > 0:
+            await asyncio.sleep(delay)
+        return response
+
+    async def handle_post(self, request: web.Request) -> web.Response:
+        if self.error_rate and self.random.random() < self.error_rate:
+            self.metrics["failed_posts"] += 1
+            return web.Response(status=503)
+        return web.json_response(await self.answer(await request.json()))
+
+    async def handle_websocket(self, request: web.Request) -> web.WebSocketResponse:
+        websocket = web.WebSocketResponse()
+        await websocket.prepare(request)
+        subscription_ids = set()
+        try:
+            async for message in websocket:
+                if message.type != WSMsgType.TEXT:
+                    continue
+                payload = json.loads(message.data)
+                method = payload.get("method") if isinstance(payload, dict) else None
+                if method == "eth_subscribe" and payload.get("params") == ["newHeads"]:
+                    subscription_id = hex(next(self.ids))
+                    subscription_ids.add(subscription_id)
+                    self.subscriptions[subscription_id] = websocket
+                    response = {"jsonrpc": "2.0", "id": payload.get("id"),
+                                "result": subscription_id}
+                elif method == "eth_unsubscribe":
+                    subscription_id = (payload.get("params") or [None])[0]
+                    response = {"jsonrpc": "2.0", "id": payload.get("id"),
+                                "result": self.subscriptions.pop(subscription_id, None)
+                                is not None}
+                else:
+                    response = await self.answer(payload)
+                await websocket.send_json(response)
+        finally:
+            for subscription_id in subscription_ids:
+                self.subscriptions.pop(subscription_id, None)
+        return websocket
+
+    def get_report(self) -> str:
+        return "{}, {} requests, {} failed posts, {} subscribers".format(
+            self.market.get_report(),
+            sum(count for method, count in self.metrics.items()
+                if method != "failed_posts"),
+            self.metrics["failed_posts"], len(self.subscriptions))
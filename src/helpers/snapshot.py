@@ -0,0 +1,201 @@
+from collections.abc import Mapping
+from dataclasses import dataclass, replace
+from models.market import Path
+from models.data import Data
+from helpers.pruning import get_path_liquidity, get_v3_virtual_reserves
+
+
+def get_liquidity(reserves: Mapping, v3_states: Mapping) -> dict:
+    return {**{path: get_path_liquidity(path, reserve)
+               for path, reserve in reserves.items()},
+            **{path: get_path_liquidity(path, get_v3_virtual_reserves(path, state))
+               for path, state in v3_states.items()}}
+
+
+MISSING = object()
+
+
+class Overlay(Mapping):
+    """
+    A read-only mapping made of layers of dicts, newest first, over a base
+    dict. A block's mapping is its changes layered over its parent's, so
+    building it allocates in proportion to the changes, and the parent's
+    stays as it was. Lookups walk the layers, so merge compacts them into
+    a new base once there are max_layers of them, or once they hold more
+    than a compact_share of the base's keys.
+    Pickles as its compacted dict, to be handed to worker processes.
+    """
+    __slots__ = ("layers", "length", "layer_size")
+
+    def __init__(self, layers: tuple[dict, ...], length: int,
+                 layer_size: int = 0) -> None:
+        self.layers = layers
+        self.length = length
+        # Keys held by the layers above the base.
+        self.layer_size = layer_size
+
+    @staticmethod
+    def create(mapping) -> "Overlay":
+        base = dict(mapping)
+        return Overlay((base,), len(base))
+
+    def __getitem__(self, key):
+        for layer in self.layers:
+            value = layer.get(key, MISSING)
+            if value is not MISSING:
+                return value
+        raise KeyError(key)
+
+    def get(self, key, default=None):
+        for layer in self.layers:
+            value = layer.get(key, MISSING)
+            if value is not MISSING:
+                return value
+        return default
+
+    def __contains__(self, key) -> bool:
+        for layer in self.layers:
+            if key in layer:
+                return True
+        return False
+
+    def __len__(self) -> int:
+        return self.length
+
+    def __iter__(self):
+        return iter(self.compact() if len(self.layers) > 1 else self.layers[0])
+
+    def without(self, keys: set, memo: dict) -> "Overlay":
+        """
+        Drops the keys. The layers shared by several mappings are filtered
+        once, through the memo, so they stay shared.
+        """
+        removed = [key for key in keys if key in self]
+        if not removed:
+            return self
+        layers = []
+        for layer in self.layers:
+            if any(key in layer for key in removed):
+                # Holding the layer keeps its id from being reused.
+                layer = memo.setdefault(id(layer), (layer, {
+                    key: value for key, value in layer.items()
+                    if key not in keys}))[1]
+            layers.append(layer)
+        return Overlay(tuple(layers), self.length - len(removed),
+                       self.layer_size)
+
+    def compact(self) -> dict:
+        merged = {}
+        for layer in reversed(self.layers):
+            merged.update(layer)
+        return merged
+
+    def __reduce__(self):
+        return (Overlay.create, (self.compact(),))
+
+
+def merge(mapping: Overlay, changes: dict,
+          max_layers: int = 4,
+          compact_share: float = 0.25) -> Overlay:
+    """
+    Returns mapping itself without changes, the changes layered over it
+    otherwise. The values of the unchanged keys are shared.
+    """
+    if not changes:
+        return mapping
+    length = len(mapping) + sum(1 for key in changes if key not in mapping)
+    layers = (dict(changes),) + mapping.layers
+    layer_size = mapping.layer_size + len(changes)
+    if len(layers) > max_layers or \
+            layer_size > compact_share * len(mapping.layers[-1]):
+        merged = Overlay(layers, length).compact()
+        return Overlay((merged,), length)
+    return Overlay(layers, length, layer_size)
+
+
+@dataclass(frozen=True)
+class MarketSnapshot:
+    """
+    The market as of one block: v2 reserves, v3 pool states, the liquidity
+    index derived from them and the topology they were read for. Nothing
+    in a snapshot changes once it exists, so pricing and searches take one
+    explicitly and several can run side by side, on different blocks.
+    The next block's snapshot is built with evolve, which layers the
+    changes over the parent's mappings and recomputes the liquidity of the
+    changed paths alone. Snapshots pickle, to be handed to worker
+    processes, and their paths unpickle as the interned paths of the
+    network the loading process works on.
+    """
+    block_number: int
+    block_hash: str
+    reserves: Mapping[Path, tuple[int, int]]
+    v3_states: Mapping[Path, tuple[int, int]]
+    liquidity: Mapping[Path, tuple[float, float]]
+    lines: dict
+    triangles: dict
+
+    @staticmethod
+    def create(block_number: int,
+               block_hash: str,
+               reserves: dict,
+               v3_states: dict,
+               lines: dict = None,
+               triangles: dict = None) -> "MarketSnapshot":
+        return MarketSnapshot(block_number, block_hash,
+                              Overlay.create(reserves),
+                              Overlay.create(v3_states),
+                              Overlay.create(get_liquidity(reserves, v3_states)),
+                              lines, triangles)
+
+    @property
+    def block_identifier(self):
+        """
+        What eth_calls pin to: the hash through the provider pool, the
+        number through brownie.
+        """
+        return {"blockHash": self.block_hash} if Data.rpc_pool else self.block_number
+
+    def get_changes(self, reserves: dict,
+                    v3_states: dict) -> tuple[dict, dict]:
+        """
+        Keeps the values which differ from this snapshot.
+        """
+        return ({path: reserve for path, reserve in reserves.items()
+                 if self.reserves.get(path) != reserve},
+                {path: state for path, state in v3_states.items()
+                 if self.v3_states.get(path) != state})
+
+    def evolve(self, block_number: int,
+               block_hash: str,
+               reserve_changes: dict,
+               v3_state_changes: dict) -> "MarketSnapshot":
+        return MarketSnapshot(block_number, block_hash,
+                              merge(self.reserves, reserve_changes),
+                              merge(self.v3_states, v3_state_changes),
+                              merge(self.liquidity,
+                                    get_liquidity(reserve_changes, v3_state_changes)),
+                              self.lines, self.triangles)
+
+    def with_topology(self, lines: dict,
+                      triangles: dict,
+                      removed_paths: set = frozenset(),
+                      memo: dict = None) -> "MarketSnapshot":
+        """
+        Moves the snapshot to new lines and triangles, without the state of
+        the removed paths. Snapshots sharing layers share a memo.
+        """
+        memo = {} if memo is None else memo
+        return replace(self, lines=lines, triangles=triangles,
+                       reserves=self.reserves.without(removed_paths, memo),
+                       v3_states=self.v3_states.without(removed_paths, memo),
+                       liquidity=self.liquidity.without(removed_paths, memo))
+
+    def get_reserves(self, path: Path) -> tuple[float, float]:
+        """
+        The reserves of a v2 path or the virtual reserves of a v3 path,
+        (0, 0) when unknown.
+        """
+        if path.is_v3:
+            state = self.v3_states.get(path)
+            return get_v3_virtual_reserves(path, state) if state else (0, 0)
+        return self.reserves.get(path, (0, 0))
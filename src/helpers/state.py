@@ -0,0 +1,322 @@
+import asyncio
+from dataclasses import dataclass, field
+from eth_utils import keccak
+from models.market import Path
+from models.data import Data
+from helpers.blocks import Head, normalize_header
+from helpers.price import fetch_v2_reserves, fetch_v3_states, get_path_states
+from helpers.rpc import send_request
+from helpers.snapshot import MarketSnapshot
+
+# Every event which changes the reserves of a v2 pair or the state of a
+# v3 pool. v2 mints and burns emit Sync as well.
+STATE_TOPICS = ["0x" + keccak(text=signature).hex() for signature in [
+    "Sync(uint112,uint112)",
+    "Swap(address,address,int256,int256,uint160,uint128,int24)",
+    "Mint(address,address,int24,int24,uint128,uint256,uint256)",
+    "Burn(address,int24,int24,uint128,uint256,uint256)"]]
+# Blocks and addresses per eth_getLogs when catching up on a range.
+LOG_RANGE = 500
+LOG_ADDRESSES = 200
+
+
+@dataclass
+class BlockState:
+    number: int
+    hash: str
+    parent_hash: str
+    snapshot: MarketSnapshot
+    # Paths this block changed.
+    changed: set = field(default_factory=set)
+
+
+async def get_header(block_hash: str) -> dict:
+    return await send_request("eth_getBlockByHash", [block_hash, False])
+
+
+async def get_header_by_number(block_number: int) -> dict:
+    return await send_request("eth_getBlockByNumber", [hex(block_number), False])
+
+
+async def get_touched_addresses(block_hash: str) -> set[str]:
+    """
+    Returns the addresses which emitted a state changing event in a block.
+    """
+    logs = await send_request("eth_getLogs", [{"blockHash": block_hash,
+                                               "topics": [STATE_TOPICS]}])
+    return {log["address"].lower() for log in logs}
+
+
+async def get_range_touched_addresses(first_block: int,
+                                      last_block: int,
+                                      addresses: list[str]) -> set[str]:
+    """
+    Returns which of the addresses emitted a state changing event between
+    two blocks, both included. The filters hold LOG_RANGE blocks and
+    LOG_ADDRESSES addresses, to stay within the result limits of providers.
+    """
+    touched = set()
+    for start in range(first_block, last_block + 1, LOG_RANGE):
+        for i in range(0, len(addresses), LOG_ADDRESSES):
+            logs = await send_request("eth_getLogs", [{
+                "fromBlock": hex(start),
+                "toBlock": hex(min(start + LOG_RANGE - 1, last_block)),
+                "address": addresses[i:i + LOG_ADDRESSES],
+                "topics": [STATE_TOPICS]}])
+            touched.update(log["address"].lower() for log in logs)
+    return touched
+
+
+async def fetch_all_states(head: Head) -> tuple[dict, dict]:
+    """
+    Returns the reserves and v3 states of every path, pinned to the head.
+    """
+    block_identifier = {"blockHash": head.hash} if Data.rpc_pool else head.number
+    return await asyncio.gather(fetch_v2_reserves(block_identifier),
+                                fetch_v3_states(block_identifier))
+
+
+async def fetch_path_states(paths: list[Path], head: Head) -> tuple[dict, dict]:
+    return await get_path_states(paths, {"blockHash": head.hash})
+
+
+class StateManager:
+    """
+    Keeps a market snapshot per block of the canonical chain, each built
+    on its parent's and sharing what didn't change. When a head doesn't
+    build on the known tip, the blocks back to the common ancestor are
+    dropped, and only the paths they changed, together with the paths
+    touched on the new branch, are read again on top of the ancestor's
+    snapshot.
+    Opportunities are filed under the hash of the state they were found
+    on and dropped when that block is orphaned.
+    A manager restored from a checkpoint catches up on its first head by
+    reading only the paths touched since the checkpoint block, unless that
+    block was orphaned, is more than max_catch_up_blocks old, or the logs
+    since it can't be read.
+    The chain access is injected, so the manager runs against any chain
+    stand-in.
+    """
+
+    def __init__(self, max_depth: int = 64,
+                 max_catch_up_blocks: int = 1000,
+                 get_header=get_header,
+                 get_header_by_number=get_header_by_number,
+                 get_touched_addresses=get_touched_addresses,
+                 get_range_touched_addresses=get_range_touched_addresses,
+                 fetch_all_states=fetch_all_states,
+                 fetch_path_states=fetch_path_states) -> None:
+        self.max_depth = max_depth
+        self.max_catch_up_blocks = max_catch_up_blocks
+        self.get_header = get_header
+        self.get_header_by_number = get_header_by_number
+        self.get_touched_addresses = get_touched_addresses
+        self.get_range_touched_addresses = get_range_touched_addresses
+        self.fetch_all_states = fetch_all_states
+        self.fetch_path_states = fetch_path_states
+        self.chain = []
+        self.opportunities = {}
+        self.address_paths = None
+        self.stale = False
+        self.catch_up_paths = None
+        self.reorgs = 0
+        self.invalidated = 0
+
+    @property
+    def tip(self) -> BlockState:
+        return self.chain[-1] if self.chain else None
+
+    @property
+    def snapshot(self) -> MarketSnapshot:
+        return self.tip.snapshot if self.chain else None
+
+    def get_address_paths(self) -> dict[str, list[Path]]:
+        if self.address_paths is None:
+            self.address_paths = {}
+            for path in self.snapshot.reserves.keys() | self.snapshot.v3_states.keys():
+                contract = Data.pools[str(path)] if path.is_v3 else \
+                    Data.pairs[str(path)]
+                self.address_paths.setdefault(
+                    contract.address.lower(), []).append(path)
+        return self.address_paths
+
+    def set_topology(self, lines: dict, triangles: dict, paths: set) -> None:
+        """
+        Moves every kept snapshot to new lines and triangles and drops the
+        state of the paths which are gone. Paths which are new have no
+        state yet, so the next block reads all of them, even on a reorg.
+        """
+        if self.chain:
+            removed_paths = {path for path in self.snapshot.reserves.keys() |
+                             self.snapshot.v3_states.keys()
+                             if path not in paths}
+            memo = {}
+            for block in self.chain:
+                block.snapshot = block.snapshot.with_topology(
+                    lines, triangles, removed_paths, memo)
+                block.changed &= paths
+        if self.catch_up_paths is not None:
+            self.catch_up_paths &= paths
+        self.address_paths = None
+        self.stale = True
+
+    def is_canonical(self, block_hash: str) -> bool:
+        return any(block.hash == block_hash for block in reversed(self.chain))
+
+    def add_opportunities(self, block_hash: str, opportunities: list) -> bool:
+        """
+        Files opportunities under the block they were found on. Returns
+        False, filing nothing, when that block is no longer canonical.
+        """
+        if not self.is_canonical(block_hash):
+            return False
+        self.opportunities.setdefault(block_hash, []).extend(opportunities)
+        return True
+
+    def push(self, head: Head, reserves: dict, v3_states: dict) -> set[Path]:
+        """
+        Builds the head's snapshot on top of the tip and returns the
+        changed paths.
+        """
+        reserve_changes, v3_state_changes = self.snapshot.get_changes(
+            reserves, v3_states)
+        changed = reserve_changes.keys() | v3_state_changes.keys()
+        self.chain.append(BlockState(
+            head.number, head.hash, head.parent_hash,
+            self.snapshot.evolve(head.number, head.hash,
+                                 reserve_changes, v3_state_changes),
+            changed))
+        for block in self.chain[:-self.max_depth]:
+            self.opportunities.pop(block.hash, None)
+        del self.chain[:-self.max_depth]
+        return changed
+
+    def rollback(self, ancestor_hash: str) -> set[Path]:
+        """
+        Drops the blocks above the ancestor and returns the paths they had
+        changed.
+        """
+        changed = set()
+        while self.tip.hash != ancestor_hash:
+            block = self.chain.pop()
+            changed.update(block.changed)
+            self.invalidated += len(self.opportunities.pop(block.hash, []))
+        return changed
+
+    async def find_branch(self, head: Head) -> tuple[str, list[str]]:
+        """
+        Walks back from the head to the newest known block. Returns its hash
+        and the hashes of the new branch, None when it is out of reach.
+        """
+        known = {block.hash for block in self.chain}
+        branch = [head.hash]
+        parent_hash = head.parent_hash
+        while parent_hash not in known:
+            if len(branch) >= self.max_depth:
+                return None, branch
+            _, block_hash, parent_hash = normalize_header(
+                await self.get_header(parent_hash))
+            branch.append(block_hash)
+        return parent_hash, branch
+
+    async def reset(self, head: Head) -> set[Path]:
+        self.chain = []
+        self.opportunities = {}
+        self.stale = False
+        self.catch_up_paths = None
+        reserves, v3_states = await self.fetch_all_states(head)
+        snapshot = MarketSnapshot.create(head.number, head.hash,
+                                         reserves, v3_states,
+                                         Data.lines, Data.triangles)
+        changed = reserves.keys() | v3_states.keys()
+        self.chain.append(BlockState(head.number, head.hash, head.parent_hash,
+                                     snapshot, changed))
+        return changed
+
+    def restore(self, block_number: int,
+                block_hash: str,
+                parent_hash: str,
+                reserves: dict,
+                v3_states: dict,
+                paths: set[Path]) -> None:
+        """
+        Starts from a checkpointed block. The paths given are read again
+        when catching up, along with the touched ones.
+        """
+        self.chain = [BlockState(block_number, block_hash, parent_hash,
+                                 MarketSnapshot.create(block_number, block_hash,
+                                                       reserves, v3_states,
+                                                       Data.lines, Data.triangles))]
+        self.opportunities = {}
+        self.address_paths = None
+        self.catch_up_paths = set(paths)
+
+    async def catch_up(self, head: Head) -> set[Path]:
+        paths, self.catch_up_paths = self.catch_up_paths, None
+        if head.number - self.tip.number > self.max_catch_up_blocks:
+            print("Checkpoint block {} is {} blocks old, reloading".format(
+                self.tip.number, head.number - self.tip.number))
+            return await self.reset(head)
+        _, block_hash, _ = normalize_header(
+            await self.get_header_by_number(self.tip.number))
+        if block_hash != self.tip.hash:
+            print("Checkpoint block {} was orphaned, reloading".format(
+                self.tip.number))
+            return await self.reset(head)
+
+        address_paths = self.get_address_paths()
+        try:
+            touched = await self.get_range_touched_addresses(
+                self.tip.number + 1, head.number, list(address_paths))
+        except Exception as e:
+            print("Reading the logs since checkpoint block {} failed, "
+                  "reloading: {}".format(self.tip.number, e))
+            return await self.reset(head)
+        for address in touched:
+            paths.update(address_paths.get(address, []))
+        print("Catching up from checkpoint block {} to {}, reading {} paths".format(
+            self.tip.number, head.number, len(paths)))
+        reserves, v3_states = await self.fetch_path_states(list(paths), head)
+        return self.push(head, reserves, v3_states) | paths
+
+    async def update(self, head: Head) -> set[Path]:
+        """
+        Brings the snapshot to the head and returns the paths which changed.
+        """
+        if self.tip is None:
+            return await self.reset(head)
+        if head.hash == self.tip.hash:
+            return set()
+        if self.catch_up_paths is not None:
+            return await self.catch_up(head)
+
+        if head.parent_hash != self.tip.hash and \
+                not any(block.hash == head.parent_hash for block in self.chain):
+            ancestor_hash, branch = await self.find_branch(head)
+        else:
+            ancestor_hash, branch = head.parent_hash, [head.hash]
+
+        if ancestor_hash is None:
+            print("No common ancestor within {} blocks, reloading".format(
+                self.max_depth))
+            self.reorgs += 1
+            return await self.reset(head)
+
+        if ancestor_hash == self.tip.hash:
+            self.stale = False
+            return self.push(head, *await self.fetch_all_states(head))
+
+        self.reorgs += 1
+        changed = self.rollback(ancestor_hash)
+        address_paths = self.get_address_paths()
+        for block_hash in branch:
+            for address in await self.get_touched_addresses(block_hash):
+                changed.update(address_paths.get(address, []))
+        print("Reorg to {} at {}, rolled back to {} and reading {} paths".format(
+            head.hash, head.number, ancestor_hash, len(changed)))
+        if self.stale:
+            self.stale = False
+            reserves, v3_states = await self.fetch_all_states(head)
+        else:
+            reserves, v3_states = await self.fetch_path_states(list(changed), head)
+        return self.push(head, reserves, v3_states) | changed
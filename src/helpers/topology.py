@@ -0,0 +1,225 @@
+import asyncio
+import contextvars
+import json
+import os
+import time
+from dataclasses import dataclass
+from models.market import Path
+from models.data import Data
+from helpers.discovery import load_patched_contracts
+from helpers.paths import (generate_all_paths,
+                           get_healthy_paths,
+                           get_loop_names,
+                           get_loops,
+                           get_pair_address_from_path,
+                           get_pool_address_from_path,
+                           get_triangle_names,
+                           get_triangles)
+from helpers.scheduling import CycleScheduler
+
+
+@dataclass
+class Topology:
+    paths: list[Path]
+    pairs: dict
+    pools: dict
+    lines: dict
+    triangles: dict
+    scheduler: CycleScheduler
+    summary: str
+
+
+def write_asset(asset_name: str, content: str) -> None:
+    """
+    Replaces an asset file at once, a restart never reads half of it.
+    """
+    asset_file = Data.get_asset_path(asset_name)
+    with open(asset_file + ".tmp", "w") as file:
+        file.write(content)
+    os.replace(asset_file + ".tmp", asset_file)
+
+
+class TopologyRefresher:
+    """
+    Rebuilds the healthy paths, pairs, pools, loops and triangles every
+    interval seconds without stopping the detection loop. Paths are checked
+    in chunks of chunk_size, only while the detection loop is idle between
+    blocks and at most max_calls_per_second, so the refresh never competes
+    with a block for the node. The cycles and the scheduler of the new
+    topology are built in the worker pool.
+    The result waits in pending until the detection loop calls begin_block,
+    which swaps it in between two blocks, with nothing to await. The new
+    scheduler keeps what the old one learned about the surviving cycles.
+    The healthy files are rewritten too, for the next start.
+    The chain access is injected, so the refresh runs against stand-ins.
+    """
+
+    def __init__(self, interval: float = 3600,
+                 chunk_size: int = 64,
+                 max_calls_per_second: float = 20,
+                 get_healthy_paths=get_healthy_paths,
+                 get_pair_address=get_pair_address_from_path,
+                 get_pool_address=get_pool_address_from_path) -> None:
+        self.interval = interval
+        self.chunk_size = chunk_size
+        self.max_calls_per_second = max_calls_per_second
+        self.get_healthy_paths = get_healthy_paths
+        self.get_pair_address = get_pair_address
+        self.get_pool_address = get_pool_address
+        self.idle = asyncio.Event()
+        self.idle.set()
+        self.pending = None
+        self.task = None
+        self.refreshes = 0
+
+    @staticmethod
+    def from_env() -> "TopologyRefresher":
+        """
+        Refreshes every TOPOLOGY_REFRESH_SECONDS, returns None if it is not
+        set.
+        """
+        interval = Data.get_env("TOPOLOGY_REFRESH_SECONDS")
+        if not interval:
+            return None
+        return TopologyRefresher(
+            float(interval),
+            max_calls_per_second=float(Data.get_env("TOPOLOGY_CALLS_PER_SECOND", 20)))
+
+    def start(self) -> None:
+        if self.task is None:
+            self.task = asyncio.ensure_future(self.run())
+
+    def stop(self) -> None:
+        if self.task is not None:
+            self.task.cancel()
+            self.task = None
+
+    async def run(self) -> None:
+        while True:
+            await asyncio.sleep(self.interval)
+            try:
+                await self.refresh()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                print("Topology refresh failed: {}".format(e))
+
+    def begin_block(self) -> bool:
+        """
+        Swaps the pending topology in, if any, and holds the refresh until
+        end_block. Returns whether the topology changed.
+        """
+        self.idle.clear()
+        topology, self.pending = self.pending, None
+        if topology is None:
+            return False
+        Data.pairs = topology.pairs
+        Data.pools = topology.pools
+        Data.version_paths = {version: [path for path in topology.paths
+                                        if path.dex.name.endswith(version)]
+                              for version in ["v2", "v3"]}
+        Data.reserve_reader = None
+        Data.state_reader = None
+        Data.lines = topology.lines
+        Data.triangles = topology.triangles
+        if Data.scheduler:
+            topology.scheduler.adopt(Data.scheduler)
+        Data.scheduler = topology.scheduler
+        if Data.state:
+            Data.state.set_topology(topology.lines, topology.triangles,
+                                    set(topology.paths))
+        if Data.history:
+            Data.history = Data.history.resize(
+                Path.get_all_v2_paths() + Path.get_all_v3_paths())
+        self.refreshes += 1
+        print(topology.summary)
+        return True
+
+    def end_block(self) -> None:
+        self.idle.set()
+
+    async def throttle(self, function, items: list, calls_per_item: int) -> list:
+        """
+        Awaits function on the items chunk by chunk and concatenates the
+        results.
+        """
+        results = []
+        for i in range(0, len(items), self.chunk_size):
+            chunk = items[i:i + self.chunk_size]
+            await self.idle.wait()
+            start_time = time.perf_counter()
+            results.extend(await function(chunk))
+            await asyncio.sleep(max(
+                len(chunk) * calls_per_item / self.max_calls_per_second -
+                (time.perf_counter() - start_time), 0))
+        return results
+
+    async def get_addresses(self, paths: list[Path]) -> list[str]:
+        results = await asyncio.gather(
+            *[(self.get_pool_address if path.is_v3 else self.get_pair_address)(path)
+              for path in paths])
+        return [result[0] for result in results]
+
+    async def refresh(self) -> None:
+        """
+        Checks every candidate path and prepares the topology of the
+        healthy ones when it differs from the live one.
+        """
+        start_time = time.perf_counter()
+        healthy_paths = await self.throttle(self.get_healthy_paths,
+                                            generate_all_paths(), 2)
+        paths = sorted(set(healthy_paths), key=str)
+        live_paths = set(Path.get_all_v2_paths() + Path.get_all_v3_paths())
+        added_paths = [path for path in paths if path not in live_paths]
+        removed_paths = live_paths.difference(paths)
+        if not added_paths and not removed_paths:
+            print("Topology unchanged after {:.0f} seconds".format(
+                time.perf_counter() - start_time))
+            return
+
+        addresses = dict(zip(
+            [str(path) for path in added_paths],
+            await self.throttle(self.get_addresses, added_paths, 1)))
+        addresses.update({str(path): (Data.pools if path.is_v3 else Data.pairs)[
+            str(path)].address for path in paths if path in live_paths})
+        pair_addresses = {str(path): addresses[str(path)]
+                          for path in paths if not path.is_v3}
+        pool_addresses = {str(path): addresses[str(path)]
+                          for path in paths if path.is_v3}
+        added_pairs = load_patched_contracts(
+            [addresses[str(path)] for path in added_paths if not path.is_v3], "pair")
+        added_pools = load_patched_contracts(
+            [addresses[str(path)] for path in added_paths if path.is_v3], "pool")
+        pairs = {name: Data.pairs.get(name) or added_pairs[address]
+                 for name, address in pair_addresses.items()}
+        pools = {name: Data.pools.get(name) or added_pools[address]
+                 for name, address in pool_addresses.items()}
+
+        path_names = [str(path) for path in paths]
+        loop_names = get_loop_names(path_names)
+        triangle_names = get_triangle_names(path_names)
+
+        def build():
+            lines = get_loops(loop_names)
+            triangles = get_triangles(triangle_names)
+            return lines, triangles, CycleScheduler.from_env(lines, triangles)
+
+        lines, triangles, scheduler = await asyncio.get_running_loop().run_in_executor(
+            None, contextvars.copy_context().run, build)
+
+        write_asset('healthy_paths', "".join(name + "\n" for name in path_names))
+        write_asset('healthy_pairs.json', json.dumps(pair_addresses, indent=4))
+        write_asset('healthy_pools.json', json.dumps(pool_addresses, indent=4))
+        write_asset('healthy_loops.json', json.dumps(loop_names, indent=4))
+        write_asset('healthy_triangles.json', json.dumps(triangle_names, indent=4))
+
+        self.pending = Topology(paths, pairs, pools, lines, triangles, scheduler,
+                                "Topology: {} paths added, {} removed, {} lines, "
+                                "{} triangles, built in {:.0f} seconds".format(
+                                    len(added_paths), len(removed_paths),
+                                    sum(len(backward_paths)
+                                        for backward_paths in lines.values()),
+                                    sum(len(right_paths)
+                                        for ear_paths in triangles.values()
+                                        for right_paths in ear_paths.values()),
+                                    time.perf_counter() - start_time))
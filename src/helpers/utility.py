@@ -14,30 +14,6 @@ def get_remaning_paths(middle_paths, line_paths):
     return new_paths, len(middle_paths), len(new_paths) + len(middle_paths)
 
 
-def fill_missing_triangles(messy_triangles):
-    all_messy_triangles = []
-    for middle_path in messy_triangles.keys():
-        for left_path in messy_triangles[middle_path].keys():
-            for right_path in messy_triangles[middle_path][left_path]:
-                all_messy_triangles.append(
-                    (left_path, middle_path, right_path))
-
-    candidate_triangles = []
-    for messy_triangle in all_messy_triangles:
-        l, m, r = messy_triangle
-        for candidate_triangle in [(l, m, r), (r, l, m), (m, r, l)]:
-            candidate_triangles.append(candidate_triangle)
-
-    seen = set()
-    cleaned_triangles = [x for x in candidate_triangles
-                         if not (x in seen or seen.add(x))]
-
-    dict_of_triangles = defaultdict(lambda: defaultdict(list))
-    for l, m, r in cleaned_triangles:
-        dict_of_triangles[m][l].append(r)
-    return dict_of_triangles
-
-
 def get_healthy_loops_report() -> str:
     """
     Returns a report on the architecture of the healthy loops.
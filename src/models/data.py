@@ -1,11 +1,100 @@
-class Data:
-    address_data = None
-    pricing_contracts = None
-    factories = None
-    lines = None
-    pairs = None
-    reserves = None
-    triangles = None
+import contextvars
+import os
+import re
+
+ASSETS_FOLDER = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))),
+    'helpers', 'assets')
+
+# Everything Data holds for one network. The intern tables of the market
+# models and the multicall state are per network too, token names and
+# path names are only unique within a chain.
+NETWORK_FIELDS = ("network_name", "assets_folder", "address_data",
+                  "rpc_pool", "dank_w3", "pricing_contracts", "factories",
+                  "lines", "pairs", "pools", "reserve_reader",
+                  "state_reader", "batch_controller", "quote_templates",
+                  "history", "state", "scheduler", "results", "triangles",
+                  "dexes", "tokens", "paths", "version_paths",
+                  "checkpoint", "v3_quoter")
+
+
+def create_namespace(network_name: str = None,
+                     assets_folder: str = ASSETS_FOLDER) -> dict:
+    namespace = dict.fromkeys(NETWORK_FIELDS)
+    namespace.update(network_name=network_name, assets_folder=assets_folder,
+                     dexes={}, tokens={}, paths={}, version_paths={})
+    return namespace
+
+
+# The namespace outside of any Data.use, which is the single network case.
+current_namespace = contextvars.ContextVar("current_namespace",
+                                           default=create_namespace())
+
+
+def get_network_field(name: str) -> property:
+    def get(cls):
+        return current_namespace.get()[name]
+
+    def set(cls, value) -> None:
+        current_namespace.get()[name] = value
+
+    return property(get, set)
+
+
+class NetworkScoped(type):
+    """
+    Routes the network fields of Data to the namespace of the network the
+    running task scans. asyncio tasks copy their context, so a task which
+    calls Data.use and everything it awaits or spawns sees that network,
+    while the other networks' tasks on the same loop see theirs.
+    """
+
+
+for field_name in NETWORK_FIELDS:
+    setattr(NetworkScoped, field_name, get_network_field(field_name))
+
+
+class Data(metaclass=NetworkScoped):
+    @staticmethod
+    def use(namespace: dict) -> None:
+        """
+        Makes the current task and its children work on a network.
+        """
+        current_namespace.set(namespace)
+
+    @staticmethod
+    def create_network_namespace(network_name: str) -> dict:
+        """
+        A fresh namespace whose assets are in assets/networks/<network>,
+        in the same format as the single network assets.
+        """
+        return create_namespace(network_name, os.path.join(
+            ASSETS_FOLDER, 'networks', network_name))
+
+    @staticmethod
+    def get_env_name(name: str) -> str:
+        """
+        The variable of the current network, NAME_ARBITRUM_MAIN for NAME on
+        arbitrum-main.
+        """
+        if Data.network_name is None:
+            return name
+        return "{}_{}".format(name, re.sub(r"\W", "_", Data.network_name).upper())
+
+    @staticmethod
+    def get_env(name: str, default: str = None, shared: bool = True) -> str:
+        """
+        Reads a variable for the current network, then NAME itself unless the
+        setting can't be shared between networks.
+        """
+        value = os.environ.get(Data.get_env_name(name))
+        if value is None and shared:
+            value = os.environ.get(name)
+        return default if value is None else value
+
+    @staticmethod
+    def get_asset_path(asset_name: str) -> str:
+        return os.path.join(Data.assets_folder, asset_name)
 
     @staticmethod
     def get_token_address_from_name(token_name: str) -> str:
@@ -31,6 +120,13 @@ class Data:
     def get_factory_address_from_name(dex_name: str) -> str:
         return Data.address_data['dex'][dex_name]['factory_address']
 
+    @staticmethod
+    def get_factory_block_from_name(dex_name: str) -> int:
+        """
+        The block the factory was deployed at, None when it isn't known.
+        """
+        return Data.address_data['dex'][dex_name].get('factory_block')
+
     @staticmethod
     def get_dex_names() -> list[str]:
         return list(Data.address_data['dex'].keys())
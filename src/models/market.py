@@ -1,82 +1,157 @@
-from dataclasses import dataclass
 from models.data import Data
-from functools import lru_cache
 from brownie import Contract
-import os
 
 
-@dataclass(frozen=True)
 class Dex:
-    name: str
-    pricing_contract: Contract
-    factory: Contract = None
-    fee: int = 3000
+    """
+    Interned, one instance per dex name of the network, in Data.dexes.
+    """
+    __slots__ = ("name", "pricing_contract", "factory", "fee", "is_v3",
+                 "_hash")
+
+    def __init__(self, name: str,
+                 pricing_contract: Contract,
+                 factory: Contract = None,
+                 fee: int = 3000) -> None:
+        set_slot = object.__setattr__
+        set_slot(self, "name", name)
+        set_slot(self, "pricing_contract", pricing_contract)
+        set_slot(self, "factory", factory)
+        set_slot(self, "fee", fee)
+        set_slot(self, "is_v3", name.endswith("v3"))
+        set_slot(self, "_hash", hash(name))
 
     @staticmethod
-    @lru_cache(maxsize=None)
     def get_dex_from_name(dex_name: str) -> "Dex":
-        if dex_name.endswith('v2'):
-            return Dex(dex_name,
-                       Data.pricing_contracts[dex_name],
-                       Data.factories["F" + dex_name])
-        return Dex(dex_name,
-                   Data.pricing_contracts[dex_name])
+        dex = Data.dexes.get(dex_name)
+        if dex is None:
+            dex = Dex(dex_name,
+                      Data.pricing_contracts[dex_name],
+                      Data.factories["F" + dex_name])
+            Data.dexes[dex_name] = dex
+        return dex
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("Dex is immutable")
+
+    def __reduce__(self):
+        # Unpickles as the interned dex of the loading network.
+        return (Dex.get_dex_from_name, (self.name,))
+
+    def __eq__(self, other) -> bool:
+        return self is other or \
+            (isinstance(other, Dex) and self.name == other.name)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        return "Dex('{}')".format(self.name)
 
     def __str__(self) -> str:
         return self.name
 
 
 class Token:
+    """
+    Interned, one instance per token name of the network, in Data.tokens.
+    The address is cached as int and
+    bytes, and scale converts one USD into the smallest token unit.
+    """
+    __slots__ = ("name", "address", "relative_price", "decimals",
+                 "address_int", "address_bytes", "scale", "_hash")
+
     def __init__(self, name: str,
                  address: str,
                  relative_price: int,
                  decimals: int) -> None:
-        self.name = name
-        self.relative_price = relative_price
-        self.address = address
-        self.decimals = decimals
+        set_slot = object.__setattr__
+        set_slot(self, "name", name)
+        set_slot(self, "address", address)
+        set_slot(self, "relative_price", relative_price)
+        set_slot(self, "decimals", decimals)
+        set_slot(self, "address_int", int(address, 16))
+        set_slot(self, "address_bytes", self.address_int.to_bytes(20, "big"))
+        set_slot(self, "scale", relative_price * 10**decimals)
+        set_slot(self, "_hash", hash(self.address_int))
 
     @staticmethod
-    @lru_cache(maxsize=None)
     def get_token_from_name(token_name: str) -> "Token":
-        return Token(token_name,
-                     Data.get_token_address_from_name(token_name),
-                     Data.get_token_relative_price_from_name(token_name),
-                     Data.get_token_decimals_from_name(token_name))
+        token = Data.tokens.get(token_name)
+        if token is None:
+            token = Token(token_name,
+                          Data.get_token_address_from_name(token_name),
+                          Data.get_token_relative_price_from_name(token_name),
+                          Data.get_token_decimals_from_name(token_name))
+            Data.tokens[token_name] = token
+        return token
 
     def get_relative_price(self, amount_in: float) -> float:
         """
         Converts USD amount to token amount.
         """
-        return amount_in * \
-            self.relative_price * \
-            10**self.decimals
+        return amount_in * self.scale
 
     def recover_original_price(self, amount_in: float) -> float:
         """
         Converts token amount to USD amount.
         """
-        return amount_in / (self.relative_price *
-                            10**self.decimals)
+        return amount_in / self.scale
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("Token is immutable")
+
+    def __reduce__(self):
+        return (Token.get_token_from_name, (self.name,))
+
+    def __eq__(self, other) -> bool:
+        return self is other or \
+            (isinstance(other, Token) and self.address_int == other.address_int)
+
+    def __hash__(self) -> int:
+        return self._hash
+
+    def __repr__(self) -> str:
+        return "Token('{}')".format(self.name)
 
     def __str__(self) -> str:
         return self.name
 
 
-@dataclass(frozen=True)
 class Path:
-    dex: Dex
-    from_token: Token
-    to_token: Token
+    """
+    Interned, one instance per (dex, from_token, to_token) of the network,
+    in Data.paths.
+    zero_for_one tells whether from_token is token0 of the pair or pool.
+    """
+    __slots__ = ("dex", "from_token", "to_token", "is_v3", "zero_for_one",
+                 "_name", "_hash")
+
+    def __init__(self, dex: Dex,
+                 from_token: Token,
+                 to_token: Token) -> None:
+        set_slot = object.__setattr__
+        set_slot(self, "dex", dex)
+        set_slot(self, "from_token", from_token)
+        set_slot(self, "to_token", to_token)
+        set_slot(self, "is_v3", dex.is_v3)
+        set_slot(self, "zero_for_one",
+                 from_token.address_int < to_token.address_int)
+        set_slot(self, "_name", "{} {} {}".format(dex, from_token, to_token))
+        set_slot(self, "_hash", hash(self._name))
 
     @staticmethod
-    @lru_cache(maxsize=None)
     def get_path_from_name(dex_name: str,
                            from_token_name: str,
                            to_token_name: str) -> "Path":
-        return Path(Dex.get_dex_from_name(dex_name),
-                    Token.get_token_from_name(from_token_name),
-                    Token.get_token_from_name(to_token_name))
+        key = (dex_name, from_token_name, to_token_name)
+        path = Data.paths.get(key)
+        if path is None:
+            path = Path(Dex.get_dex_from_name(dex_name),
+                        Token.get_token_from_name(from_token_name),
+                        Token.get_token_from_name(to_token_name))
+            Data.paths[key] = path
+        return path
 
     @staticmethod
     def is_composable(start_path: "Path", return_path: "Path") -> bool:
@@ -107,24 +182,46 @@ class Path:
                                           right_path.from_token.name)
 
     @staticmethod
-    @lru_cache(maxsize=None)
-    def get_all_v2_paths() -> list["Path"]:
-        all_v2_paths = []  # return unique list
-
-        script_dir = os.path.dirname(os.path.abspath(__file__))
-        parent_dir = os.path.dirname(script_dir)
-        paths_file = os.path.join(
-            parent_dir, 'helpers', 'assets', 'healthy_paths')
+    def get_all_paths_of_version(version: str) -> list["Path"]:
+        paths = Data.version_paths.get(version)
+        if paths is not None:
+            return paths
+        paths_file = Data.get_asset_path('healthy_paths')
 
         with open(paths_file, 'r') as file:
-            unique_v2_path_names = list(
+            unique_path_names = list(
                 set([path_name.strip()
                      for path_name in file.readlines()
-                     if path_name.strip().split(' ')[0].endswith('v2')]))
+                     if path_name.strip().split(' ')[0].endswith(version)]))
+
+        paths = [Path.get_path_from_name(*path_name.split(' ')) for path_name in unique_path_names]
+        Data.version_paths[version] = paths
+        return paths
+
+    @staticmethod
+    def get_all_v2_paths() -> list["Path"]:
+        return Path.get_all_paths_of_version('v2')
+
+    @staticmethod
+    def get_all_v3_paths() -> list["Path"]:
+        return Path.get_all_paths_of_version('v3')
+
+    def __setattr__(self, name, value) -> None:
+        raise AttributeError("Path is immutable")
+
+    def __reduce__(self):
+        return (Path.get_path_from_name,
+                (self.dex.name, self.from_token.name, self.to_token.name))
+
+    def __eq__(self, other) -> bool:
+        return self is other or \
+            (isinstance(other, Path) and self._name == other._name)
+
+    def __hash__(self) -> int:
+        return self._hash
 
-        return [Path.get_path_from_name(*path_name.split(' ')) for path_name in unique_v2_path_names]
+    def __repr__(self) -> str:
+        return "Path('{}')".format(self._name)
 
     def __str__(self) -> str:
-        return "{} {} {}".format(self.dex,
-                                 self.from_token,
-                                 self.to_token)
+        return self._name
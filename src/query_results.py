@@ -0,0 +1,39 @@
+import argparse
+import heapq
+from collections import defaultdict
+from dotenv import load_dotenv
+from helpers.results import get_result_folder, read_results
+
+
+def _main(folder: str, first_block: int, last_block: int, top: int) -> None:
+    counts = defaultdict(int)
+    best = {}
+    blocks = set()
+    for block_number, path_names, amount_in, profit in read_results(
+            folder, first_block, last_block):
+        blocks.add(block_number)
+        counts[path_names] += 1
+        if profit > best.get(path_names, (0, 0))[1]:
+            best[path_names] = (amount_in, profit)
+    print("{} results on {} blocks, {} cycles".format(
+        sum(counts.values()), len(blocks), len(counts)))
+    for path_names, (amount_in, profit) in heapq.nlargest(
+            top, best.items(), key=lambda item: item[1][1]):
+        print("{:.4f} {} {} blocks {}".format(
+            profit, round(amount_in, 2), counts[path_names], " | ".join(path_names)))
+
+
+if __name__ == "__main__":
+    load_dotenv()
+    parser = argparse.ArgumentParser(
+        description="Summarizes the result store between two blocks. The "
+        "store is the one run.py writes to, RESULT_STORE_DIR or src/results, "
+        "in the subfolder of --network when several networks run.")
+    parser.add_argument("first_block", type=int, nargs="?", default=0)
+    parser.add_argument("last_block", type=int, nargs="?")
+    parser.add_argument("--top", type=int, default=20)
+    parser.add_argument("--network")
+    parser.add_argument("--folder", help="reads this store instead")
+    args = parser.parse_args()
+    _main(args.folder or get_result_folder(args.network),
+          args.first_block, args.last_block, args.top)
@@ -3,60 +3,174 @@ import logging
 import time
 import os
 import heapq
-from collections import defaultdict
-from brownie import web3
+from dataclasses import dataclass
+from dotenv import load_dotenv
 from models.data import Data
 from models.market import Path
 from helpers.initialize import setup
 from helpers.utility import send_notification
-from helpers.arbitrage import calculate_arbitrage
-from helpers.price import update_v2_reserves
+from helpers.arbitrage import split_results
+from helpers.execution import Executor
+from helpers.blocks import BlockTrigger
+from helpers.multihop import check_routes
+from helpers.profiling import profiler
+from helpers.history import ReserveHistory
+from helpers.state import StateManager, fetch_all_states
+from helpers.snapshot import MarketSnapshot
+from helpers.scheduling import CycleScheduler
+from helpers.cycles import get_start_results
+from helpers.results import ResultStore
+from helpers.calls import get_batch_controller
+from helpers.networks import get_network_names, network_metrics, run_networks
+from helpers.topology import TopologyRefresher
+from helpers.checkpoint import Checkpoint
 
 
-async def _main(critical_arb):
-    block_number = web3.eth.get_block_number()
-    logging.info("\nBlock: {}".format(block_number))
+@dataclass(frozen=True)
+class Thresholds:
+    """
+    The USD range of the searched amounts, the profit above which an
+    opportunity is reported and the one above which it is executed.
+    """
+    min_amount_in: float = 30
+    max_amount_in: float = 100000
+    min_arb: float = 0.001
+    execution_arb: float = 5
+
+
+async def update_states(head, fetch_states=fetch_all_states):
+    """
+    Returns the snapshot of the head and the paths which changed, None when
+    they are unknown. fetch_states reads all the states of a head when
+    there is no StateManager.
+    """
+    if Data.state:
+        changed_paths = await Data.state.update(head)
+        return Data.state.snapshot, changed_paths
+    reserves, v3_states = await fetch_states(head)
+    return MarketSnapshot.create(head.number, head.hash, reserves, v3_states,
+                                 Data.lines, Data.triangles), None
+
+
+async def execute(executor, line_candidates, triangle_candidates, executed,
+                  execution_arb):
+    """
+    Executes the best line and the best checked triangle above
+    execution_arb, each at most once per block.
+    """
+    executable_lines = [line for line in line_candidates
+                        if line[3] > execution_arb
+                        and Executor.is_executable(line[1], line[2])]
+    if executable_lines and "line" not in executed:
+        amount, forward_path, backward_path, _ = max(
+            executable_lines, key=lambda t: t[3])
+        if await executor.execute_line(forward_path, backward_path, amount):
+            executed.add("line")
+    if not executor.multihop or "triangle" in executed:
+        return
+    candidates = heapq.nlargest(
+        10, [triangle for triangle in triangle_candidates
+             if triangle[4] > execution_arb], key=lambda t: t[4])
+    # The contract may do better from another start token of the cycle, of
+    # those it holds.
+    routes = [(cycle, amount_in)
+              for candidate in candidates
+              for cycle, amount_in, _ in get_start_results(
+                  tuple(candidate[1:4]), candidate[0], candidate[4]).values()
+              if executor.is_funded(cycle)]
+    if routes:
+        profits = await check_routes(
+            executor.multihop, [list(cycle) for cycle, _ in routes],
+            [amount_in for _, amount_in in routes], executor.block_number)
+        profit, (cycle, amount_in) = max(zip(profits, routes),
+                                         key=lambda t: t[0])
+        if profit > execution_arb and \
+                await executor.execute_triangle(*cycle, amount_in):
+            executed.add("triangle")
+
+
+async def _main(critical_arb, head, executor=None,
+                thresholds=Thresholds(), fetch_states=fetch_all_states):
+    start_time = time.perf_counter()
+    if executor:
+        await executor.refresh(head.number, head.hash)
+    batch_controller = get_batch_controller()
+    batch_controller.begin_block(head.number)
+    logging.info("\nBlock: {}{}".format(
+        head.number, " on " + Data.network_name if Data.network_name else ""))
+    with profiler.stage("reserves"):
+        snapshot, changed_paths = (await asyncio.gather(
+            update_states(head, fetch_states),
+            *([Data.rpc_pool.update_heads()] if Data.rpc_pool else [])))[0]
+        if Data.history:
+            Data.history.record(snapshot)
+    if Data.scheduler is None:
+        Data.scheduler = CycleScheduler.from_env(Data.lines, Data.triangles)
+    all_line_positive = []
+    all_triangular_positive = []
+    executed = set()
+
+    async def on_results(results):
+        line_results, triangular_results = split_results(results)
+        line_positive = [line for line in line_results
+                         if line[3] > thresholds.min_arb]
+        triangular_positive = [triangle for triangle in triangular_results
+                               if triangle[4] > thresholds.min_arb]
+        if not line_positive and not triangular_positive:
+            return
+        all_line_positive.extend(line_positive)
+        all_triangular_positive.extend(triangular_positive)
+        best = max(line_positive + triangular_positive, key=lambda t: t[-1])
+        logging.info("{:.0f}ms best so far: {} {}".format(
+            (time.perf_counter() - start_time) * 1000,
+            (Path.get_line_string if len(best) == 4 else
+             Path.get_triangle_string)(*best[1:-1]), round(best[-1], 4)))
+        # Only opportunities of a canonical state are executed.
+        canonical = Data.state.add_opportunities(
+            head.hash, line_positive + triangular_positive) if Data.state else True
+        if executor and canonical:
+            await execute(executor, line_positive, triangular_positive, executed,
+                          thresholds.execution_arb)
+
+    with profiler.stage("arbitrage"):
+        await Data.scheduler.run(snapshot, changed_paths,
+                                 thresholds.min_amount_in,
+                                 thresholds.max_amount_in, on_results)
+    print("There are {} line arbitrages".format(len(all_line_positive)))
+    print("There are {} triangular arbitrages".format(
+        len(all_triangular_positive)))
+    print("Multicall: " + batch_controller.get_report())
+    if Data.scheduler.carried:
+        print("{} results carried from earlier blocks".format(
+            len(Data.scheduler.carried)))
+    if Data.state and Data.state.reorgs:
+        print("{} reorgs invalidated {} opportunities".format(
+            Data.state.reorgs, Data.state.invalidated))
+    if Data.scheduler.skipped:
+        print("Skipped {} of {} touched cycles".format(
+            Data.scheduler.skipped,
+            Data.scheduler.skipped + Data.scheduler.evaluated))
+    if Data.results:
+        Data.results.add(head.number, all_line_positive, all_triangular_positive)
+    if Data.checkpoint and Data.state:
+        Data.checkpoint.add(Data.state.tip, Data.scheduler)
+    network_metrics.record(head.number, time.perf_counter() - start_time,
+                           len(all_line_positive) + len(all_triangular_positive))
+    with profiler.stage("reporting"):
+        return report(critical_arb, head.number,
+                      all_line_positive, all_triangular_positive)
+
+
+def report(critical_arb, block_number,
+           all_line_positive, all_triangular_positive):
     line_logs = []
     triangular_logs = []
-    positive_triangles = Data.triangles
-    positive_lines = Data.lines
-    all_triangular_positive = []
-    all_line_positive = []
-    len_check = 0
-    await update_v2_reserves()
-    for amount_in in base_amount_ins:
-        line_arbitrage_results, triangular_arbitrage_results = (await asyncio.gather(
-            *[calculate_arbitrage(positive_lines, positive_triangles,
-                                  amount_in)]))[0]
-        positive_triangles = defaultdict(lambda: defaultdict(list))
-        positive_lines = defaultdict(list)
-        for line_arbitrage_result in line_arbitrage_results:
-            forward_path, backward_path, arb = line_arbitrage_result
-            if arb > minArb:
-                line_string = Path.get_line_string(forward_path,
-                                                   backward_path)
-                all_line_positive.append(
-                    (amount_in, line_string, arb))
-                positive_lines[forward_path].append(backward_path)
-        if not len_check:
-            print("There are {} line arbitrages".format(
-                len(all_line_positive)))
-            len_check += 1
-        for triangular_arbitrage_result in triangular_arbitrage_results:
-            left_path, middle_path, right_path, arb = triangular_arbitrage_result
-            if arb > minArb:
-                all_triangular_positive.append(
-                    (amount_in, left_path, middle_path, right_path, arb))
-                positive_triangles[middle_path][left_path].append(right_path)
-        if len_check < 2:
-            print("There are {} triangular arbitrages".format(
-                len(all_triangular_positive)))
-            len_check += 1
     try:
-        top_two_pair = heapq.nlargest(2, all_line_positive, key=lambda t: t[2])
-        for amount, line_string, arb in top_two_pair:
+        top_two_pair = heapq.nlargest(2, all_line_positive, key=lambda t: t[3])
+        for amount, forward_path, backward_path, arb in top_two_pair:
             line_logs.append("{} {} {}".format(
-                amount, line_string, round(arb, 4)))
+                amount, Path.get_line_string(forward_path, backward_path),
+                round(arb, 4)))
     except:
         logging.info("No line arbitrage or broken!")
     try:
@@ -80,24 +194,69 @@ async def _main(critical_arb):
     return int(hit)
 
 
-async def main():
+async def run_network(network_name="mainnet", primary=True, session=None):
+    """
+    Sets a network up and scans its blocks. Only the primary network
+    executes, the accounts live in brownie, and refreshes its topology,
+    the health checks quote through dank_mids. It is also the only one
+    profiled, the profiler is process-wide.
+    """
+    if not primary:
+        profiler.exclude()
     critical_arb = 5
     total_messages = 0
-    await setup()
+    await setup(network_name, primary=primary, session=session)
+    executor = Executor.from_env() if primary else None
+    block_trigger = BlockTrigger.from_env()
+    Data.history = ReserveHistory.from_env()
+    Data.state = StateManager()
+    Data.results = ResultStore.from_env()
+    Data.checkpoint = Checkpoint.from_env()
+    if Data.checkpoint:
+        Data.scheduler = CycleScheduler.from_env(Data.lines, Data.triangles)
+        Data.checkpoint.restore(Data.state, Data.scheduler)
+    topology_refresher = TopologyRefresher.from_env() if primary else None
+    if topology_refresher:
+        topology_refresher.start()
     while True:
+        head = await block_trigger.next_head()
+        if head.reorg:
+            logging.info("Reorg at block {}".format(head.number))
         start_time = time.perf_counter()
-        total_messages += await _main(critical_arb + total_messages)
+        if topology_refresher:
+            topology_refresher.begin_block()
+        profiler.begin_iteration(head.number)
+        total_messages += await _main(critical_arb + total_messages,
+                                      head, executor)
+        profiler.end_iteration()
+        if topology_refresher:
+            topology_refresher.end_block()
         end_time = time.perf_counter()
         print('Time: {} seconds'.format(end_time - start_time))
 
 
+async def main():
+    """
+    Scans the networks of NETWORKS side by side, mainnet alone otherwise.
+    """
+    load_dotenv()
+    profiler.install_signal_handler()
+    if os.environ.get("PROFILE_PORT"):
+        await profiler.serve_control(int(os.environ["PROFILE_PORT"]),
+                                     network_metrics.get_report)
+    network_names = get_network_names()
+    if not network_names:
+        await run_network()
+    else:
+        await run_networks(network_names, run_network,
+                           int(os.environ.get("WORKER_THREADS", 0)) or None)
+
+
 if __name__ == "__main__":
     script_dir = os.path.dirname(os.path.abspath(__file__))
     log_file_name = 'optimized_arbitrage_results.log'
     logging.basicConfig(filename=os.path.join(script_dir, log_file_name),
                         format='%(message)s', encoding='utf-8', level=logging.INFO)
     logging.getLogger().addHandler(logging.StreamHandler())
-    base_amount_ins = [30, 61, 98, 134, 214, 600, 1700, 4444, 10000, 100000]
-    minArb = 0.001
     loop = asyncio.get_event_loop()
     loop.run_until_complete(main())
@@ -0,0 +1,69 @@
+import argparse
+import asyncio
+import json
+from helpers.simulation import SimulatedMarket, SimulatedNode
+
+
+async def serve(node: SimulatedNode, host: str, port: int,
+                report_interval: float) -> None:
+    await node.start(host, port)
+    print("Serving on {} and {}".format(node.url, node.ws_url))
+    try:
+        while True:
+            await asyncio.sleep(report_interval)
+            print(node.get_report())
+    finally:
+        await node.stop()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        description="Serves a simulated market as a JSON-RPC node. Point "
+        "RPC_ENDPOINTS, WS_ENDPOINT and a brownie network at it, with the "
+        "assets written by --assets, to run the bot against it.")
+    parser.add_argument("--tokens", type=int, default=40)
+    parser.add_argument("--v2-dexes", type=int, default=4)
+    parser.add_argument("--v3-dexes", type=int, default=2)
+    parser.add_argument("--edge-probability", type=float, default=0.2)
+    parser.add_argument("--token-volatility", type=float, default=0.001)
+    parser.add_argument("--move-share", type=float, default=0.1,
+                        help="share of the pools redrawn each block")
+    parser.add_argument("--spread", type=float, default=0.003)
+    parser.add_argument("--reorg-rate", type=float, default=0)
+    parser.add_argument("--script", help="json file of scripted moves")
+    parser.add_argument("--max-multicall-calls", type=int)
+    parser.add_argument("--chain-id", type=int, default=1337)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--block-time", type=float, default=1)
+    parser.add_argument("--latency", type=float, default=0)
+    parser.add_argument("--jitter", type=float, default=0)
+    parser.add_argument("--call-latency", type=float, default=0)
+    parser.add_argument("--error-rate", type=float, default=0)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8545)
+    parser.add_argument("--assets", help="writes address_data.json to this folder")
+    parser.add_argument("--healthy", action="store_true",
+                        help="writes the healthy files to the assets folder too")
+    parser.add_argument("--report-interval", type=float, default=10)
+    args = parser.parse_args()
+
+    script = None
+    if args.script:
+        with open(args.script) as file:
+            script = json.load(file)
+    market = SimulatedMarket(args.tokens, args.v2_dexes, args.v3_dexes,
+                             args.edge_probability, args.token_volatility,
+                             args.move_share, args.spread, args.reorg_rate,
+                             script, args.max_multicall_calls,
+                             chain_id=args.chain_id, seed=args.seed)
+    if args.assets:
+        market.write_assets(args.assets, args.healthy)
+    print("{} tokens, {} dexes, {} pools".format(
+        len(market.token_names), len(market.dex_names), len(market.pools)))
+    node = SimulatedNode(market, args.block_time, args.latency, args.jitter,
+                         args.call_latency, args.error_rate, args.seed)
+    asyncio.run(serve(node, args.host, args.port, args.report_interval))
+
+
+if __name__ == "__main__":
+    main()
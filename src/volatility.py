@@ -0,0 +1,25 @@
+import sys
+import heapq
+from helpers.history import ReserveHistory
+
+
+def _main(name: str, length: int, top: int) -> None:
+    history = ReserveHistory.attach(name)
+    if not history.count or not history.path_names:
+        print("No blocks recorded in {}".format(name))
+        history.close()
+        return
+    print("{} blocks recorded, last {}".format(
+        history.count, history.get_window(history.path_names[0], 1)[0]))
+    volatilities = heapq.nlargest(
+        top, ((history.get_volatility(path_name, length), path_name)
+              for path_name in history.path_names))
+    for volatility, path_name in volatilities:
+        print("{:.6f} {}".format(volatility, path_name))
+    history.close()
+
+
+if __name__ == "__main__":
+    _main(sys.argv[1] if len(sys.argv) > 1 else "reserve_history",
+          int(sys.argv[2]) if len(sys.argv) > 2 else 100,
+          int(sys.argv[3]) if len(sys.argv) > 3 else 20)
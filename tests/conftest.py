@@ -0,0 +1,35 @@
+import os
+import sys
+import pytest
+
+# The bot imports its modules relative to src, as when run from there.
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.dirname(
+    os.path.abspath(__file__))), "src"))
+
+from models.data import Data, create_namespace, current_namespace  # noqa: E402
+from helpers.simulation import SimulatedMarket  # noqa: E402
+
+
+@pytest.fixture
+def market(request) -> SimulatedMarket:
+    """
+    A small market, tests parametrize it indirectly with more arguments,
+    a script for instance.
+    """
+    return SimulatedMarket(token_count=6, v2_dex_count=2, v3_dex_count=1,
+                           edge_probability=0.6, seed=1,
+                           **getattr(request, "param", {}))
+
+
+@pytest.fixture
+def network(market, tmp_path):
+    """
+    A fresh namespace of Data on the market's assets, without contracts.
+    """
+    market.write_assets(str(tmp_path), healthy=True)
+    token = current_namespace.set(create_namespace(assets_folder=str(tmp_path)))
+    Data.address_data = market.get_address_data()
+    Data.pricing_contracts = dict.fromkeys(market.dex_names)
+    Data.factories = {"F" + dex_name: None for dex_name in market.dex_names}
+    yield Data
+    current_namespace.reset(token)
@@ -0,0 +1,116 @@
+"""
+Drives the BlockTrigger against the newHeads websocket of a SimulatedNode,
+blocks are mined and published by hand.
+"""
+import asyncio
+import pytest
+from models.data import Data
+from helpers.blocks import BlockTrigger
+from helpers.rpc import ProviderPool
+from helpers.simulation import SimulatedNode
+
+
+async def wait_for(condition, timeout: float = 5) -> None:
+    loop = asyncio.get_running_loop()
+    end_time = loop.time() + timeout
+    while not condition():
+        assert loop.time() < end_time
+        await asyncio.sleep(0.01)
+
+
+async def start(market, **kwargs) -> tuple[SimulatedNode, BlockTrigger]:
+    node = SimulatedNode(market, block_time=3600)
+    await node.start(port=0)
+    Data.rpc_pool = ProviderPool([node.url])
+    trigger = BlockTrigger(node.ws_url, **kwargs)
+    trigger.start()
+    await wait_for(lambda: node.subscriptions)
+    return node, trigger
+
+
+async def stop(node: SimulatedNode, trigger: BlockTrigger) -> None:
+    task = trigger.task
+    trigger.stop()
+    # Lets the subscription close its socket before the node shuts down.
+    await asyncio.gather(task, return_exceptions=True)
+    await Data.rpc_pool.close()
+    await node.stop()
+
+
+async def publish(node: SimulatedNode) -> None:
+    for block in node.market.mine():
+        await node.publish(block)
+
+
+def test_emits_each_head_once(market, network):
+    async def scenario():
+        node, trigger = await start(market)
+        try:
+            await publish(node)
+            head = await trigger.next_head()
+            assert (head.number, head.hash) == (1, market.head.hash)
+
+            await node.publish(market.head)
+            await publish(node)
+            head = await trigger.next_head()
+            assert head.number == 2 and not head.reorg
+            await wait_for(lambda: trigger.duplicates == 1)
+        finally:
+            await stop(node, trigger)
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("market", [{"script": [{"block": 3, "reorg": 1}]}],
+                         indirect=True)
+def test_flags_the_head_replacing_a_block(market, network):
+    async def scenario():
+        node, trigger = await start(market)
+        try:
+            await publish(node)
+            await trigger.next_head()
+            await publish(node)
+            replaced = await trigger.next_head()
+            assert replaced.number == 2
+
+            # Block 3 replaces block 2 with 2', announced one at a time.
+            new_blocks = market.mine()
+            assert [block.number for block in new_blocks] == [2, 3]
+            await node.publish(new_blocks[0])
+            head = await trigger.next_head()
+            assert head.number == 2 and head.hash != replaced.hash
+            assert head.reorg and trigger.reorgs == 1
+            await node.publish(new_blocks[1])
+            head = await trigger.next_head()
+            assert head.number == 3 and not head.reorg
+        finally:
+            await stop(node, trigger)
+
+    asyncio.run(scenario())
+
+
+def test_polls_while_the_socket_is_down(market, network):
+    async def scenario():
+        node, trigger = await start(market, poll_interval=0.01,
+                                    retry_interval=0.3)
+        try:
+            await publish(node)
+            assert (await trigger.next_head()).number == 1
+
+            for websocket in list(node.subscriptions.values()):
+                await websocket.close()
+            await wait_for(lambda: not node.subscriptions)
+            # Mined without being announced, only polling can see it.
+            market.mine()
+            head = await trigger.next_head()
+            assert (head.number, head.hash) == (2, market.head.hash)
+            assert node.metrics["eth_getBlockByNumber"] > 0
+
+            # The subscription comes back after retry_interval.
+            await wait_for(lambda: node.subscriptions)
+            await publish(node)
+            assert (await trigger.next_head()).number == 3
+        finally:
+            await stop(node, trigger)
+
+    asyncio.run(scenario())
@@ -0,0 +1,211 @@
+"""
+Drives the BatchController through its injected send against a stand-in
+node, no chain needed.
+"""
+import asyncio
+import math
+from types import SimpleNamespace
+import pytest
+from models.data import Data
+from models.market import Path
+from helpers.calls import (BatchController, QuoteTemplates, ReserveReader,
+                           StateReader, get_batch_controller)
+from helpers.price import record_quote_error
+from helpers.rpc import ProviderPool, RPCError
+from helpers.simulation import SimulatedNode, get_sqrt_price
+
+
+def decode_targets(payload: bytes) -> list[str]:
+    """
+    The call targets of an aggregate3 payload.
+    """
+    data = payload[4:]
+    count = int.from_bytes(data[32:64], "big")
+    offsets = [int.from_bytes(data[64 + 32 * i:96 + 32 * i], "big")
+               for i in range(count)]
+    return ["0x" + data[64 + offset + 12:64 + offset + 32].hex()
+            for offset in offsets]
+
+
+class Node:
+    """
+    Fails a whole batch, like an out of gas multicall, when it holds one
+    of the bad targets, and answers every call otherwise, but those to
+    the reverting targets.
+    """
+
+    def __init__(self, bad_targets: set[str] = (), latency: float = 0,
+                 reverting_targets: set[str] = ()) -> None:
+        self.bad_targets = set(bad_targets)
+        self.reverting_targets = set(reverting_targets)
+        self.latency = latency
+        self.batches = []
+
+    async def send(self, payload: bytes, block_identifier) -> list:
+        targets = decode_targets(payload)
+        self.batches.append(targets)
+        await asyncio.sleep(self.latency)
+        if self.bad_targets & set(targets):
+            raise RPCError({"code": -32000, "message": "out of gas"})
+        return [None if target in self.reverting_targets
+                else memoryview(bytes.fromhex(target[2:]))
+                for target in targets]
+
+
+def get_calls(count: int) -> list[tuple[str, bytes]]:
+    return [("0x{:040x}".format(i + 1), b"\x00" * 4) for i in range(count)]
+
+
+def test_bisects_a_failing_batch_down_to_the_bad_call():
+    calls = get_calls(16)
+    node = Node({calls[5][0]})
+    controller = BatchController(batch_size=16, send=node.send)
+
+    results = asyncio.run(controller.aggregate(calls))
+
+    assert results[5] is None
+    assert all(result is not None for i, result in enumerate(results) if i != 5)
+    # 16 -> 8 -> 4 -> 2 -> 1, both halves of each failed batch are sent.
+    assert controller.metrics["bisections"] == 4
+    assert controller.metrics["requests"] == 1 + 2 * 4
+    assert controller.metrics["isolated_calls"] == 1
+    assert controller.errors["RPCError"] == 1
+    # One bad call halves the size once, not at each level of bisection.
+    assert controller.batch_size == 8
+    assert controller.metrics["shrinks"] == 1
+
+
+def test_quarantines_a_repeatedly_failing_call():
+    calls = get_calls(8)
+    bad_target = calls[0][0]
+    node = Node({bad_target})
+    controller = BatchController(batch_size=8, max_failures=3,
+                                 quarantine_blocks=2, send=node.send)
+
+    for block_number in range(3):
+        controller.begin_block(block_number)
+        asyncio.run(controller.aggregate(calls))
+    assert controller.is_quarantined(bad_target)
+
+    node.batches.clear()
+    controller.begin_block(3)
+    results = asyncio.run(controller.aggregate(calls))
+    assert results[0] is None
+    assert all(result is not None for result in results[1:])
+    assert node.batches == [[target for target, _ in calls[1:]]]
+    assert controller.metrics["skipped_calls"] == 1
+
+    controller.begin_block(4)
+    assert not controller.is_quarantined(bad_target)
+
+
+@pytest.mark.parametrize("count_reverts", [True, False])
+def test_quarantines_reverting_calls_only_when_counted(count_reverts):
+    calls = get_calls(8)
+    reverting_target = calls[0][0]
+    node = Node(reverting_targets={reverting_target})
+    controller = BatchController(batch_size=8, max_failures=3, send=node.send)
+
+    for block_number in range(3):
+        controller.begin_block(block_number)
+        results = asyncio.run(controller.aggregate(
+            calls, count_reverts=count_reverts))
+        assert results[0] is None
+
+    assert controller.is_quarantined(reverting_target) == count_reverts
+    assert controller.metrics["failed_batches"] == 0
+
+
+def test_abandons_a_failing_round_beyond_the_request_budget():
+    calls = get_calls(64)
+    node = Node({target for target, _ in calls})
+    controller = BatchController(batch_size=64, max_failed_requests=4,
+                                 send=node.send)
+
+    results = asyncio.run(controller.aggregate(calls))
+
+    assert results == [None] * 64
+    assert len(node.batches) <= 1 + 2 * 4
+    assert controller.metrics["abandoned_calls"] > 0
+
+
+def test_shrinks_slow_batches():
+    calls = get_calls(64)
+    controller = BatchController(batch_size=64, target_latency=0.01,
+                                 send=Node(latency=0.02).send)
+
+    asyncio.run(controller.aggregate(calls))
+
+    assert controller.batch_size == 32
+    assert controller.metrics["shrinks"] == 1
+
+
+@pytest.mark.parametrize("grow_after", [1, 3])
+def test_grows_after_fast_full_batches(grow_after):
+    calls = get_calls(16)
+    controller = BatchController(batch_size=16, target_latency=1,
+                                 grow_after=grow_after, concurrency=1,
+                                 send=Node().send)
+
+    for _ in range(grow_after - 1):
+        asyncio.run(controller.aggregate(calls))
+    assert controller.batch_size == 16
+    asyncio.run(controller.aggregate(calls))
+    assert controller.batch_size == 32
+    assert controller.metrics["grows"] == 1
+
+
+def test_reverted_quotes_do_not_count_against_their_path(network):
+    path = Path.get_all_v3_paths()[0]
+    controller = get_batch_controller()
+    controller.max_failures = 2
+    for _ in range(2):
+        record_quote_error(path, RPCError({"code": 3,
+                                           "message": "execution reverted: SPL"}))
+    assert not controller.is_quarantined(str(path))
+    assert controller.errors["RPCError"] == 2
+
+    for _ in range(2):
+        record_quote_error(path, ValueError("could not decode the response"))
+    assert controller.is_quarantined(str(path))
+
+
+def test_decodes_reserves_states_and_quotes_of_a_simulated_node(market, network):
+    Data.pricing_contracts = {dex_name: SimpleNamespace(
+        address=market.get_address("quoter", dex_name))
+        for dex_name in market.dex_names}
+    market.mine()
+    block = market.head
+    v2_paths = Path.get_all_v2_paths()
+    v3_paths = Path.get_all_v3_paths()
+    addresses = {name: pool.address for name, pool in market.pool_names.items()}
+
+    async def scenario():
+        node = SimulatedNode(market, block_time=3600)
+        await node.start(port=0)
+        Data.rpc_pool = ProviderPool([node.url])
+        try:
+            reserves = await ReserveReader(v2_paths, addresses).fetch(block.number)
+            states = await StateReader(v3_paths, addresses).fetch(block.number)
+            quotes = await QuoteTemplates().quote(v3_paths, [100] * len(v3_paths),
+                                                  block_identifier=block.number)
+        finally:
+            await Data.rpc_pool.close()
+            await node.stop()
+        return reserves, states, quotes
+
+    reserves, states, quotes = asyncio.run(scenario())
+
+    for path in v2_paths:
+        reserve0, reserve1 = block.states[addresses[str(path)]]
+        assert reserves[path] == ((reserve0, reserve1) if path.zero_for_one
+                                  else (reserve1, reserve0))
+    for path, quote in zip(v3_paths, quotes):
+        reserve0, reserve1 = block.states[addresses[str(path)]]
+        assert states[path] == (get_sqrt_price(reserve0, reserve1),
+                                math.isqrt(reserve0 * reserve1))
+        reserve_in, reserve_out = (reserve0, reserve1) if path.zero_for_one \
+            else (reserve1, reserve0)
+        amount_in = int(path.from_token.get_relative_price(100)) * 997 // 1000
+        amount_out = reserve_out * amount_in // (reserve_in + amount_in)
+        assert quote == path.to_token.recover_original_price(amount_out)
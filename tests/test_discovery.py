@@ -0,0 +1,164 @@
+"""
+Scans factory creation logs from a fixture, served by a stand-in node
+which refuses wide block ranges and can drop the connection. The logs
+are in the format eth_getLogs answers, for a few mainnet pools.
+"""
+import asyncio
+import json
+import os
+import pytest
+from models.data import Data
+from helpers import discovery
+from helpers.discovery import (decode_creation_log, get_discovery_files,
+                               load_cursor, load_discovered_pools,
+                               scan_factories)
+from helpers.rpc import RPCError
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures",
+                       "creation_logs.json")
+V2_FACTORY = "0x5C69bEe701ef814a2B6a3EDD4B1652CB9cc5aA6f"
+V3_FACTORY = "0x1F98431c8aD98523631AE4a59f267346ea31F984"
+
+
+class LogNode:
+    """
+    Answers eth_getLogs from the fixture, refusing ranges wider than
+    max_range blocks, and drops the connection after fail_after requests.
+    """
+
+    def __init__(self, head: int, max_range: int = None,
+                 fail_after: int = None) -> None:
+        with open(FIXTURE) as file:
+            self.logs = json.load(file)
+        self.head = head
+        self.max_range = max_range
+        self.fail_after = fail_after
+        self.ranges = []
+
+    async def send_request(self, method: str, params: list = None):
+        if method == "eth_blockNumber":
+            return hex(self.head)
+        assert method == "eth_getLogs"
+        log_filter = params[0]
+        start = int(log_filter["fromBlock"], 16)
+        end = int(log_filter["toBlock"], 16)
+        if self.fail_after is not None and len(self.ranges) >= self.fail_after:
+            raise ConnectionError("connection reset")
+        if self.max_range and end - start + 1 > self.max_range:
+            raise RPCError({"code": -32005,
+                            "message": "query returned more than 10000 results"})
+        self.ranges.append((log_filter["address"].lower(), start, end))
+        return [log for log in self.logs
+                if log["address"] == log_filter["address"].lower()
+                and log["topics"][0] == log_filter["topics"][0]
+                and start <= int(log["blockNumber"], 16) <= end]
+
+
+@pytest.fixture
+def factories(network, monkeypatch):
+    """
+    Uniswap v2 and v3, deployed at blocks 10000835 and 12369621.
+    """
+    Data.address_data = {"dex": {
+        "uniswapv2": {"factory_address": V2_FACTORY, "factory_block": 10000835},
+        "uniswapv3": {"factory_address": V3_FACTORY, "factory_block": 12369621}},
+        "token": {}}
+
+    def serve(node: LogNode) -> LogNode:
+        monkeypatch.setattr(discovery, "send_request", node.send_request)
+        return node
+
+    return serve
+
+
+def test_decodes_pair_and_pool_creations():
+    with open(FIXTURE) as file:
+        logs = json.load(file)
+
+    pair = decode_creation_log("uniswapv2", logs[0])
+    pool = decode_creation_log("uniswapv3", logs[3])
+
+    assert pair == {"dex": "uniswapv2",
+                    "token0": "0xA0b86991c6218b36c1d19D4a2e9Eb0cE3606eB48",
+                    "token1": "0xC02aaA39b223FE8D0A0e5C4F27eAD9083C756Cc2",
+                    "block": 10008355,
+                    "pool": "0xB4e16d0168e52d35CaCD2c6185b44281Ec28C9Dc"}
+    assert pool["pool"] == "0x88e6A0c2dDD26FEEb64F039a2c41296FcB3f5640"
+    assert pool["fee"] == 500
+
+
+def test_splits_the_ranges_a_node_refuses(factories):
+    node = factories(LogNode(head=12400000, max_range=3000))
+
+    asyncio.run(scan_factories())
+
+    pools = load_discovered_pools()
+    assert len(pools) == 6
+    assert load_cursor() == {"uniswapv2": 12400000 - discovery.CONFIRMATIONS,
+                             "uniswapv3": 12400000 - discovery.CONFIRMATIONS}
+    assert all(end - start < 3000 for _, start, end in node.ranges)
+    # Each factory is scanned from its deployment block, with no gap.
+    for factory, deployment_block in [(V2_FACTORY, 10000835),
+                                      (V3_FACTORY, 12369621)]:
+        ranges = sorted((start, end) for address, start, end in node.ranges
+                        if address == factory.lower())
+        assert ranges[0][0] == deployment_block
+        assert all(next_start == end + 1 for (_, end), (next_start, _)
+                   in zip(ranges, ranges[1:]))
+
+
+def test_resumes_from_the_cursor(factories):
+    node = factories(LogNode(head=10100000, fail_after=3))
+    Data.address_data["dex"].pop("uniswapv3")
+    with pytest.raises(ConnectionError):
+        asyncio.run(scan_factories())
+    cursor = load_cursor()["uniswapv2"]
+    assert [end for _, _, end in node.ranges][-1] == cursor
+
+    node = factories(LogNode(head=10100000))
+    asyncio.run(scan_factories())
+
+    assert node.ranges[0][1] == cursor + 1
+    assert sorted(pool["block"] for pool in load_discovered_pools()) == \
+        [10008355, 10042267, 10093341]
+
+
+def test_drops_a_chunk_appended_again_after_a_crash(factories, monkeypatch):
+    node = factories(LogNode(head=10100000))
+    Data.address_data["dex"].pop("uniswapv3")
+    save_cursor = discovery.save_cursor
+    saves = []
+
+    def crash_once(cursor):
+        saves.append(cursor)
+        if len(saves) == 1:
+            raise KeyboardInterrupt
+        save_cursor(cursor)
+
+    monkeypatch.setattr(discovery, "save_cursor", crash_once)
+    with pytest.raises(KeyboardInterrupt):
+        asyncio.run(scan_factories())
+    asyncio.run(scan_factories())
+
+    pools_file, _ = get_discovery_files()
+    with open(pools_file) as file:
+        lines = [line for line in file if line.strip()]
+    pools = load_discovered_pools()
+    # The first chunk held a pair and was appended twice.
+    assert len(lines) == 4
+    assert sorted(pool["block"] for pool in pools) == [10008355, 10042267, 10093341]
+    assert node.ranges[1][1:] == node.ranges[0][1:]
+
+
+def test_needs_a_start_block_for_a_factory_without_one(factories):
+    node = factories(LogNode(head=10100000))
+    Data.address_data["dex"]["uniswapv2"].pop("factory_block")
+    Data.address_data["dex"].pop("uniswapv3")
+
+    with pytest.raises(ValueError):
+        asyncio.run(scan_factories())
+    assert node.ranges == []
+
+    asyncio.run(scan_factories(start_block=10090000))
+    assert node.ranges[0][1] == 10090000
+    assert [pool["block"] for pool in load_discovered_pools()] == [10093341]
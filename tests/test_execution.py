@@ -0,0 +1,143 @@
+"""
+Runs the Executor end to end on brownie's development chain against mock
+UniswapV2 pairs, factories and routers:
+
+    brownie test tests/test_execution.py
+"""
+import asyncio
+import pytest
+from models.data import Data, create_namespace, current_namespace
+from models.market import Path
+from helpers.execution import Executor
+
+DEPTH = 10**24
+# USD, PAY is at one USD so this is DEPTH // 1000 of it.
+AMOUNT_IN = 1000
+
+
+@pytest.fixture(autouse=True)
+def isolation(fn_isolation):
+    pass
+
+
+@pytest.fixture
+def owner(accounts):
+    return accounts[0]
+
+
+@pytest.fixture
+def tokens(owner, MockERC20):
+    pay = MockERC20.deploy("Pay", "PAY", {"from": owner})
+    swap = MockERC20.deploy("Swap", "SWAP", {"from": owner})
+    for token in (pay, swap):
+        token.mint(owner, 10 * DEPTH, {"from": owner})
+    return pay, swap
+
+
+@pytest.fixture
+def namespace(tokens, tmp_path):
+    """
+    A fresh namespace of Data with PAY and SWAP at one USD.
+    """
+    context_token = current_namespace.set(create_namespace(assets_folder=str(tmp_path)))
+    Data.address_data = {
+        "dex": {},
+        "token": {contract.symbol(): {"address": contract.address.lower(),
+                                      "relative_price": 1,
+                                      "decimals": 18}
+                  for contract in tokens}}
+    yield Data
+    current_namespace.reset(context_token)
+
+
+def deploy_dex(owner, tokens, reserves, MockUniswapV2Factory,
+               MockUniswapV2Router, MockUniswapV2Pair):
+    """
+    Deploys a factory and a router with one pair holding the given
+    reserves of (pay, swap).
+    """
+    factory = MockUniswapV2Factory.deploy({"from": owner})
+    router = MockUniswapV2Router.deploy(factory, {"from": owner})
+    factory.createPair(*tokens, {"from": owner})
+    pair = MockUniswapV2Pair.at(factory.getPair(*tokens))
+    for token, reserve in zip(tokens, reserves):
+        token.transfer(pair, reserve, {"from": owner})
+    pair.sync({"from": owner})
+    return factory, router
+
+
+@pytest.fixture
+def dexes(owner, tokens, namespace, MockUniswapV2Factory, MockUniswapV2Router,
+          MockUniswapV2Pair):
+    """
+    Deploys a source and a target dex, returns the line which buys SWAP on
+    the source dex and sells it on the target dex.
+    """
+    def deploy(source_reserves, target_reserves):
+        for dex_name, reserves in [("sourcev2", source_reserves),
+                                   ("targetv2", target_reserves)]:
+            factory, router = deploy_dex(owner, tokens, reserves,
+                                         MockUniswapV2Factory,
+                                         MockUniswapV2Router, MockUniswapV2Pair)
+            Data.pricing_contracts[dex_name] = router
+            Data.factories["F" + dex_name] = factory
+        return (Path.get_path_from_name("sourcev2", "PAY", "SWAP"),
+                Path.get_path_from_name("targetv2", "SWAP", "PAY"))
+    Data.pricing_contracts = {}
+    Data.factories = {}
+    return deploy
+
+
+@pytest.fixture
+def executor(owner, UniswapV2BasedDexArb):
+    contract = UniswapV2BasedDexArb.deploy({"from": owner})
+    return Executor(owner, contract.address, 10**9, 10**6)
+
+
+def execute_line(executor, web3, line) -> str:
+    asyncio.run(executor.refresh(web3.eth.block_number))
+    return asyncio.run(executor.execute_line(*line, AMOUNT_IN))
+
+
+def test_executes_profitable_line(owner, web3, tokens, dexes, executor):
+    # SWAP is cheap on the source dex and dear on the target dex.
+    deployed = dexes((DEPTH, DEPTH * 11 // 10), (DEPTH * 11 // 10, DEPTH))
+    balance = tokens[0].balanceOf(owner)
+    nonce = owner.nonce
+
+    tx_hash = execute_line(executor, web3, deployed)
+
+    assert tx_hash
+    assert web3.eth.get_transaction_receipt(tx_hash)["status"] == 1
+    assert tokens[0].balanceOf(owner) > balance
+    assert executor.nonce == nonce + 1
+    assert executor.latencies[-1]["tx_hash"] == tx_hash
+
+
+def test_skips_line_failing_simulation(owner, web3, tokens, dexes, executor):
+    deployed = dexes((DEPTH, DEPTH), (DEPTH, DEPTH))
+    nonce = owner.nonce
+
+    assert execute_line(executor, web3, deployed) is None
+    assert owner.nonce == nonce
+    assert executor.nonce == nonce
+
+
+def test_skips_stale_block(owner, web3, chain, tokens, dexes, executor):
+    deployed = dexes((DEPTH, DEPTH * 11 // 10), (DEPTH * 11 // 10, DEPTH))
+    asyncio.run(executor.refresh(web3.eth.block_number))
+    chain.mine()
+
+    assert asyncio.run(executor.execute_line(*deployed, AMOUNT_IN)) is None
+
+
+def test_encodes_line_from_paths(tokens, dexes, executor):
+    forward_path, backward_path = dexes((DEPTH, DEPTH), (DEPTH, DEPTH))
+
+    _, arguments = executor.contract.startArbitrage.decode_input(
+        executor.encode_line(forward_path, backward_path, AMOUNT_IN))
+
+    assert arguments == [tokens[0].address, tokens[1].address, DEPTH // 1000,
+                         Data.pricing_contracts["sourcev2"].address,
+                         Data.pricing_contracts["targetv2"].address,
+                         Data.factories["Fsourcev2"].address]
@@ -0,0 +1,35 @@
+"""
+Records reserves into a ReserveHistory across a topology swap.
+"""
+import os
+from types import SimpleNamespace
+from models.market import Path
+from helpers.history import ReserveHistory
+
+
+def get_snapshot(block_number: int, paths: list[Path]) -> SimpleNamespace:
+    return SimpleNamespace(
+        block_number=block_number,
+        get_reserves=lambda path: (block_number, paths.index(path) + 1))
+
+
+def test_resize_keeps_the_history_of_the_kept_paths(network):
+    paths = Path.get_all_v2_paths()
+    name = "test_history_{}".format(os.getpid())
+    history = ReserveHistory.create(name, paths[:3], capacity=4)
+    for block_number in range(1, 4):
+        history.record(get_snapshot(block_number, paths))
+
+    history = history.resize(paths[1:4])
+    history.record(get_snapshot(4, paths))
+    try:
+        assert history.segment.name == name
+        assert history.path_names == [str(path) for path in paths[1:4]]
+        assert history.count == 4
+        assert history.get_window(str(paths[1])) == ([1, 2, 3, 4], [1, 2, 3, 4],
+                                                     [2, 2, 2, 2])
+        assert history.get_window(str(paths[3])) == ([1, 2, 3, 4], [0, 0, 0, 4],
+                                                     [0, 0, 0, 4])
+        assert history.get_volatility(str(paths[3])) == 0
+    finally:
+        history.close()
@@ -0,0 +1,150 @@
+"""
+Checks and executes triangles through MultiHopArb on brownie's development
+chain, over a triangle of mock UniswapV2 pairs:
+
+    brownie test tests/test_multihop.py
+"""
+import asyncio
+import brownie
+import pytest
+from models.data import Data, create_namespace, current_namespace
+from models.market import Path
+from helpers.execution import Executor
+from helpers.multihop import check_routes, encode_route
+
+DEPTH = 10**24
+TOKEN_NAMES = ["A", "B", "C"]
+
+
+@pytest.fixture(autouse=True)
+def isolation(fn_isolation):
+    pass
+
+
+@pytest.fixture
+def owner(accounts):
+    return accounts[0]
+
+
+@pytest.fixture
+def tokens(owner, MockERC20):
+    tokens = [MockERC20.deploy(name, name, {"from": owner})
+              for name in TOKEN_NAMES]
+    for token in tokens:
+        token.mint(owner, 10 * DEPTH, {"from": owner})
+    return tokens
+
+
+@pytest.fixture
+def paths(owner, tokens, tmp_path, MockUniswapV2Factory, MockUniswapV2Pair):
+    """
+    The paths of one v2 dex whose A B pair is off by 10%, so A B C A
+    returns more A than it takes, in a fresh namespace of Data.
+    """
+    factory = MockUniswapV2Factory.deploy({"from": owner})
+    pairs = {}
+    for (i, j), reserves in [((0, 1), (DEPTH, DEPTH * 11 // 10)),
+                             ((1, 2), (DEPTH, DEPTH)),
+                             ((2, 0), (DEPTH, DEPTH))]:
+        factory.createPair(tokens[i], tokens[j], {"from": owner})
+        pair = MockUniswapV2Pair.at(factory.getPair(tokens[i], tokens[j]))
+        for token, reserve in zip((tokens[i], tokens[j]), reserves):
+            token.transfer(pair, reserve, {"from": owner})
+        pair.sync({"from": owner})
+        pairs[i, j] = pairs[j, i] = pair
+
+    namespace = current_namespace.set(create_namespace(assets_folder=str(tmp_path)))
+    Data.address_data = {
+        "dex": {"mockv2": {}},
+        "token": {name: {"address": contract.address.lower(),
+                         "relative_price": 1,
+                         "decimals": 18}
+                  for name, contract in zip(TOKEN_NAMES, tokens)}}
+    Data.pricing_contracts = {"mockv2": None}
+    Data.factories = {"Fmockv2": None}
+    Data.pairs = {"mockv2 {} {}".format(TOKEN_NAMES[i], TOKEN_NAMES[j]): pair
+                  for (i, j), pair in pairs.items()}
+    yield {(TOKEN_NAMES[i], TOKEN_NAMES[j]): Path.get_path_from_name(
+        "mockv2", TOKEN_NAMES[i], TOKEN_NAMES[j]) for i, j in pairs}
+    current_namespace.reset(namespace)
+
+
+@pytest.fixture
+def multihop(owner, MultiHopArb):
+    # The routes are v2 only, the quoter is never called.
+    return MultiHopArb.deploy(owner, {"from": owner})
+
+
+def get_amount_out(amount_in: int, reserve_in: int, reserve_out: int) -> int:
+    amount_in_with_fee = amount_in * 997
+    return amount_in_with_fee * reserve_out // (reserve_in * 1000 + amount_in_with_fee)
+
+
+def get_route_profit(route: list[Path], amount_in: int) -> int:
+    """
+    The profit of a route in the smallest unit of its start token, off
+    chain from the reserves of the pairs.
+    """
+    amount = amount_in
+    for path in route:
+        reserve0, reserve1, _ = Data.pairs[str(path)].getReserves()
+        amount = get_amount_out(amount, reserve0, reserve1) if path.zero_for_one \
+            else get_amount_out(amount, reserve1, reserve0)
+    return amount - amount_in
+
+
+def test_check_many_prices_every_route(paths, multihop):
+    routes = [[paths["A", "B"], paths["B", "C"], paths["C", "A"]],
+              [paths["A", "C"], paths["C", "B"], paths["B", "A"]],
+              [paths["B", "C"], paths["C", "A"], paths["A", "B"]],
+              [paths["A", "B"], paths["B", "A"]]]
+
+    profits = asyncio.run(check_routes(multihop, routes, [1000] * len(routes)))
+
+    assert profits[0] > 0 and profits[2] > 0
+    assert profits[1] < 0 and profits[3] < 0
+    for route, profit in zip(routes, profits):
+        assert profit == pytest.approx(get_route_profit(route, 1000 * 10**18) / 10**18)
+
+
+def test_check_many_marks_reverting_routes(paths, multihop, tokens):
+    routes = [[paths["A", "B"], paths["B", "C"], paths["C", "A"]],
+              [paths["A", "B"], paths["B", "A"]]]
+    # getReserves reverts on a token, and with it the check of the second
+    # route, the first one is checked on its own.
+    Data.pairs["mockv2 B A"] = tokens[2]
+
+    profits = asyncio.run(check_routes(multihop, routes, [1000, 1000]))
+
+    assert profits[0] > 0
+    assert profits[1] == float("-inf")
+
+
+def test_encode_route_trades_the_contract_balance(owner, paths, multihop, tokens):
+    route = [paths["A", "B"], paths["B", "C"], paths["C", "A"]]
+    tokens[0].transfer(multihop, DEPTH // 100, {"from": owner})
+    balance = tokens[0].balanceOf(multihop)
+    expected = get_route_profit(route, 1000 * 10**18)
+
+    owner.transfer(multihop, 0, data=encode_route(multihop, route, 1000))
+
+    assert tokens[0].balanceOf(multihop) == balance + expected
+
+
+def test_executes_funded_rotations_only(owner, web3, paths, multihop, tokens,
+                                        UniswapV2BasedDexArb):
+    tokens[0].transfer(multihop, DEPTH // 100, {"from": owner})
+    # B is not held by the contract, the rotation from B can only revert.
+    with brownie.reverts():
+        owner.transfer(multihop, 0, data=encode_route(
+            multihop, [paths["B", "C"], paths["C", "A"], paths["A", "B"]], 1000))
+    arbitrage = UniswapV2BasedDexArb.deploy({"from": owner})
+    executor = Executor(owner, arbitrage.address, 10**9, 10**6,
+                        multihop.address, ["A"])
+    asyncio.run(executor.refresh(web3.eth.block_number))
+
+    assert asyncio.run(executor.execute_triangle(
+        paths["B", "C"], paths["C", "A"], paths["A", "B"], 1000)) is None
+    tx_hash = asyncio.run(executor.execute_triangle(
+        paths["A", "B"], paths["B", "C"], paths["C", "A"], 1000))
+    assert web3.eth.get_transaction_receipt(tx_hash)["status"] == 1
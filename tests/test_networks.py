@@ -0,0 +1,42 @@
+"""
+Runs two networks side by side against a SimulatedNode each.
+"""
+import asyncio
+from helpers.networks import run_networks
+from helpers.rpc import ProviderPool
+from helpers.simulation import SimulatedMarket, SimulatedNode
+
+
+def test_a_failing_network_stops_alone():
+    markets = {"good": SimulatedMarket(token_count=4, seed=1),
+               "bad": SimulatedMarket(token_count=4, seed=2)}
+    heads = {"good": [], "bad": []}
+
+    async def run_network(network_name, primary, session):
+        pool = ProviderPool([nodes[network_name].url], session=session)
+        for _ in range(5):
+            heads[network_name].append(
+                int(await pool.request("eth_blockNumber"), 16))
+            if network_name == "bad":
+                raise ValueError("broken network")
+            markets[network_name].mine()
+            await asyncio.sleep(0.01)
+        assert not session.closed
+
+    async def scenario():
+        for node in nodes.values():
+            await node.start(port=0)
+        try:
+            return await run_networks(["good", "bad"], run_network)
+        finally:
+            for node in nodes.values():
+                await node.stop()
+
+    nodes = {network_name: SimulatedNode(market, block_time=3600)
+             for network_name, market in markets.items()}
+    failures = asyncio.run(scenario())
+
+    assert list(failures) == ["bad"]
+    assert isinstance(failures["bad"], ValueError)
+    assert heads == {"good": [0, 1, 2, 3, 4], "bad": [0]}
+    assert all(node.metrics for node in nodes.values())
@@ -0,0 +1,98 @@
+"""
+Drives the ProviderPool against SimulatedNodes on local ports: a slow
+one, a lagging one and a failing one.
+"""
+import asyncio
+from helpers.rpc import ProviderPool
+from helpers.simulation import SimulatedMarket, SimulatedNode
+
+
+async def start_node(market: SimulatedMarket, **kwargs) -> SimulatedNode:
+    node = SimulatedNode(market, block_time=3600, **kwargs)
+    await node.start(port=0)
+    return node
+
+
+def test_a_slow_node_loses_its_rank_once_hedged():
+    async def scenario():
+        market = SimulatedMarket(token_count=4)
+        slow = await start_node(market, latency=0.5)
+        fast = await start_node(market)
+        pool = ProviderPool([slow.url, fast.url], default_hedge_delay=0.05)
+        try:
+            for _ in range(30):
+                assert await pool.request("eth_blockNumber") == hex(market.head.number)
+
+            slow_endpoint, fast_endpoint = pool.endpoints
+            # The cancelled requests recorded how long they had waited.
+            assert slow_endpoint.get_mean_latency() >= 0.05
+            assert pool.get_ranked_endpoints()[0] is fast_endpoint
+            # A hedge still fires when the fast node beats its own p95.
+            assert pool.hedged_requests < 10
+            assert fast.metrics["eth_blockNumber"] == 30
+        finally:
+            await pool.close()
+            await slow.stop()
+            await fast.stop()
+
+    asyncio.run(scenario())
+
+
+def test_lagging_nodes_leave_the_rotation():
+    async def scenario():
+        market = SimulatedMarket(token_count=4, seed=1)
+        lagging_market = SimulatedMarket(token_count=4, seed=1)
+        for _ in range(5):
+            market.mine()
+        lagging_market.mine()
+        lagging = await start_node(lagging_market)
+        synced = await start_node(market, latency=0.02)
+        pool = ProviderPool([lagging.url, synced.url], max_head_lag=2,
+                            default_hedge_delay=1)
+        try:
+            assert await pool.update_heads() == 5
+            lagging_endpoint, synced_endpoint = pool.endpoints
+            assert lagging_endpoint.lagging and not synced_endpoint.lagging
+            # The lagging node is faster, it is left out all the same.
+            assert lagging_endpoint.get_mean_latency() < \
+                synced_endpoint.get_mean_latency()
+            assert pool.get_ranked_endpoints()[0] is synced_endpoint
+            for _ in range(5):
+                assert await pool.request("eth_blockNumber") == hex(5)
+            assert lagging.metrics["eth_blockNumber"] == 1
+
+            for _ in range(5):
+                lagging_market.mine()
+            await pool.update_heads()
+            assert not lagging_endpoint.lagging
+        finally:
+            await pool.close()
+            await lagging.stop()
+            await synced.stop()
+
+    asyncio.run(scenario())
+
+
+def test_fails_over_to_the_next_node():
+    async def scenario():
+        market = SimulatedMarket(token_count=4)
+        failing = await start_node(market, error_rate=1)
+        healthy = await start_node(market, latency=0.01)
+        pool = ProviderPool([failing.url, healthy.url], max_failures=3,
+                            default_hedge_delay=1)
+        try:
+            for _ in range(5):
+                assert await pool.request("eth_chainId") == hex(market.chain_id)
+
+            failing_endpoint, healthy_endpoint = pool.endpoints
+            # The failing node is dropped after max_failures.
+            assert failing.metrics["failed_posts"] == 3
+            assert failing_endpoint.failures == 3
+            assert pool.get_ranked_endpoints()[0] is healthy_endpoint
+            assert healthy.metrics["eth_chainId"] == 5
+        finally:
+            await pool.close()
+            await failing.stop()
+            await healthy.stop()
+
+    asyncio.run(scenario())
@@ -0,0 +1,77 @@
+"""
+Snapshots are handed to worker processes, so they have to survive pickle
+with their interned paths.
+"""
+import pickle
+from models.data import Data, create_namespace, current_namespace
+from models.market import Path
+from helpers.paths import load_healthy_loops, load_healthy_triangles
+from helpers.snapshot import MarketSnapshot, merge
+
+
+def get_snapshot(market) -> MarketSnapshot:
+    states = {path: market.head.states[market.pool_names[str(path)].address]
+              for path in Path.get_all_v2_paths() + Path.get_all_v3_paths()}
+    return MarketSnapshot.create(
+        market.head.number, market.head.hash,
+        {path: state for path, state in states.items() if not path.is_v3},
+        {path: state for path, state in states.items() if path.is_v3},
+        load_healthy_loops(), load_healthy_triangles())
+
+
+def test_paths_unpickle_as_the_interned_ones(network):
+    path = Path.get_all_v2_paths()[0]
+
+    assert pickle.loads(pickle.dumps(path)) is path
+    assert pickle.loads(pickle.dumps(path.dex)) is path.dex
+    assert pickle.loads(pickle.dumps(path.from_token)) is path.from_token
+
+
+def test_a_layered_snapshot_survives_pickle(market, network):
+    snapshot = get_snapshot(market)
+    path = next(iter(snapshot.reserves))
+    snapshot = snapshot.evolve(snapshot.block_number + 1, "0x01",
+                               {path: (1, 2)}, {})
+    assert len(snapshot.reserves.layers) == 2
+
+    loaded = pickle.loads(pickle.dumps(snapshot))
+
+    assert loaded.block_number == snapshot.block_number
+    assert dict(loaded.reserves) == dict(snapshot.reserves)
+    assert dict(loaded.v3_states) == dict(snapshot.v3_states)
+    assert dict(loaded.liquidity) == dict(snapshot.liquidity)
+    assert loaded.lines == snapshot.lines
+    assert loaded.triangles == snapshot.triangles
+    assert loaded.reserves[path] == (1, 2)
+    assert all(loaded_path is path for loaded_path, path
+               in zip(loaded.reserves, snapshot.reserves))
+
+
+def test_a_snapshot_loads_into_another_network_namespace(market, network):
+    payload = pickle.dumps(get_snapshot(market))
+    address_data = Data.address_data
+    token = current_namespace.set(create_namespace())
+    try:
+        Data.address_data = address_data
+        Data.pricing_contracts = dict.fromkeys(market.dex_names)
+        Data.factories = {"F" + dex_name: None for dex_name in market.dex_names}
+
+        loaded = pickle.loads(payload)
+
+        path = next(iter(loaded.reserves))
+        assert Data.paths[(path.dex.name, path.from_token.name,
+                           path.to_token.name)] is path
+    finally:
+        current_namespace.reset(token)
+
+
+def test_merge_layers_and_compacts(network):
+    paths = Path.get_all_v2_paths()
+    mapping = MarketSnapshot.create(0, "0x00", {path: (1, 1) for path in paths},
+                                    {}).reserves
+    for i in range(4):
+        mapping = merge(mapping, {paths[i]: (i, i)}, max_layers=3,
+                        compact_share=1)
+    assert len(mapping.layers) <= 3
+    assert dict(mapping) == {path: (i, i) if i < 4 else (1, 1)
+                             for i, path in enumerate(paths)}
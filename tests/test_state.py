@@ -0,0 +1,159 @@
+"""
+Drives the StateManager against a SimulatedNode through the provider
+pool, blocks are mined by hand.
+"""
+import asyncio
+from types import SimpleNamespace
+import pytest
+from models.data import Data
+from models.market import Path
+from helpers import state
+from helpers.blocks import Head
+from helpers.rpc import ProviderPool, RPCError
+from helpers.simulation import SimulatedNode
+from helpers.state import StateManager, fetch_all_states
+
+
+def get_head(block) -> Head:
+    return Head(block.number, block.hash, block.parent_hash)
+
+
+def get_changed_paths(market, blocks) -> set[Path]:
+    addresses = {address for block in blocks for address in block.changes}
+    return {path for path in Path.get_all_v2_paths() + Path.get_all_v3_paths()
+            if market.pool_names[str(path)].address in addresses}
+
+
+async def start_node(market) -> SimulatedNode:
+    """
+    Serves the market, mining only when the test does, and points the
+    network at it.
+    """
+    node = SimulatedNode(market, block_time=3600)
+    await node.start(port=0)
+    Data.rpc_pool = ProviderPool([node.url])
+    Data.pairs = {name: SimpleNamespace(address=pool.address)
+                  for name, pool in market.pool_names.items() if not pool.is_v3}
+    Data.pools = {name: SimpleNamespace(address=pool.address)
+                  for name, pool in market.pool_names.items() if pool.is_v3}
+    return node
+
+
+async def stop_node(node: SimulatedNode) -> None:
+    await Data.rpc_pool.close()
+    await node.stop()
+
+
+async def restore(market) -> StateManager:
+    """
+    A manager restored at the current head, as from a checkpoint.
+    """
+    reserves, v3_states = await fetch_all_states(get_head(market.head))
+    manager = StateManager()
+    manager.restore(market.head.number, market.head.hash,
+                    market.head.parent_hash, reserves, v3_states, set())
+    return manager
+
+
+def test_catches_up_on_the_touched_paths_only(market, network, monkeypatch):
+    monkeypatch.setattr(state, "LOG_ADDRESSES", 5)
+
+    async def scenario():
+        node = await start_node(market)
+        try:
+            manager = await restore(market)
+            blocks = [block for _ in range(3) for block in market.mine()]
+            head = get_head(market.head)
+
+            changed = await manager.update(head)
+
+            assert changed == get_changed_paths(market, blocks)
+            assert 0 < len(changed) < len(Path.get_all_v2_paths() +
+                                          Path.get_all_v3_paths())
+            reserves, v3_states = await fetch_all_states(head)
+            assert dict(manager.snapshot.reserves) == reserves
+            assert dict(manager.snapshot.v3_states) == v3_states
+            # Every log filter names at most LOG_ADDRESSES addresses.
+            assert node.metrics["eth_getLogs"] == -(-len(market.pools) // 5)
+        finally:
+            await stop_node(node)
+
+    asyncio.run(scenario())
+
+
+def test_reloads_when_the_logs_cannot_be_read(market, network):
+    async def fail(first_block, last_block, addresses):
+        raise RPCError({"code": -32005, "message": "query returned more than "
+                        "10000 results"})
+
+    async def scenario():
+        node = await start_node(market)
+        try:
+            manager = await restore(market)
+            manager.get_range_touched_addresses = fail
+            market.mine()
+            head = get_head(market.head)
+
+            changed = await manager.update(head)
+
+            assert changed == set(Path.get_all_v2_paths() + Path.get_all_v3_paths())
+            assert manager.catch_up_paths is None
+            assert [block.hash for block in manager.chain] == [head.hash]
+            reserves, _ = await fetch_all_states(head)
+            assert dict(manager.snapshot.reserves) == reserves
+        finally:
+            await stop_node(node)
+
+    asyncio.run(scenario())
+
+
+@pytest.mark.parametrize("market", [{"script": [{"block": 4, "reorg": 2}]}],
+                         indirect=True)
+def test_rolls_back_to_the_common_ancestor_on_a_reorg(market, network):
+    async def scenario():
+        node = await start_node(market)
+        try:
+            manager = StateManager()
+            read_paths = []
+
+            async def fetch_path_states(paths, head):
+                read_paths.append(set(paths))
+                return await state.fetch_path_states(paths, head)
+
+            manager.fetch_path_states = fetch_path_states
+            await manager.update(get_head(market.head))
+            old_blocks = []
+            for _ in range(3):
+                [block] = market.mine()
+                old_blocks.append(block)
+                await manager.update(get_head(block))
+                assert manager.add_opportunities(block.hash, [block.number])
+            ancestor, orphaned = old_blocks[0], old_blocks[1:]
+
+            new_blocks = market.mine()
+            head = get_head(market.head)
+            assert [block.number for block in new_blocks] == [2, 3, 4]
+            assert new_blocks[0].parent_hash == ancestor.hash
+
+            changed = await manager.update(head)
+
+            assert [block.hash for block in manager.chain[-2:]] == \
+                [ancestor.hash, head.hash]
+            # Only what the orphaned and the new blocks touched is read.
+            touched = get_changed_paths(market, orphaned + new_blocks)
+            assert read_paths == [touched]
+            assert changed >= touched
+            reserves, v3_states = await fetch_all_states(head)
+            assert dict(manager.snapshot.reserves) == reserves
+            assert dict(manager.snapshot.v3_states) == v3_states
+            # The opportunities of the orphaned blocks are invalidated.
+            assert manager.reorgs == 1
+            assert manager.invalidated == 2
+            assert not any(manager.is_canonical(block.hash) for block in orphaned)
+            assert not manager.add_opportunities(orphaned[-1].hash, [3])
+            assert manager.add_opportunities(head.hash, [4])
+            assert manager.opportunities == {ancestor.hash: [1], head.hash: [4]}
+        finally:
+            await stop_node(node)
+
+    asyncio.run(scenario())